@@ -45,6 +45,7 @@ INSTALLED_APPS = (
 )
 
 MIDDLEWARE_CLASSES = (
+    'rss.middleware.QueryProfilingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -89,6 +90,19 @@ DATABASES = {
 if not DEBUG:
     DATABASES['default'] = dj_database_url.config()
 
+# Cache
+# https://docs.djangoproject.com/en/1.8/topics/cache/
+# API responses are cached here and the worker, running in its own process, invalidates them through it. The backend
+# must be shared by every process (e.g. CACHE_BACKEND=django.core.cache.backends.memcached.MemcachedCache,
+# CACHE_LOCATION=host:port), the rss.E001 check refuses LocMemCache. Caching is off until one is configured.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.dummy.DummyCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+
 # Internationalization
 # https://docs.djangoproject.com/en/1.8/topics/i18n/
 
@@ -118,6 +132,69 @@ STATICFILES_DIRS = (
 STATICFILES_STORAGE = 'whitenoise.django.GzipManifestStaticFilesStorage'
 
 
+# RSS API
+# Default and maximum number of articles per page of the article list endpoints.
+RSS_PAGE_SIZE = int(os.environ.get('RSS_PAGE_SIZE', 50))
+RSS_MAX_PAGE_SIZE = int(os.environ.get('RSS_MAX_PAGE_SIZE', 500))
+# Articles read from the database at a time when streaming a list with ?stream=1.
+RSS_STREAM_BATCH_SIZE = int(os.environ.get('RSS_STREAM_BATCH_SIZE', 500))
+# Cache alias and timeout, in seconds, of the API responses.
+RSS_CACHE_ALIAS = 'default'
+RSS_CACHE_TIMEOUT = int(os.environ.get('RSS_CACHE_TIMEOUT', 600))
+# Opt-in profiling of the API requests: query count, SQL and serialization time in the X-Query-Count and
+# Server-Timing response headers, and a JSON log line for RSS_PROFILING_SAMPLE_RATE of the requests.
+RSS_PROFILING = os.environ.get('RSS_PROFILING', '').lower() in ('1', 'true')
+RSS_PROFILING_PATH = os.environ.get('RSS_PROFILING_PATH', '/rss/')
+RSS_PROFILING_SAMPLE_RATE = float(os.environ.get('RSS_PROFILING_SAMPLE_RATE', 0.01))
+# Limits of the feed download validating an outlet added from the admin, in seconds, for every read and for the
+# whole download, and bytes.
+RSS_VALIDATION_TIMEOUT = int(os.environ.get('RSS_VALIDATION_TIMEOUT', 10))
+RSS_VALIDATION_MAX_BYTES = int(os.environ.get('RSS_VALIDATION_MAX_BYTES', 5 * 1024 * 1024))
+# Feeds validated at once when importing an OPML file, in total and per host.
+RSS_IMPORT_POOL_SIZE = int(os.environ.get('RSS_IMPORT_POOL_SIZE', 32))
+RSS_IMPORT_PER_HOST = int(os.environ.get('RSS_IMPORT_PER_HOST', 2))
+# Default window, in days, and number of tags of the trending tags endpoint.
+RSS_TRENDING_DAYS = int(os.environ.get('RSS_TRENDING_DAYS', 7))
+RSS_TRENDING_LIMIT = int(os.environ.get('RSS_TRENDING_LIMIT', 10))
+
+
+# RSS worker
+# Number of threads downloading and parsing feeds concurrently on each pass.
+RSS_WORKER_POOL_SIZE = int(os.environ.get('RSS_WORKER_POOL_SIZE', 8))
+# Processes parsing the downloaded feeds, so parsing is not limited to one core by the GIL. When 0 the fetcher threads
+# parse the feeds themselves. A good value is the number of cores.
+RSS_PARSE_PROCESSES = int(os.environ.get('RSS_PARSE_PROCESSES', 0))
+# Feeds that can wait between the download, parse and database stages before the earlier stages pause.
+RSS_PIPELINE_QUEUE_SIZE = int(os.environ.get('RSS_PIPELINE_QUEUE_SIZE', 16))
+# Bounds, in seconds, of the interval between two checks of an outlet, learned from how often it publishes.
+RSS_MIN_POLL_INTERVAL = int(os.environ.get('RSS_MIN_POLL_INTERVAL', 60))
+RSS_MAX_POLL_INTERVAL = int(os.environ.get('RSS_MAX_POLL_INTERVAL', 6 * 60 * 60))
+# How often, in seconds, the worker reloads outlets to find new ones and "Check now" requests.
+RSS_SCHEDULER_SYNC_INTERVAL = int(os.environ.get('RSS_SCHEDULER_SYNC_INTERVAL', 60))
+# Share the outlets between any number of worker processes through leases in the database. When off the worker
+# schedules outlets in memory and only one worker process may run.
+RSS_WORKER_LEASES = os.environ.get('RSS_WORKER_LEASES', 'true').lower() in ('1', 'true')
+# Outlets a leased worker claims at once, and how long, in seconds, it has to check them before they can be
+# claimed by another worker.
+RSS_LEASE_BATCH_SIZE = int(os.environ.get('RSS_LEASE_BATCH_SIZE', 2 * RSS_WORKER_POOL_SIZE))
+RSS_LEASE_SECONDS = int(os.environ.get('RSS_LEASE_SECONDS', 10 * 60))
+# Longest time, in seconds, a leased worker waits before looking for due outlets again.
+RSS_LEASE_POLL_INTERVAL = int(os.environ.get('RSS_LEASE_POLL_INTERVAL', 15))
+# Entries kept in the worker's in-process tag and author lookup caches.
+RSS_TAG_CACHE_SIZE = int(os.environ.get('RSS_TAG_CACHE_SIZE', 10000))
+RSS_AUTHOR_CACHE_SIZE = int(os.environ.get('RSS_AUTHOR_CACHE_SIZE', 10000))
+# Parse feeds incrementally as their entries are stored and stop at the entries older than the outlet's newest article.
+# Edits to those older entries are then not picked up.
+RSS_STREAMING_PARSER = os.environ.get('RSS_STREAMING_PARSER', '').lower() in ('1', 'true')
+# Feed entries stored per transaction, only a batch of them is held in memory when the streaming parser is on.
+RSS_STORE_BATCH_SIZE = int(os.environ.get('RSS_STORE_BATCH_SIZE', 500))
+# Directory where every fetched feed body is archived, gzip compressed, for replay. Archiving is off when unset.
+RSS_ARCHIVE_DIR = os.environ.get('RSS_ARCHIVE_DIR')
+# Port of the worker's Prometheus metrics endpoint (http://<address>:<port>/metrics), disabled when unset.
+RSS_METRICS_PORT = int(os.environ['RSS_METRICS_PORT']) if os.environ.get('RSS_METRICS_PORT') else None
+RSS_METRICS_ADDRESS = os.environ.get('RSS_METRICS_ADDRESS', '')
+
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': True,
@@ -149,10 +226,6 @@ LOGGING = {
         'rss': {
             'handlers': ['console'],
             'level': 'INFO'
-        },
-        'apscheduler': {
-            'handlers': ['null'],
-            'level': 'INFO'
         }
     }
 }
@@ -1,8 +1,21 @@
-from django.contrib import admin
+import datetime
+import threading
+
+from django.conf import settings
+from django.conf.urls import url
+from django.contrib import admin, messages
 from django import forms
+from django.db import connection
+from django.http import HttpResponseRedirect
+from django.shortcuts import render
+from django.core.urlresolvers import reverse
+from django.utils import timezone
 
-from .feed import RSSFeed
+from . import leasing
+from .feed import RSSFeed, download, parse_document
 from .models import Outlet
+from .opml import import_opml
+from .worker import check_new_outlet
 
 # Register your models here.
 
@@ -14,13 +27,20 @@ class OutletAdminForm(forms.ModelForm):
 
     def clean(self):
         """
-        Fetch information about the outlet before saving
+        Fetch information about the outlet before saving. The whole download must finish within
+        settings.RSS_VALIDATION_TIMEOUT and RSS_VALIDATION_MAX_BYTES, the parsed feed is kept in self.feed for the first
+        check of a new outlet.
         :return:
         """
         rss_url = self.cleaned_data.get('rss_url')
+        if not rss_url:
+            return self.cleaned_data
         try:
-            feed = RSSFeed(rss_url)
-            channel_info = feed.get_channel_info()
+            response = download(rss_url, timeout=settings.RSS_VALIDATION_TIMEOUT,
+                                max_bytes=settings.RSS_VALIDATION_MAX_BYTES,
+                                max_seconds=settings.RSS_VALIDATION_TIMEOUT)
+            self.feed = RSSFeed.from_download(rss_url, response, parse_document(rss_url, response['body']))
+            channel_info = self.feed.get_channel_info()
         except ValueError, e:
             raise forms.ValidationError(e.message)
 
@@ -33,6 +53,10 @@ class OutletAdminForm(forms.ModelForm):
         return self.cleaned_data
 
 
+class ImportOPMLForm(forms.Form):
+    opml = forms.FileField(label='OPML file')
+
+
 class OutletAdmin(admin.ModelAdmin):
     form = OutletAdminForm
     fieldsets = [
@@ -42,8 +66,85 @@ class OutletAdmin(admin.ModelAdmin):
         }),
     ]
     readonly_fields = ['name', 'url', 'description', 'language', 'updated']
-    list_display = ['name', 'url', 'rss_url', 'updated']
+    list_display = ['name', 'url', 'rss_url', 'updated', 'next_check']
     ordering = ['name']
+    actions = ['check_now']
+
+    def check_now(self, request, queryset):
+        """
+        Move the next check of the selected outlets to now, the worker picks them up on its next sync
+        """
+        count = queryset.update(next_check=timezone.now())
+        self.message_user(request, '%s outlet(s) will be checked shortly.' % count)
+
+    check_now.short_description = 'Check now'
+
+    def get_urls(self):
+        return [
+            url(r'^import-opml/$', self.admin_site.admin_view(self.import_opml_view),
+                name='%s_%s_import_opml' % (self.model._meta.app_label, self.model._meta.model_name))
+        ] + super(OutletAdmin, self).get_urls()
+
+    def import_opml_view(self, request):
+        """
+        Create outlets for the feeds of an uploaded OPML file, see rss.opml
+        """
+        if not self.has_add_permission(request):
+            return HttpResponseRedirect(reverse('admin:index'))
+
+        form = ImportOPMLForm(request.POST or None, request.FILES or None)
+        if form.is_valid():
+            try:
+                results = import_opml(form.cleaned_data['opml'].read())
+            except ValueError, e:
+                form.add_error('opml', e.message)
+            else:
+                imported = len([result for result in results if result['outlet'] is not None])
+                self.message_user(request, 'Imported %s of %s feeds.' % (imported, len(results)))
+                for result in results:
+                    if result['error']:
+                        self.message_user(request, '%s: %s' % (result['rss_url'], result['error']), messages.WARNING)
+                return HttpResponseRedirect(reverse('admin:rss_outlet_changelist'))
+
+        context = dict(self.admin_site.each_context(request), opts=self.model._meta, form=form, title='Import OPML')
+        return render(request, 'admin/rss/outlet/import_opml.html', context)
+
+    def save_model(self, request, obj, form, change):
+        """
+        Lease a new outlet to the request so no worker checks it before its first check, see add_view. Its next check
+        is moved past the lease too, for the workers not using leases.
+        """
+        feed = getattr(form, 'feed', None)
+        if not change and feed is not None:
+            obj.lease_owner = 'admin:%s' % leasing.worker_id()
+            obj.lease_expires = timezone.now() + datetime.timedelta(seconds=settings.RSS_LEASE_SECONDS)
+            obj.next_check = obj.lease_expires
+            request.rss_first_check = (obj, feed)
+        super(OutletAdmin, self).save_model(request, obj, form, change)
+
+    def add_view(self, request, form_url='', extra_context=None):
+        """
+        Store the articles of a new outlet from the feed it was validated with, in the background once the outlet is
+        committed, instead of waiting for a worker to download it again
+        """
+        response = super(OutletAdmin, self).add_view(request, form_url, extra_context)
+        first_check = getattr(request, 'rss_first_check', None)
+        if first_check is not None:
+            outlet, feed = first_check
+            thread = threading.Thread(target=_first_check, args=(outlet, feed, outlet.lease_owner),
+                                      name='rss-first-check-%s' % outlet.id)
+            # A daemon thread dies with the process, e.g. on a restart. The lease then expires and a worker checks
+            # the outlet instead.
+            thread.daemon = True
+            thread.start()
+        return response
+
+
+def _first_check(outlet, feed, owner):
+    try:
+        check_new_outlet(outlet, feed, owner)
+    finally:
+        connection.close()
 
 
 admin.site.register(Outlet, OutletAdmin)
\ No newline at end of file
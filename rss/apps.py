@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+from django.core import checks
+
+
+class RSSConfig(AppConfig):
+    name = 'rss'
+    verbose_name = 'RSS'
+
+    def ready(self):
+        from . import signals
+        from .caching import check_shared_cache
+        checks.register(check_shared_cache)
@@ -0,0 +1,96 @@
+"""
+Archive of the raw feed bodies fetched by the worker.
+
+Each body is stored gzip compressed as <root>/<outlet id>/<fetch time>.xml.gz, fetch times in UTC, so the
+archive can be replayed through RSSFeed and check_outlet without hitting the publishers again.
+"""
+import datetime
+import gzip
+import os
+import tempfile
+
+from django.conf import settings
+from django.utils import timezone
+
+TIMESTAMP_FORMAT = '%Y%m%dT%H%M%S.%fZ'
+SUFFIX = '.xml.gz'
+
+
+class FeedArchive(object):
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, outlet_id, fetched_at):
+        filename = fetched_at.astimezone(timezone.utc).strftime(TIMESTAMP_FORMAT) + SUFFIX
+        return os.path.join(self.root, str(outlet_id), filename)
+
+    def store(self, outlet_id, body, fetched_at=None):
+        """
+        Write a feed body, the file only shows up once complete so replay never reads a partial body
+        :return: The path of the archived body
+        """
+        if fetched_at is None:
+            fetched_at = timezone.now()
+        if isinstance(body, unicode):
+            body = body.encode('utf-8')
+
+        path = self.path(outlet_id, fetched_at)
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # Created by another fetcher thread in the meantime
+                if not os.path.isdir(directory):
+                    raise
+
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as temp_file:
+            with gzip.GzipFile(fileobj=temp_file, mode='wb') as compressed:
+                compressed.write(body)
+        os.rename(temp_path, path)
+        return path
+
+    def read(self, path):
+        with gzip.open(path, 'rb') as compressed:
+            return compressed.read()
+
+    def entries(self, outlet_ids=None, since=None, until=None):
+        """
+        :param outlet_ids: Only list the bodies of these outlets
+        :param since: Only list the bodies fetched at or after this datetime
+        :param until: Only list the bodies fetched before this datetime
+        :return: List of (fetch time, outlet id, path) tuples, oldest first
+        """
+        if not os.path.isdir(self.root):
+            return []
+
+        if outlet_ids is not None:
+            outlet_ids = set(int(outlet_id) for outlet_id in outlet_ids)
+
+        entries = []
+        for directory in os.listdir(self.root):
+            if not directory.isdigit() or (outlet_ids is not None and int(directory) not in outlet_ids):
+                continue
+
+            for filename in os.listdir(os.path.join(self.root, directory)):
+                if not filename.endswith(SUFFIX):
+                    continue
+                try:
+                    fetched_at = datetime.datetime.strptime(filename[:-len(SUFFIX)], TIMESTAMP_FORMAT)
+                except ValueError:
+                    continue
+                fetched_at = fetched_at.replace(tzinfo=timezone.utc)
+                if (since is None or fetched_at >= since) and (until is None or fetched_at < until):
+                    entries.append((fetched_at, int(directory), os.path.join(self.root, directory, filename)))
+
+        return sorted(entries)
+
+
+def get_archive():
+    """
+    :return: The FeedArchive at settings.RSS_ARCHIVE_DIR, None when archiving is disabled
+    """
+    if not settings.RSS_ARCHIVE_DIR:
+        return None
+    return FeedArchive(settings.RSS_ARCHIVE_DIR)
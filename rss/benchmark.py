@@ -0,0 +1,101 @@
+"""
+Ingestion benchmarks over synthetic feeds, see rss.synthetic and the benchmark_ingest management command.
+"""
+import platform
+import time
+
+import django
+import feedparser
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import worker
+from .feed import RSSFeed
+from .models import Outlet
+from .streaming import StreamingRSSFeed
+from .synthetic import generate_feed, pass_entry_ids
+
+
+def _rate(count, elapsed):
+    return round(count / elapsed, 2) if elapsed else None
+
+
+def benchmark_parse(document, entry_count, repeat=3, rss=True):
+    """
+    Parse throughput of a feed document, best of repeat runs. feedparser alone and, for RSS documents, RSSFeed and
+    StreamingRSSFeed extracting the entries as the worker does.
+    """
+    results = {'bytes': len(document), 'entries': entry_count, 'repeat': repeat}
+
+    stages = [('feedparser', lambda: feedparser.parse(document))]
+    if rss:
+        stages.append(('rssfeed', lambda: RSSFeed('benchmark', document=document).get_entries_info()))
+        stages.append(('streaming', lambda: StreamingRSSFeed('benchmark', document=document).get_entries_info()))
+
+    for name, parse in stages:
+        best = None
+        for i in range(repeat):
+            started = time.time()
+            parse()
+            elapsed = time.time() - started
+            best = elapsed if best is None else min(best, elapsed)
+        results[name] = {
+            'seconds': round(best, 6),
+            'entries_per_second': _rate(entry_count, best),
+            'megabytes_per_second': _rate(len(document) / 1048576.0, best)
+        }
+    return results
+
+
+def benchmark_ingest(passes, entry_count, overlap, **feed_options):
+    """
+    Run check_outlet over passes synthetic feeds of one outlet, each sharing overlap entries with the previous one.
+    Must run against a scratch database, the outlet and its articles are left behind.
+    :param feed_options: Passed on to generate_feed
+    """
+    worker.clear_caches()
+    outlet = Outlet.objects.create(name='Benchmark Feed', url='http://synthetic.example.org/', rss_url='benchmark')
+
+    results = []
+    for pass_number in range(passes):
+        document = generate_feed(pass_entry_ids(pass_number, entry_count, overlap), **feed_options)
+        feed = RSSFeed(outlet.rss_url, document=document)
+
+        started = time.time()
+        feed.get_entries_info()
+        parsed = time.time()
+        with CaptureQueriesContext(connection) as queries:
+            stored = worker.check_outlet(outlet, feed)
+        finished = time.time()
+
+        results.append({
+            'pass': pass_number,
+            'entries': entry_count,
+            'stored': stored,
+            'parse_seconds': round(parsed - started, 6),
+            'store_seconds': round(finished - parsed, 6),
+            'entries_per_second': _rate(entry_count, finished - started),
+            'queries': len(queries),
+            'queries_per_entry': round(len(queries) / float(entry_count), 4)
+        })
+
+    total_seconds = sum(result['parse_seconds'] + result['store_seconds'] for result in results)
+    total_queries = sum(result['queries'] for result in results)
+    return {
+        'passes': results,
+        'entries_per_second': _rate(passes * entry_count, total_seconds),
+        'queries_per_entry': round(total_queries / float(passes * entry_count), 4),
+        'tag_cache': worker.tag_cache.stats(),
+        'author_cache': worker.author_cache.stats()
+    }
+
+
+def environment():
+    return {
+        'timestamp': timezone.now().isoformat(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'feedparser': feedparser.__version__,
+        'database': connection.vendor
+    }
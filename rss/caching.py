@@ -0,0 +1,115 @@
+"""
+Response cache for the JSON API.
+
+Cached responses are keyed by view, full path and generation counters kept in the cache itself. Views that
+belong to an outlet use the outlet generation, everything else uses the global one. Writes bump the counters
+instead of deleting keys, old responses are never read again and simply expire.
+
+Views under rss.conditional.conditional_response are keyed by the ETag of the request too, so a cached body is only
+ever served with the ETag it was rendered under.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+
+from .encoding import negotiate
+
+GLOBAL_GENERATION = 'rss:generation:global'
+SHARED_GENERATION = 'rss:generation:shared'
+OUTLET_GENERATION = 'rss:generation:outlet:%s'
+
+
+# Backends keeping their entries in the memory of each process, invalidations made by another one never reach them
+PROCESS_LOCAL_BACKENDS = ('django.core.cache.backends.locmem.LocMemCache',)
+
+
+def get_cache():
+    return caches[settings.RSS_CACHE_ALIAS]
+
+
+def check_shared_cache(app_configs=None, **kwargs):
+    """
+    System check refusing a response cache the worker process cannot invalidate
+    """
+    backend = settings.CACHES.get(settings.RSS_CACHE_ALIAS, {}).get('BACKEND')
+    if backend in PROCESS_LOCAL_BACKENDS:
+        return [checks.Error('%s is local to each process, the worker cannot invalidate the API responses it caches.'
+                             % backend,
+                             hint='Use a shared backend such as memcached or the database cache, or DummyCache to '
+                                  'turn response caching off.',
+                             id='rss.E001')]
+    return []
+
+
+def _bump(cache, key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Unknown or evicted counter, start from a value older responses cannot have used
+        cache.set(key, int(time.time() * 1000), None)
+
+
+def invalidate(outlet_id=None):
+    """
+    Expire the responses of every view listing data across outlets and, if given, of the outlet views
+    """
+    cache = get_cache()
+    _bump(cache, GLOBAL_GENERATION)
+    if outlet_id is not None:
+        _bump(cache, OUTLET_GENERATION % outlet_id)
+
+
+def invalidate_all():
+    """
+    Expire every cached response, used when shared data such as tag terms changes
+    """
+    cache = get_cache()
+    _bump(cache, GLOBAL_GENERATION)
+    _bump(cache, SHARED_GENERATION)
+
+
+def _generations(cache, keys):
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            cache.add(key, int(time.time() * 1000), None)
+            generations[key] = cache.get(key)
+    return '.'.join(str(generations[key]) for key in keys)
+
+
+def cached_response(per_outlet=False):
+    """
+    Cache successful GET responses of the decorated view.
+    :param per_outlet: The view takes outlet_id as its first argument and is invalidated with that outlet only
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'GET':
+                return view(request, *args, **kwargs)
+
+            if per_outlet:
+                outlet_id = kwargs['outlet_id'] if 'outlet_id' in kwargs else args[0]
+                generation_keys = [SHARED_GENERATION, OUTLET_GENERATION % outlet_id]
+            else:
+                generation_keys = [GLOBAL_GENERATION]
+
+            cache = get_cache()
+            key = 'rss:response:%s:%s:%s:%s:%s' % (view.__name__, _generations(cache, generation_keys),
+                                                   hashlib.md5(request.get_full_path()).hexdigest(),
+                                                   negotiate(request), getattr(request, 'rss_etag', None) or '')
+            response = cache.get(key)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code == 200 and not response.streaming:
+                    cache.set(key, response, settings.RSS_CACHE_TIMEOUT)
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,74 @@
+"""
+Conditional GET for the article views.
+
+The ETag and Last-Modified of an article response come from Outlet.articles_changed, which moves forward whenever
+articles are stored or deleted: the outlet's own value for the views of an outlet, the latest one across outlets and
+the number of outlets for the others. Clients sending back the ETag in If-None-Match get a 304 Not Modified answer
+for the price of that single query, before the article query or the response cache are touched.
+"""
+import hashlib
+from functools import wraps
+
+from django.db.models import Count, Max
+from django.views.decorators.http import condition
+
+from .models import Outlet
+
+
+def _validator(request, outlet_id=None):
+    """
+    :return: Tuple of the last time articles changed and a value changing with the outlets, None for a missing outlet
+    """
+    # Read once per request, condition() asks for the ETag and the Last-Modified separately
+    if not hasattr(request, '_rss_validator'):
+        if outlet_id is None:
+            aggregate = Outlet.objects.aggregate(changed=Max('articles_changed'), count=Count('id'))
+            request._rss_validator = (aggregate['changed'], aggregate['count'])
+        else:
+            changed = Outlet.objects.filter(pk=outlet_id).values_list('articles_changed', flat=True)[:1]
+            request._rss_validator = (changed[0], outlet_id) if changed else None
+    return request._rss_validator
+
+
+def conditional_response(per_outlet=False):
+    """
+    Send ETag and Last-Modified headers with the responses of the decorated article view and answer conditional
+    requests with 304 Not Modified when no article changed since.
+    :param per_outlet: The view takes outlet_id and only serves articles of that outlet
+    """
+
+    def outlet_id(args, kwargs):
+        if not per_outlet:
+            return None
+        return kwargs['outlet_id'] if 'outlet_id' in kwargs else args[0]
+
+    def etag(request, *args, **kwargs):
+        validator = _validator(request, outlet_id(args, kwargs))
+        if validator is None:
+            return None
+        changed, token = validator
+        # Pages, filters and formats of a list are different representations, each gets its own ETag
+        request.rss_etag = hashlib.md5('%s:%s:%s:%s' % (changed.isoformat() if changed else '', token,
+                                                        request.get_full_path(),
+                                                        request.META.get('HTTP_ACCEPT', ''))).hexdigest()
+        # Keys the response cache as well, see rss.caching
+        return request.rss_etag
+
+    def last_modified(request, *args, **kwargs):
+        validator = _validator(request, outlet_id(args, kwargs))
+        return validator[0] if validator else None
+
+    def decorator(view):
+        conditional_view = condition(etag_func=etag, last_modified_func=last_modified)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            # gzip_page marks the ETags of compressed responses, they validate the same content
+            if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+            if if_none_match:
+                request.META['HTTP_IF_NONE_MATCH'] = if_none_match.replace(';gzip"', '"')
+            return conditional_view(request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,55 @@
+"""
+Response encodings of the rss API.
+
+Responses are JSON unless the client lists application/msgpack in its Accept header and the msgpack package is
+installed, msgpack payloads are the same data in a compact binary form. Either is gzip compressed by the gzip_page
+decorator of the article views. Compression is not enabled site-wide, pages with a CSRF token next to reflected input,
+such as the admin, would be open to BREACH.
+"""
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import patch_vary_headers
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_CONTENT_TYPES = ('application/msgpack', 'application/x-msgpack')
+
+
+def negotiate(request):
+    """
+    :return: The encoding of the response to the request, 'msgpack' or 'json'
+    """
+    if msgpack is not None and request is not None:
+        accept = request.META.get('HTTP_ACCEPT', '')
+        if any(content_type in accept for content_type in MSGPACK_CONTENT_TYPES):
+            return 'msgpack'
+    return 'json'
+
+
+def encoded_response(request, data, safe=True):
+    """
+    Response with data encoded as the request negotiates
+    :param safe: Only accept dicts for JSON, as JsonResponse
+    """
+    if negotiate(request) == 'msgpack':
+        # Dates and other values are converted to the strings they are in JSON
+        response = HttpResponse(msgpack.packb(data, default=DjangoJSONEncoder().default, use_bin_type=True),
+                                content_type=MSGPACK_CONTENT_TYPES[0])
+    else:
+        response = JsonResponse(data, safe=safe)
+    if msgpack is not None:
+        patch_vary_headers(response, ['Accept'])
+    return response
+
+
+def json_content_response(content):
+    """
+    Response with content that is already JSON, e.g. stored article documents
+    """
+    response = HttpResponse(content, content_type='application/json')
+    if msgpack is not None:
+        patch_vary_headers(response, ['Accept'])
+    return response
@@ -2,20 +2,179 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+from StringIO import StringIO
 from time import mktime
 import datetime
+import time
+import gzip
+import os
+import urllib2
+import zlib
+from urlparse import urlparse
 
 import feedparser
 from django.utils import timezone
 
 
+# Bytes read from the socket at a time while downloading a body
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class RawBodyHandler(urllib2.BaseHandler):
+    """
+    urllib2 processor keeping a copy of the response body feedparser downloads, as sent by the server, and the time
+    the download finished
+    """
+
+    def __init__(self, max_bytes=None, max_seconds=None):
+        """
+        :param max_bytes: Raise ValueError when the body, compressed or not, is larger than this
+        :param max_seconds: Raise ValueError when the body is not downloaded this many seconds after the handler was
+        created. The socket timeout only bounds each read, a server sending a byte at a time never reaches it.
+        """
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.started = time.time()
+        self.body = None
+        self.content_encoding = None
+        self.received_at = None
+
+    def _check_size(self, body):
+        if self.max_bytes is not None and len(body) > self.max_bytes:
+            raise ValueError('Feed is larger than %s bytes.' % self.max_bytes)
+        return body
+
+    def _read(self, response):
+        chunks = []
+        size = 0
+        while True:
+            if self.max_seconds is not None and time.time() - self.started > self.max_seconds:
+                raise ValueError('Feed took longer than %s seconds to download.' % self.max_seconds)
+            chunk = response.read(READ_CHUNK_SIZE)
+            if not chunk:
+                return ''.join(chunks)
+            chunks.append(chunk)
+            size += len(chunk)
+            if self.max_bytes is not None and size > self.max_bytes:
+                return self._check_size(''.join(chunks))
+
+    def http_response(self, request, response):
+        self.body = self._check_size(self._read(response))
+        self.content_encoding = response.info().get('content-encoding')
+        self.received_at = time.time()
+
+        # The body was consumed, hand feedparser an identical response reading from memory
+        copy = urllib2.addinfourl(StringIO(self.body), response.info(), response.geturl(), response.code)
+        copy.msg = getattr(response, 'msg', '')
+        return copy
+
+    https_response = http_response
+    file_response = http_response
+
+    def get_body(self):
+        """
+        :return: The body without its transfer compression, None if nothing was downloaded
+        """
+        if self.body is None:
+            return None
+        size = -1 if self.max_bytes is None else self.max_bytes + 1
+        try:
+            if self.content_encoding == 'gzip':
+                return self._check_size(gzip.GzipFile(fileobj=StringIO(self.body)).read(size))
+            if self.content_encoding == 'deflate':
+                return self._check_size(zlib.decompressobj(-zlib.MAX_WBITS).decompress(self.body, max(size, 0)))
+        except (IOError, zlib.error), e:
+            logger.warning('Failed to decompress feed body: %s' % e)
+        return self.body
+
+
+def read_source(feed_url):
+    """
+    Body of a feed_url feedparser reads without urllib2, a local file or the feed document itself
+    """
+    if os.path.exists(feed_url):
+        with open(feed_url, 'rb') as feed_file:
+            return feed_file.read()
+    return feed_url
+
+
+def download(feed_url, etag=None, modified=None, timeout=None, max_bytes=None, max_seconds=None):
+    """
+    Fetch the feed body without parsing it, with a conditional GET when validators are given. Like RSSFeed, feed_url
+    may also be a local file or the feed document itself.
+    :param timeout: Socket timeout in seconds, the global default when None
+    :param max_bytes: Raise ValueError instead of downloading a body larger than this
+    :param max_seconds: Raise ValueError when the whole download takes longer than this
+    :return: Dict with the HTTP status, the validators to send on the next fetch, the body, None when the server
+    answered 304 Not Modified, and fetch_seconds
+    """
+    started = time.time()
+    response = {'status': 200, 'etag': etag, 'modified': modified, 'body': None}
+
+    if urlparse(feed_url).scheme in ('http', 'https', 'file'):
+        request = urllib2.Request(feed_url, headers={'User-Agent': feedparser.USER_AGENT,
+                                                     'Accept': feedparser.ACCEPT_HEADER,
+                                                     'Accept-Encoding': 'gzip, deflate'})
+        if etag:
+            request.add_header('If-None-Match', etag)
+        if modified:
+            request.add_header('If-Modified-Since', modified)
+
+        handler = RawBodyHandler(max_bytes, max_seconds)
+        try:
+            if timeout is None:
+                opened = urllib2.build_opener(handler).open(request)
+            else:
+                opened = urllib2.build_opener(handler).open(request, timeout=timeout)
+        except urllib2.HTTPError, e:
+            if e.code != 304:
+                raise ValueError('Failed to fetch feed, the server answered %s.' % e.code)
+            response['status'] = 304
+        except (urllib2.URLError, IOError), e:
+            raise ValueError('Failed to fetch feed: %s' % e)
+        else:
+            headers = opened.info()
+            opened.close()
+            response.update(status=getattr(opened, 'code', None) or 200, etag=headers.get('etag', etag),
+                            modified=headers.get('last-modified', modified), body=handler.get_body())
+    else:
+        response['body'] = read_source(feed_url)
+
+    response['fetch_seconds'] = time.time() - started
+    return response
+
+
+def parse_document(feed_url, document):
+    """
+    Parse a feed body into the channel and entries RSSFeed extracts. Takes and returns picklable values only, so it
+    can run in another process.
+    :return: Tuple of the channel info, the entries and the seconds spent parsing
+    """
+    feed = RSSFeed(feed_url, document=document)
+    return feed.get_channel_info(), feed.get_entries_info(), feed.parse_seconds
+
+
 class RSSFeed:
     """
     Class to parse RSS feed and extract relevant information
     """
 
-    def __init__(self, feed_url):
+    def __init__(self, feed_url, etag=None, modified=None, document=None, keep_raw=False):
+        """
+        :param etag: ETag of the last fetch, sent for a conditional GET
+        :param modified: Last-Modified of the last fetch, sent for a conditional GET
+        :param document: Parse this feed body instead of fetching feed_url, e.g. one read from the archive
+        :param keep_raw: Keep the raw feed body in self.raw
+        """
         self.feed_url = feed_url
+        self.etag = etag
+        self.modified = modified
+        self.document = document
+        self.keep_raw = keep_raw
+        self.raw = None
+        # Seconds spent downloading the feed and parsing it, the latter including entry extraction
+        self.fetch_seconds = 0
+        self.parse_seconds = 0
         self.feed_data = None
         self.channel_info = None
         self.entries = None
@@ -31,12 +190,56 @@ class RSSFeed:
         tz_aware = datetime.datetime.fromtimestamp(unix_time).replace(tzinfo=timezone.utc)
         return tz_aware
 
+    @classmethod
+    def from_download(cls, feed_url, response, parsed=None):
+        """
+        RSSFeed of a feed fetched by download and parsed by parse_document, see rss.pipeline
+        :param parsed: What parse_document returned, None for a 304 Not Modified response
+        """
+        feed = cls(feed_url, etag=response['etag'], modified=response['modified'])
+        feed.feed_data = {'status': response['status'], 'etag': response['etag'], 'modified': response['modified']}
+        feed.fetch_seconds = response['fetch_seconds']
+        if parsed is not None:
+            feed.channel_info, feed.entries, feed.parse_seconds = parsed
+        return feed
+
+    def _read_source(self):
+        return read_source(self.feed_url)
+
+    def _fetch(self):
+        started = time.time()
+        if self.document is not None:
+            self.raw = self.document if self.keep_raw else None
+            # Hand feedparser a stream, it would fetch a document that looks like a url or names a local file
+            document = self.document.encode('utf-8') if isinstance(self.document, unicode) else self.document
+            feed_data = feedparser.parse(StringIO(document))
+            self.parse_seconds += time.time() - started
+            return feed_data
+
+        handler = RawBodyHandler()
+        feed_data = feedparser.parse(self.feed_url, etag=self.etag, modified=self.modified, handlers=[handler])
+        finished = time.time()
+
+        # feedparser downloads and parses in one call, the handler tells where the download ended
+        if handler.received_at is not None:
+            self.fetch_seconds = handler.received_at - started
+        self.parse_seconds += finished - started - self.fetch_seconds
+
+        if self.keep_raw:
+            self.raw = handler.get_body()
+            if self.raw is None and 'status' not in feed_data:
+                self.raw = self._read_source()
+        return feed_data
+
     def _parse_feed_data(self):
         if self.feed_data is None:
             try:
-                feed_data = feedparser.parse(self.feed_url)
+                feed_data = self._fetch()
 
-                if not feed_data.version.startswith('rss'):
+                if feed_data.get('status') == 304:
+                    # Conditional GET, nothing to parse
+                    self.feed_data = feed_data
+                elif not feed_data.version.startswith('rss'):
                     raise ValueError('Feed does not contain valid rss information.')
                 else:
                     self.feed_data = feed_data
@@ -70,6 +273,7 @@ class RSSFeed:
         if self.entries is None:
             self._parse_feed_data()
 
+            started = time.time()
             self.entries = []
             for entry in self.feed_data.entries:
 
@@ -102,10 +306,38 @@ class RSSFeed:
                 }
                 self.entries.append(entry_info)
 
+            self.parse_seconds += time.time() - started
+
+    def is_modified(self):
+        """
+        Whether the server sent the feed content, False when it answered the conditional GET with 304 Not Modified.
+        """
+        self._parse_feed_data()
+        return self.feed_data.get('status') != 304
+
+    def get_validators(self):
+        """
+        HTTP validators to be sent back on the next fetch, falls back to the ones we sent if the server omitted them.
+        """
+        self._parse_feed_data()
+        return {
+            'etag': self.feed_data.get('etag', self.etag),
+            'modified': self.feed_data.get('modified', self.modified)
+        }
+
     def get_channel_info(self):
         self._parse_channel_info()
         return self.channel_info
 
     def get_entries_info(self):
         self._parse_entries_info()
-        return self.entries
\ No newline at end of file
+        return self.entries
+
+    def iter_entries_info(self, since=None):
+        """
+        Generator of the feed entries
+        :param since: Skip entries published before this datetime
+        """
+        for entry_info in self.get_entries_info():
+            if since is None or entry_info['entry_info']['pub_date'] >= since:
+                yield entry_info
\ No newline at end of file
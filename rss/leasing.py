@@ -0,0 +1,104 @@
+"""
+Database leases on outlets, so a fleet of workers on any number of hosts checks each outlet once.
+
+A worker claims due outlets by writing its id and an expiry time to Outlet.lease_owner and Outlet.lease_expires, and
+releases them once they are checked, setting their next check at the same time. A lease that expires before it is
+released, because its worker crashed or hung, makes the outlet claimable again.
+"""
+import datetime
+import os
+import socket
+import uuid
+
+from django.db import connection, transaction
+from django.db.models import Min, Q
+from django.utils import timezone
+
+from .models import Outlet
+
+# Postgres locks the candidate rows, concurrent workers skip them instead of waiting or claiming them twice
+POSTGRES_CLAIM_SQL = """
+UPDATE {table} SET lease_owner = %s, lease_expires = %s
+WHERE id IN (
+    SELECT id FROM {table}
+    WHERE (next_check IS NULL OR next_check <= %s) AND (lease_expires IS NULL OR lease_expires < %s)
+    ORDER BY next_check NULLS FIRST, id
+    LIMIT %s
+    FOR UPDATE SKIP LOCKED
+)
+RETURNING id
+"""
+
+
+def worker_id():
+    """
+    :return: An id unique to this worker process, readable enough to tell which host holds a lease
+    """
+    return '%s:%s:%s' % (socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+
+
+def _claimable(now):
+    return Outlet.objects.filter(Q(next_check__isnull=True) | Q(next_check__lte=now),
+                                 Q(lease_expires__isnull=True) | Q(lease_expires__lt=now))
+
+
+def claim_due(owner, limit, lease_seconds, now=None):
+    """
+    Lease up to limit outlets that are due and not leased by another worker, the ones due first
+    :param owner: Id of the claiming worker, see worker_id
+    :param lease_seconds: Time after which the outlets can be claimed again if they are not released
+    :return: The claimed outlets
+    """
+    if now is None:
+        now = timezone.now()
+    expires = now + datetime.timedelta(seconds=lease_seconds)
+
+    if connection.vendor == 'postgresql':
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(POSTGRES_CLAIM_SQL.format(table=Outlet._meta.db_table),
+                           [owner, expires, now, now, limit])
+            claimed_ids = [row[0] for row in cursor.fetchall()]
+        return list(Outlet.objects.filter(pk__in=claimed_ids).order_by('next_check', 'id')) if claimed_ids else []
+
+    # Without SKIP LOCKED the claim is a single conditional UPDATE, rows another worker claimed since the candidates
+    # were read no longer match and are left out. The expiry time tells this claim from earlier ones of the worker.
+    candidate_ids = list(_claimable(now).order_by('next_check', 'id').values_list('id', flat=True)[:limit])
+    if not candidate_ids:
+        return []
+    _claimable(now).filter(pk__in=candidate_ids).update(lease_owner=owner, lease_expires=expires)
+    return list(Outlet.objects.filter(lease_owner=owner, lease_expires=expires).order_by('next_check', 'id'))
+
+
+def release(owner, outlet_id, next_check=None, check_interval=None):
+    """
+    Give up the lease on an outlet, setting its next check
+    :return: False if the lease was lost, taken over by another worker after it expired
+    """
+    values = {'lease_owner': None, 'lease_expires': None}
+    if next_check is not None:
+        values.update(next_check=next_check, check_interval=check_interval)
+    # update() rather than save() so rescheduling does not expire cached API responses
+    return Outlet.objects.filter(pk=outlet_id, lease_owner=owner).update(**values) == 1
+
+
+def release_all(owner):
+    """
+    Give up every lease of the worker without rescheduling the outlets, when it stops
+    """
+    return Outlet.objects.filter(lease_owner=owner).update(lease_owner=None, lease_expires=None)
+
+
+def next_claimable(now=None):
+    """
+    :return: The earliest time an outlet may become claimable, None if there are no outlets
+    """
+    if now is None:
+        now = timezone.now()
+
+    if _claimable(now).exists():
+        return now
+    unleased = Outlet.objects.filter(Q(lease_expires__isnull=True) | Q(lease_expires__lt=now))
+    times = [unleased.aggregate(when=Min('next_check'))['when'],
+             Outlet.objects.filter(lease_expires__gte=now).aggregate(when=Min('lease_expires'))['when']]
+    times = [when for when in times if when is not None]
+    return max(min(times), now) if times else None
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from rss.documents import RENDER_BATCH_SIZE, refresh_documents
+from rss.models import Article
+
+
+class Command(BaseCommand):
+    help = 'Render the stored JSON documents of articles that do not have one yet.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, dest='batch_size', default=RENDER_BATCH_SIZE,
+                            help='Articles rendered per transaction, defaults to %s' % RENDER_BATCH_SIZE)
+        parser.add_argument('--all', action='store_true', default=False,
+                            help='Render every article again, e.g. after Article.__data__ changed')
+
+    def handle(self, *args, **options):
+        queryset = Article.objects.all()
+        if not options['all']:
+            queryset = queryset.filter(document__isnull=True)
+
+        started = time.time()
+        rendered = 0
+        last_id = 0
+        while True:
+            # Walk the ids in order, rendered articles drop out of the filter but the cursor does not depend on it
+            article_ids = list(queryset.filter(id__gt=last_id).order_by('id')
+                               .values_list('id', flat=True)[:options['batch_size']])
+            if not article_ids:
+                break
+            rendered += refresh_documents(article_ids)
+            last_id = article_ids[-1]
+
+        self.stdout.write('Rendered %s article documents in %.2f seconds.' % (rendered, time.time() - started))
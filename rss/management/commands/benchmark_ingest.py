@@ -0,0 +1,63 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from rss.benchmark import benchmark_ingest, benchmark_parse, environment
+from rss.synthetic import generate_feed, pass_entry_ids
+
+
+class Command(BaseCommand):
+    help = 'Benchmark feed parsing and ingestion over synthetic feeds in a scratch database, results as JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entries', type=int, default=500, help='Entries per feed')
+        parser.add_argument('--passes', type=int, default=5, help='Number of ingestion passes')
+        parser.add_argument('--overlap', type=int, default=450,
+                            help='Entries each pass shares with the previous one')
+        parser.add_argument('--tags', type=int, default=50, help='Number of distinct tags')
+        parser.add_argument('--authors', type=int, default=10, help='Number of distinct authors')
+        parser.add_argument('--tags-per-entry', type=int, default=3, dest='tags_per_entry')
+        parser.add_argument('--authors-per-entry', type=int, default=1, dest='authors_per_entry')
+        parser.add_argument('--repeat', type=int, default=3, help='Parse benchmark runs, the best one is kept')
+        parser.add_argument('--output', help='Write the results to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        if options['passes'] < 1 or options['entries'] < 1:
+            raise CommandError('There must be at least one pass and one entry.')
+
+        feed_options = {
+            'tag_count': options['tags'],
+            'author_count': options['authors'],
+            'tags_per_entry': options['tags_per_entry'],
+            'authors_per_entry': options['authors_per_entry']
+        }
+        try:
+            entry_ids = pass_entry_ids(0, options['entries'], options['overlap'])
+        except ValueError, e:
+            raise CommandError(e)
+
+        results = {
+            'environment': environment(),
+            'options': dict(feed_options, entries=options['entries'], passes=options['passes'],
+                            overlap=options['overlap']),
+            'parse': dict((fmt, benchmark_parse(generate_feed(entry_ids, fmt=fmt, **feed_options),
+                                                options['entries'], options['repeat'], rss=fmt == 'rss'))
+                          for fmt in ('rss', 'atom'))
+        }
+
+        # Never write benchmark data to the real database
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            results['ingest'] = benchmark_ingest(options['passes'], options['entries'], options['overlap'],
+                                                 **feed_options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        output = json.dumps(results, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                output_file.write(output + '\n')
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,41 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rss.opml import import_opml
+
+
+class Command(BaseCommand):
+    help = 'Create outlets for the feeds of an OPML file, validating them concurrently.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='OPML file, - to read it from the standard input')
+        parser.add_argument('--pool-size', type=int, dest='pool_size',
+                            help='Feeds validated at once, defaults to settings.RSS_IMPORT_POOL_SIZE')
+        parser.add_argument('--per-host', type=int, dest='per_host',
+                            help='Feeds validated at once per host, defaults to settings.RSS_IMPORT_PER_HOST')
+
+    def handle(self, *args, **options):
+        try:
+            if options['path'] == '-':
+                document = sys.stdin.read()
+            else:
+                with open(options['path'], 'rb') as opml_file:
+                    document = opml_file.read()
+        except IOError, e:
+            raise CommandError(e)
+
+        started = time.time()
+        try:
+            results = import_opml(document, options['pool_size'], options['per_host'])
+        except ValueError, e:
+            raise CommandError(e)
+        elapsed = time.time() - started
+
+        for result in results:
+            if result['error']:
+                self.stderr.write('%s: %s' % (result['rss_url'], result['error']))
+
+        imported = len([result for result in results if result['outlet'] is not None])
+        self.stdout.write('Imported %s of %s feeds in %.2f seconds.' % (imported, len(results), elapsed))
@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import dateparse
+
+from rss.archive import FeedArchive, get_archive
+from rss.worker import replay_archive
+
+
+def _datetime(value):
+    parsed = dateparse.parse_datetime(value)
+    if parsed is None or parsed.tzinfo is None:
+        raise ValueError('Expected an ISO 8601 datetime with a time zone, got "%s".' % value)
+    return parsed
+
+
+class Command(BaseCommand):
+    help = 'Ingest archived feed bodies again, without network access.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--archive', help='Archive directory, defaults to settings.RSS_ARCHIVE_DIR')
+        parser.add_argument('--outlet', type=int, action='append', dest='outlet_ids',
+                            help='Only replay this outlet, may be repeated')
+        parser.add_argument('--since', help='Only replay bodies fetched at or after this ISO 8601 datetime')
+        parser.add_argument('--until', help='Only replay bodies fetched before this ISO 8601 datetime')
+        parser.add_argument('--force', action='store_true', default=False,
+                            help='Store the entries of bodies older than the outlet\'s last update too, '
+                                 'e.g. after a parser fix')
+
+    def handle(self, *args, **options):
+        archive = FeedArchive(options['archive']) if options['archive'] else get_archive()
+        if archive is None:
+            raise CommandError('No archive given and settings.RSS_ARCHIVE_DIR is not set.')
+
+        try:
+            since = _datetime(options['since']) if options['since'] else None
+            until = _datetime(options['until']) if options['until'] else None
+        except ValueError, e:
+            raise CommandError(e)
+
+        started = time.time()
+        replayed, stored = replay_archive(archive, options['outlet_ids'], since, until, options['force'])
+        elapsed = time.time() - started
+
+        self.stdout.write('Replayed %s feed bodies in %.2f seconds, %s articles stored.' % (replayed, elapsed, stored))
@@ -0,0 +1,191 @@
+"""
+Worker metrics in the Prometheus text exposition format.
+
+Metrics are kept in memory by the worker process and served by start_server over HTTP, the worker starts it when
+settings.RSS_METRICS_PORT is set.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+import threading
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return unicode(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = zip(names, values) + list(extra)
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, _escape(value)) for name, value in pairs)
+
+
+class Metric(object):
+    type = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError('%s expects labels %s' % (self.name, ', '.join(self.labels)))
+        return tuple(labels[name] for name in self.labels)
+
+    def get(self, **labels):
+        return self._values.get(self._key(labels))
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.documentation), '# TYPE %s %s' % (self.name, self.type)]
+        with self._lock:
+            for key in sorted(self._values):
+                lines.extend(self._samples(key, self._values[key]))
+        return lines
+
+    def _samples(self, key, value):
+        return ['%s%s %s' % (self.name, _format_labels(self.labels, key), _format_value(value))]
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def _samples(self, key, value):
+        counts, total = value
+        samples = ['%s_bucket%s %s' % (self.name, _format_labels(self.labels, key, [('le', _format_value(bound))]),
+                                       count) for bound, count in zip(self.buckets, counts)]
+        samples.append('%s_sum%s %s' % (self.name, _format_labels(self.labels, key), _format_value(float(total))))
+        samples.append('%s_count%s %s' % (self.name, _format_labels(self.labels, key), counts[-1]))
+        return samples
+
+
+class Registry(object):
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def clear(self):
+        for metric in self.metrics:
+            metric.clear()
+
+    def render(self):
+        return '\n'.join(line for metric in self.metrics for line in metric.render()) + '\n'
+
+
+REGISTRY = Registry()
+
+fetch_seconds = REGISTRY.register(Histogram(
+    'rss_fetch_seconds', 'Time spent downloading the outlet feed.', ['outlet_id']))
+parse_seconds = REGISTRY.register(Histogram(
+    'rss_parse_seconds', 'Time spent parsing the outlet feed and extracting its entries.', ['outlet_id']))
+store_seconds = REGISTRY.register(Histogram(
+    'rss_store_seconds', 'Time spent writing the outlet entries to the database.', ['outlet_id']))
+entries_total = REGISTRY.register(Counter(
+    'rss_entries_total', 'Feed entries seen, by what was done with them: inserted, updated, unchanged or rejected.',
+    ['outlet_id', 'result']))
+not_modified_total = REGISTRY.register(Counter(
+    'rss_not_modified_total', 'Checks answered with 304 Not Modified.', ['outlet_id']))
+failures_total = REGISTRY.register(Counter(
+    'rss_check_failures_total', 'Checks that failed with an error.', ['outlet_id']))
+pass_seconds = REGISTRY.register(Histogram(
+    'rss_pass_seconds', 'Time taken to check a batch of outlets.', buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800)))
+scheduler_lag_seconds = REGISTRY.register(Histogram(
+    'rss_scheduler_lag_seconds', 'Delay between the time an outlet check was due and the time it started.',
+    buckets=(0.1, 1, 5, 15, 30, 60, 300, 900, 3600)))
+scheduled_outlets = REGISTRY.register(Gauge(
+    'rss_scheduled_outlets', 'Outlets known to the worker scheduler.'))
+
+
+def record_entries(outlet_id, inserted=0, updated=0, unchanged=0, rejected=0):
+    for result, count in [('inserted', inserted), ('updated', updated), ('unchanged', unchanged),
+                          ('rejected', rejected)]:
+        if count:
+            entries_total.inc(count, outlet_id=outlet_id, result=result)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+
+        body = REGISTRY.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def start_server(port, address=''):
+    """
+    Serve the metrics at http://address:port/metrics from a daemon thread
+    :return: The HTTP server, call shutdown() to stop it
+    """
+    server = _Server((address, port), _Handler)
+    thread = threading.Thread(target=server.serve_forever, name='rss-metrics')
+    thread.daemon = True
+    thread.start()
+    logger.info('Serving metrics on %s:%s' % (address or '*', server.server_port))
+    return server
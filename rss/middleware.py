@@ -0,0 +1,86 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+import json
+import random
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from . import profiling
+
+
+class QueryProfilingMiddleware(object):
+    """
+    Profile the rss API requests: query count, SQL time, serialization time and response size are sent in the
+    X-Query-Count and Server-Timing headers and logged as JSON for a sample of the requests. Queries repeated with
+    only different parameters, the N+1 pattern, are counted in X-Query-Duplicates and always logged.
+
+    Enabled by settings.RSS_PROFILING. Streamed responses run their queries after the headers are sent, their
+    headers only cover the work done before streaming but the log covers the whole response.
+    """
+
+    def __init__(self):
+        if not settings.RSS_PROFILING:
+            raise MiddlewareNotUsed
+
+    def process_request(self, request):
+        if request.path.startswith(settings.RSS_PROFILING_PATH):
+            profiling.start()
+
+    def process_response(self, request, response):
+        summary = profiling.finish()
+        if summary is None:
+            return response
+
+        if response.streaming:
+            response.streaming_content = self._profile_stream(request, response.streaming_content,
+                                                              profiling.RequestProfile())
+        else:
+            summary['size'] = len(response.content)
+            self._log(request, response, summary)
+
+        self._add_headers(response, summary)
+        return response
+
+    def _profile_stream(self, request, content, profile):
+        size = 0
+        profiling.start(profile)
+        try:
+            for chunk in content:
+                size += len(chunk)
+                yield chunk
+        finally:
+            summary = profiling.finish()
+            summary['size'] = size
+            self._log(request, None, summary)
+
+    def _add_headers(self, response, summary):
+        response['X-Query-Count'] = summary['queries']
+        response['X-Query-Duplicates'] = sum(summary['duplicates'].values())
+        response['Server-Timing'] = 'db;dur=%.2f;desc="%s queries", serialize;dur=%.2f, total;dur=%.2f' % (
+            summary['sql_seconds'] * 1000, summary['queries'], summary['serialize_seconds'] * 1000,
+            summary['total_seconds'] * 1000)
+
+    def _log(self, request, response, summary):
+        duplicates = summary['duplicates']
+        if not duplicates and random.random() >= settings.RSS_PROFILING_SAMPLE_RATE:
+            return
+
+        record = {
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code if response is not None else 200,
+            'streaming': response is None,
+            'queries': summary['queries'],
+            'sql_ms': round(summary['sql_seconds'] * 1000, 2),
+            'serialize_ms': round(summary['serialize_seconds'] * 1000, 2),
+            'total_ms': round(summary['total_seconds'] * 1000, 2),
+            'size': summary['size'],
+            'duplicates': sorted(duplicates.items(), key=lambda item: -item[1])
+        }
+        if duplicates:
+            logger.warning(json.dumps(record))
+        else:
+            logger.info(json.dumps(record))
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rss', '0003_auto_20151015_2136'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outlet',
+            name='etag',
+            field=models.CharField(max_length=200, null=True),
+        ),
+        migrations.AddField(
+            model_name='outlet',
+            name='last_modified',
+            field=models.CharField(max_length=50, null=True, verbose_name=b'last modified'),
+        ),
+    ]
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, OperationalError
+
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE rss_article_fts USING fts5(title, summary, content, tags, authors,
+                                                   tokenize = 'unicode61 remove_diacritics 1')
+    """,
+    """
+    INSERT INTO rss_article_fts (rowid, title, summary, content, tags, authors)
+    SELECT a.id, a.title, a.summary, a.content,
+        (SELECT group_concat(t.term, ' ') FROM rss_article_tags at JOIN rss_tag t ON t.id = at.tag_id
+         WHERE at.article_id = a.id),
+        (SELECT group_concat(au.name, ' ') FROM rss_article_authors aa JOIN rss_author au ON au.id = aa.author_id
+         WHERE aa.article_id = a.id)
+    FROM rss_article a
+    """,
+]
+
+SQLITE_REVERSE = [
+    'DROP TABLE IF EXISTS rss_article_fts',
+]
+
+POSTGRES_FORWARD = [
+    'ALTER TABLE rss_article ADD COLUMN search_vector tsvector',
+    'CREATE INDEX rss_article_search_vector ON rss_article USING gin(search_vector)',
+    """
+    UPDATE rss_article a SET search_vector =
+        setweight(to_tsvector('simple', coalesce(a.title, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(
+            (SELECT string_agg(t.term, ' ') FROM rss_article_tags at JOIN rss_tag t ON t.id = at.tag_id
+             WHERE at.article_id = a.id), '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(
+            (SELECT string_agg(au.name, ' ') FROM rss_article_authors aa JOIN rss_author au ON au.id = aa.author_id
+             WHERE aa.article_id = a.id), '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(a.summary, '')), 'C') ||
+        setweight(to_tsvector('simple', coalesce(a.content, '')), 'D')
+    """,
+]
+
+POSTGRES_REVERSE = [
+    'ALTER TABLE rss_article DROP COLUMN search_vector',
+]
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        try:
+            for sql in SQLITE_FORWARD:
+                schema_editor.execute(sql)
+        except OperationalError:
+            # SQLite was built without FTS5, search falls back to LIKE queries
+            pass
+    elif vendor == 'postgresql':
+        for sql in POSTGRES_FORWARD:
+            schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for sql in SQLITE_REVERSE:
+            schema_editor.execute(sql)
+    elif vendor == 'postgresql':
+        for sql in POSTGRES_REVERSE:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rss', '0004_auto_20261018_0530'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
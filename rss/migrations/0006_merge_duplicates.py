@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def _merge(model, through, link_field, group_fields):
+    """
+    Keep the oldest row of each group of duplicates, moving the article links of the others to it
+    """
+    duplicates = model.objects.values(*group_fields).annotate(keep=Min('id'), rows=Count('id')).filter(rows__gt=1)
+    for group in duplicates:
+        keep = group.pop('keep')
+        group.pop('rows')
+        others = list(model.objects.filter(**group).exclude(id=keep).values_list('id', flat=True))
+
+        linked = set(through.objects.filter(**{link_field: keep}).values_list('article_id', flat=True))
+        for link in through.objects.filter(**{'%s__in' % link_field: others}):
+            if link.article_id not in linked:
+                linked.add(link.article_id)
+                through.objects.create(**{'article_id': link.article_id, link_field: keep})
+
+        through.objects.filter(**{'%s__in' % link_field: others}).delete()
+        model.objects.filter(id__in=others).delete()
+
+
+def merge_duplicates(apps, schema_editor):
+    Article = apps.get_model('rss', 'Article')
+    _merge(apps.get_model('rss', 'Tag'), Article.tags.through, 'tag_id', ['term'])
+    _merge(apps.get_model('rss', 'Author'), Article.authors.through, 'author_id', ['outlet_id', 'name'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rss', '0005_article_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+    ]
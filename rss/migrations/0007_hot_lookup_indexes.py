@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rss', '0006_merge_duplicates'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='tag',
+            name='term',
+            field=models.CharField(unique=True, max_length=200),
+        ),
+        migrations.AlterUniqueTogether(
+            name='author',
+            unique_together=set([('outlet', 'name')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='article',
+            index_together=set([('pub_date', 'id'), ('outlet', 'pub_date', 'id')]),
+        ),
+    ]
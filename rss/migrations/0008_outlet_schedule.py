@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rss', '0007_hot_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outlet',
+            name='check_interval',
+            field=models.IntegerField(null=True, verbose_name=b'check interval in seconds'),
+        ),
+        migrations.AddField(
+            model_name='outlet',
+            name='next_check',
+            field=models.DateTimeField(null=True, verbose_name=b'next check'),
+        ),
+    ]
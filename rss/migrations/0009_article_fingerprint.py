@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rss', '0008_outlet_schedule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='fingerprint',
+            field=models.CharField(max_length=40, null=True),
+        ),
+    ]
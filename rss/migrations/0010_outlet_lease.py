@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rss', '0009_article_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outlet',
+            name='lease_expires',
+            field=models.DateTimeField(null=True, verbose_name=b'lease expires'),
+        ),
+        migrations.AddField(
+            model_name='outlet',
+            name='lease_owner',
+            field=models.CharField(max_length=100, null=True, verbose_name=b'lease owner'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rss', '0010_outlet_lease'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outlet',
+            name='articles_changed',
+            field=models.DateTimeField(null=True, verbose_name=b'articles changed'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rss', '0011_outlet_articles_changed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='document',
+            field=models.TextField(null=True),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from collections import Counter
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def count_tags(apps, schema_editor):
+    Tag = apps.get_model('rss', 'Tag')
+    TagDailyCount = apps.get_model('rss', 'TagDailyCount')
+    Article = apps.get_model('rss', 'Article')
+
+    totals = Counter()
+    days = Counter()
+    for tag_id, pub_date in Article.tags.through.objects.values_list('tag_id', 'article__pub_date').iterator():
+        totals[tag_id] += 1
+        days[(tag_id, pub_date.astimezone(timezone.utc).date())] += 1
+
+    for tag_id, count in totals.items():
+        Tag.objects.filter(id=tag_id).update(article_count=count)
+    TagDailyCount.objects.bulk_create(TagDailyCount(tag_id=tag_id, day=day, count=count)
+                                      for (tag_id, day), count in days.items())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rss', '0012_article_document'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TagDailyCount',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('day', models.DateField(db_index=True)),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='article_count',
+            field=models.IntegerField(default=0, verbose_name=b'article count', db_index=True),
+        ),
+        migrations.AddField(
+            model_name='tagdailycount',
+            name='tag',
+            field=models.ForeignKey(to='rss.Tag'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='tagdailycount',
+            unique_together=set([('tag', 'day')]),
+        ),
+        migrations.RunPython(count_tags, migrations.RunPython.noop),
+    ]
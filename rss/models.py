@@ -9,6 +9,15 @@ class Outlet(models.Model):
     description = models.CharField(max_length=500, null=True)
     language = models.CharField(max_length=5, null=True)
     updated = models.DateTimeField('date updated', null=True)
+    etag = models.CharField(max_length=200, null=True)
+    last_modified = models.CharField('last modified', max_length=50, null=True)
+    next_check = models.DateTimeField('next check', null=True)
+    check_interval = models.IntegerField('check interval in seconds', null=True)
+    # Worker currently checking the outlet and until when, see rss.leasing
+    lease_owner = models.CharField('lease owner', max_length=100, null=True)
+    lease_expires = models.DateTimeField('lease expires', null=True)
+    # Last time articles of the outlet were stored or deleted, the validator of the article list responses
+    articles_changed = models.DateTimeField('articles changed', null=True)
 
     def __data__(self):
         return {
@@ -31,6 +40,9 @@ class Author(models.Model):
     profile = models.CharField(max_length=100, null=True)
     twitter = models.CharField(max_length=50, null=True)
 
+    class Meta:
+        unique_together = [['outlet', 'name']]
+
     def __data__(self):
         return {
             'id': self.id,
@@ -44,7 +56,9 @@ class Author(models.Model):
 
 
 class Tag(models.Model):
-    term = models.CharField(max_length=200)
+    term = models.CharField(max_length=200, unique=True)
+    # Number of articles linked to the tag, kept up to date by rss.trending
+    article_count = models.IntegerField('article count', default=0, db_index=True)
 
     def __data__(self):
         return self.term
@@ -53,6 +67,21 @@ class Tag(models.Model):
         return self.term
 
 
+class TagDailyCount(models.Model):
+    """
+    Number of articles published on a day, in UTC, linked to a tag. Kept up to date by rss.trending.
+    """
+    tag = models.ForeignKey(Tag)
+    day = models.DateField(db_index=True)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = [['tag', 'day']]
+
+    def __unicode__(self):
+        return '%s %s' % (self.tag_id, self.day)
+
+
 class Article(models.Model):
     outlet = models.ForeignKey(Outlet)
     authors = models.ManyToManyField(Author)
@@ -63,21 +92,42 @@ class Article(models.Model):
     url = models.CharField(max_length=250, unique=True)
     pub_date = models.DateTimeField('date published')
     content = models.TextField(null=True)
-
-    def __data__(self):
-        authors = list(author.__data__() for author in self.authors.all())
-        tags = list(tag.__data__() for tag in self.tags.all())
-
-        return {
-            'id': self.id,
-            'title': self.title,
-            'summary': self.summary,
-            'url': self.url,
-            'date': self.pub_date,
-            'content': self.content,
-            'tags': tags,
-            'authors': authors
-        }
+    # sha1 of the feed entry the article was last stored from, see rss.worker.entry_fingerprint
+    fingerprint = models.CharField(max_length=40, null=True)
+    # JSON of __data__ as served by the API, see rss.documents
+    document = models.TextField(null=True)
+
+    class Meta:
+        # Article lists are sorted by (pub_date, id), globally and per outlet
+        index_together = [['pub_date', 'id'], ['outlet', 'pub_date', 'id']]
+
+    # Keys of __data__ and the columns they are read from, None for the relations
+    DATA_FIELDS = {
+        'id': 'id',
+        'title': 'title',
+        'summary': 'summary',
+        'url': 'url',
+        'date': 'pub_date',
+        'content': 'content',
+        'tags': None,
+        'authors': None
+    }
+
+    def __data__(self, fields=None):
+        """
+        :param fields: Keys to include, see DATA_FIELDS, all of them when None
+        """
+        data = {}
+        for key, column in Article.DATA_FIELDS.items():
+            if fields is not None and key not in fields:
+                continue
+            if key == 'authors':
+                data[key] = list(author.__data__() for author in self.authors.all())
+            elif key == 'tags':
+                data[key] = list(tag.__data__() for tag in self.tags.all())
+            else:
+                data[key] = getattr(self, column)
+        return data
 
     def __unicode__(self):
         return self.title
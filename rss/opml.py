@@ -0,0 +1,141 @@
+"""
+Bulk import of outlets from OPML subscription lists.
+
+Feeds are downloaded and validated concurrently, with at most settings.RSS_IMPORT_PER_HOST downloads from the same
+host at a time. Valid outlets are created with a single bulk insert, each feed of the list gets a result telling
+whether it was imported and why not.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+import threading
+from urlparse import urlparse
+from xml.etree import cElementTree as ElementTree
+
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import models
+
+from . import caching
+from .feed import RSSFeed, download, parse_document
+from .models import Outlet
+
+
+def parse_opml(document):
+    """
+    :return: List of dicts with the rss_url, title and url of every outline with a feed url, in document order
+    """
+    try:
+        root = ElementTree.fromstring(document)
+    except SyntaxError, e:
+        raise ValueError('Not a valid OPML document: %s' % e)
+
+    feeds = []
+    for outline in root.iter('outline'):
+        rss_url = (outline.get('xmlUrl') or '').strip()
+        if rss_url:
+            feeds.append({
+                'rss_url': rss_url,
+                'title': outline.get('title') or outline.get('text'),
+                'url': outline.get('htmlUrl')
+            })
+    return feeds
+
+
+class HostLimiter(object):
+    """
+    Semaphores limiting the concurrent requests to each host
+    """
+
+    def __init__(self, per_host):
+        self.per_host = per_host
+        self.semaphores = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, url):
+        host = urlparse(url).netloc.lower()
+        with self.lock:
+            if host not in self.semaphores:
+                self.semaphores[host] = threading.BoundedSemaphore(self.per_host)
+            return self.semaphores[host]
+
+
+def validate_feed(rss_url, limiter=None):
+    """
+    Download the feed within the admin validation limits and parse it
+    :return: The parsed RSSFeed
+    """
+    if limiter is None:
+        limiter = HostLimiter(1)
+    with limiter(rss_url):
+        response = download(rss_url, timeout=settings.RSS_VALIDATION_TIMEOUT,
+                            max_bytes=settings.RSS_VALIDATION_MAX_BYTES,
+                            max_seconds=settings.RSS_VALIDATION_TIMEOUT)
+    feed = RSSFeed.from_download(rss_url, response, parse_document(rss_url, response['body']))
+    feed.get_channel_info()
+    return feed
+
+
+def _outlet(feed, entry):
+    channel_info = feed.get_channel_info()
+    outlet = Outlet(rss_url=entry['rss_url'], name=channel_info['title'] or entry['title'] or entry['rss_url'],
+                    description=channel_info['subtitle'], url=channel_info['url'] or entry['url'] or '',
+                    language=channel_info['language'])
+
+    # Bulk inserts skip validation, cut what does not fit the columns like the database would refuse it
+    for field in Outlet._meta.fields:
+        value = getattr(outlet, field.attname)
+        if isinstance(field, models.CharField) and value and len(value) > field.max_length:
+            setattr(outlet, field.attname, value[:field.max_length])
+    return outlet
+
+
+def import_opml(document, pool_size=None, per_host=None):
+    """
+    Create an outlet for every valid feed of the OPML document that is not an outlet yet
+    :param pool_size: Feeds validated at once, defaults to settings.RSS_IMPORT_POOL_SIZE
+    :param per_host: Feeds validated at once per host, defaults to settings.RSS_IMPORT_PER_HOST
+    :return: List of dicts with the rss_url of each feed, the outlet created or None and the error if it was not
+    """
+    pool_size = pool_size or settings.RSS_IMPORT_POOL_SIZE
+    limiter = HostLimiter(per_host or settings.RSS_IMPORT_PER_HOST)
+
+    entries = parse_opml(document)
+    results = []
+    pending = []
+    existing = set(Outlet.objects.filter(rss_url__in=[entry['rss_url'] for entry in entries])
+                   .values_list('rss_url', flat=True))
+    seen = set()
+    for entry in entries:
+        result = {'rss_url': entry['rss_url'], 'outlet': None, 'error': None}
+        results.append(result)
+        if entry['rss_url'] in existing:
+            result['error'] = 'Outlet already exists.'
+        elif entry['rss_url'] in seen:
+            result['error'] = 'Feed is listed more than once.'
+        elif len(entry['rss_url']) > Outlet._meta.get_field('rss_url').max_length:
+            result['error'] = 'Feed url is too long.'
+        else:
+            pending.append((entry, result))
+        seen.add(entry['rss_url'])
+
+    if pending:
+        with ThreadPoolExecutor(max_workers=min(pool_size, len(pending))) as executor:
+            futures = [(executor.submit(validate_feed, entry['rss_url'], limiter), entry, result)
+                       for entry, result in pending]
+            for future, entry, result in futures:
+                try:
+                    result['outlet'] = _outlet(future.result(), entry)
+                except ValueError, e:
+                    result['error'] = unicode(e)
+                except Exception, e:
+                    logger.error('Failed to validate "%s": %s' % (entry['rss_url'], e))
+                    result['error'] = 'Failed to validate the feed.'
+
+    created = [result['outlet'] for result in results if result['outlet'] is not None]
+    if created:
+        Outlet.objects.bulk_create(created)
+        # bulk_create sends no post_save, expire the cached outlet lists here
+        caching.invalidate()
+    return results
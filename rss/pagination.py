@@ -0,0 +1,111 @@
+import base64
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import dateparse
+
+
+def encode_cursor(*values):
+    """
+    Opaque cursor holding the sort key of the last item of a page
+    """
+    return base64.urlsafe_b64encode('|'.join(str(value) for value in values))
+
+
+def decode_cursor(cursor, *types):
+    """
+    Decode a cursor generated by encode_cursor, converting each value with the matching callable in types
+    :return: The tuple of converted values
+    :raise ValueError: If the cursor was not generated by encode_cursor
+    """
+    try:
+        values = base64.urlsafe_b64decode(str(cursor)).split('|')
+        if len(values) != len(types):
+            raise ValueError
+        values = tuple(convert(value) for convert, value in zip(types, values))
+    except (TypeError, ValueError):
+        raise ValueError('Invalid cursor.')
+
+    if None in values:
+        raise ValueError('Invalid cursor.')
+
+    return values
+
+
+def get_limit(request):
+    """
+    Page size requested through the limit parameter, capped at settings.RSS_MAX_PAGE_SIZE
+    """
+    limit = request.GET.get('limit')
+    if limit is None:
+        return settings.RSS_PAGE_SIZE
+
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise ValueError('Limit must be an integer.')
+
+    if limit < 1:
+        raise ValueError('Limit must be greater than 0.')
+
+    return min(limit, settings.RSS_MAX_PAGE_SIZE)
+
+
+def _after(queryset, pub_date, article_id):
+    # pub_date <= x leads so the (pub_date, id) index can be range scanned, the OR only breaks ties
+    return queryset.filter(Q(pub_date__lte=pub_date), Q(pub_date__lt=pub_date) | Q(id__lt=article_id))
+
+
+def paginate(request, queryset):
+    """
+    Keyset pagination over articles from newest to oldest. The page starts right after the article encoded in the
+    cursor parameter, so every page costs an index range scan of limit rows no matter how deep it is.
+
+    :return: The list of articles in the page and the cursor of the next page, None on the last page
+    :raise ValueError: If the cursor or limit parameters are invalid
+    """
+    limit = get_limit(request)
+    queryset = queryset.order_by('-pub_date', '-id')
+
+    cursor = request.GET.get('cursor')
+    if cursor:
+        queryset = _after(queryset, *decode_cursor(cursor, dateparse.parse_datetime, int))
+
+    # Fetching one extra row tells whether there is a next page without a count query
+    page = list(queryset[:limit + 1])
+    if len(page) > limit:
+        last = page[limit - 1]
+        return page[:limit], encode_cursor(last.pub_date.isoformat(), last.id)
+    return page, None
+
+
+def next_page_url(request, cursor):
+    params = request.GET.copy()
+    params['cursor'] = cursor
+    return request.build_absolute_uri('%s?%s' % (request.path, params.urlencode()))
+
+
+def batches(request, queryset, batch_size):
+    """
+    Walk every article from the request cursor on, newest to oldest, in batches of batch_size. Each batch is its own
+    keyset query so memory stays flat whatever the database driver does with result sets.
+
+    :return: A generator of article lists
+    :raise ValueError: If the cursor parameter is invalid, raised right away rather than when iterating
+    """
+    queryset = queryset.order_by('-pub_date', '-id')
+
+    cursor = request.GET.get('cursor')
+    if cursor:
+        queryset = _after(queryset, *decode_cursor(cursor, dateparse.parse_datetime, int))
+
+    def generator(page_queryset):
+        while True:
+            batch = list(page_queryset[:batch_size])
+            if batch:
+                yield batch
+            if len(batch) < batch_size:
+                return
+            page_queryset = _after(queryset, batch[-1].pub_date, batch[-1].id)
+
+    return generator(queryset)
@@ -0,0 +1,172 @@
+"""
+Staged feed ingestion: threads download the feeds, a pool of processes parses them and the caller writes them to the
+database, with bounded queues between the stages.
+
+feedparser is pure Python, so feeds parsed by the fetcher threads share one core because of the GIL. Here the
+fetcher threads only wait on the network and the parsing runs in settings.RSS_PARSE_PROCESSES processes. When the
+database stage falls behind the queues fill up and parsing, then downloading, pause until it catches up.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+import threading
+from Queue import Empty, Full, Queue
+
+from concurrent.futures import Future, ProcessPoolExecutor
+from django.conf import settings
+
+from .archive import get_archive
+from .feed import RSSFeed, download, parse_document
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_parse_pool():
+    """
+    :return: The process pool parsing feeds, started on first use and kept for the life of the worker. It has
+    settings.RSS_PARSE_PROCESSES processes, or one per core when that is 0.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=settings.RSS_PARSE_PROCESSES or None)
+            # The processes are only forked on the first submit, start them now on the calling thread. Forked from a
+            # pipeline thread while the others hold a lock, the logging one for instance, a child can deadlock.
+            _pool.submit(int).result()
+        return _pool
+
+
+def shutdown_parse_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+
+def _put(queue, item, stopped):
+    # Wait for room in the queue, giving up if the pipeline is stopped
+    while not stopped.is_set():
+        try:
+            queue.put(item, timeout=0.1)
+            return True
+        except Full:
+            pass
+    return False
+
+
+def _get(queue, stopped):
+    while not stopped.is_set():
+        try:
+            return queue.get(timeout=0.1)
+        except Empty:
+            pass
+    return None
+
+
+def _fetch(outlet, archive):
+    response = download(outlet.rss_url, etag=outlet.etag, modified=outlet.last_modified)
+    if archive is not None and response['body'] is not None:
+        try:
+            archive.store(outlet.id, response['body'])
+        except (IOError, OSError), e:
+            logger.error('Failed to archive "%s": %s' % (outlet.name, e))
+    return response
+
+
+def _failed(error):
+    future = Future()
+    future.set_exception(error)
+    return future
+
+
+def _parse(pool, outlet, response):
+    """
+    :return: Future of the RSSFeed, ready to be handed to check_outlet
+    """
+    future = Future()
+    if response['body'] is None:
+        future.set_result(RSSFeed.from_download(outlet.rss_url, response))
+        return future
+
+    def parsed(parse_future):
+        try:
+            future.set_result(RSSFeed.from_download(outlet.rss_url, response, parse_future.result()))
+        except Exception, e:
+            future.set_exception(e)
+
+    pool.submit(parse_document, outlet.rss_url, response['body']).add_done_callback(parsed)
+    return future
+
+
+def fetch_and_parse(outlets, fetchers, queue_size=None, pool=None):
+    """
+    Download the outlet feeds and parse them in the process pool
+    :param fetchers: Number of threads downloading feeds
+    :param queue_size: Feeds that can wait for the next stage, defaults to settings.RSS_PIPELINE_QUEUE_SIZE
+    :param pool: Executor parsing the feeds, defaults to get_parse_pool()
+    :return: Generator of (outlet, future of its RSSFeed), in the order the feeds finish downloading. The future
+    raises the error of the download or of the parsing if one failed.
+    """
+    outlets = list(outlets)
+    if queue_size is None:
+        queue_size = settings.RSS_PIPELINE_QUEUE_SIZE
+    # Started here, on the caller's thread, before any pipeline thread exists
+    if pool is None:
+        pool = get_parse_pool()
+    return _run_stages(outlets, fetchers, queue_size, pool, get_archive())
+
+
+def _run_stages(outlets, fetchers, queue_size, pool, archive):
+    pending = Queue()
+    for outlet in outlets:
+        pending.put(outlet)
+    fetched = Queue(maxsize=queue_size)
+    parsed = Queue(maxsize=queue_size)
+    stopped = threading.Event()
+
+    def fetch_stage():
+        while not stopped.is_set():
+            try:
+                outlet = pending.get_nowait()
+            except Empty:
+                return
+            try:
+                item = (outlet, _fetch(outlet, archive), None)
+            except Exception, e:
+                item = (outlet, None, e)
+            if not _put(fetched, item, stopped):
+                return
+
+    def parse_stage():
+        for i in range(len(outlets)):
+            item = _get(fetched, stopped)
+            if item is None:
+                return
+            outlet, response, error = item
+            if error is None:
+                try:
+                    future = _parse(pool, outlet, response)
+                except Exception, e:
+                    future = _failed(e)
+            else:
+                future = _failed(error)
+            if not _put(parsed, (outlet, future), stopped):
+                return
+
+    threads = [threading.Thread(target=fetch_stage, name='rss-fetch-%s' % i)
+               for i in range(max(1, min(fetchers, len(outlets))))]
+    threads.append(threading.Thread(target=parse_stage, name='rss-parse'))
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    try:
+        for i in range(len(outlets)):
+            yield _get(parsed, stopped)
+    finally:
+        stopped.set()
+        for thread in threads:
+            thread.join()
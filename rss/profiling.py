@@ -0,0 +1,96 @@
+"""
+Per-request profiling of the rss API, see rss.middleware.QueryProfilingMiddleware.
+"""
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.db import connection
+
+_local = threading.local()
+
+# Literals replaced to group queries that only differ by their parameters, like the N+1 queries of a list
+LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+# SQLite cannot interpolate parameters, Django logs its queries as QUERY = '<sql with %s>' - PARAMS = (...)
+SQLITE_QUERY_RE = re.compile(r"^QUERY = u?(['\"])(.*)\1 - PARAMS = ", re.DOTALL)
+
+
+def _queries_since(index):
+    return list(connection.queries_log)[index:]
+
+
+def _sql_seconds(queries):
+    return sum(float(query['time']) for query in queries)
+
+
+def query_template(sql):
+    match = SQLITE_QUERY_RE.match(sql)
+    if match:
+        return match.group(2)
+    return LITERAL_RE.sub('?', sql)
+
+
+class RequestProfile(object):
+    def __init__(self):
+        self.started = time.time()
+        self.first_query = len(connection.queries_log)
+        self.serialize_seconds = 0.0
+        self.force_debug_cursor = False
+
+    def summary(self):
+        queries = _queries_since(self.first_query)
+        templates = Counter(query_template(query['sql']) for query in queries)
+        return {
+            'queries': len(queries),
+            'sql_seconds': _sql_seconds(queries),
+            'serialize_seconds': self.serialize_seconds,
+            'total_seconds': time.time() - self.started,
+            'duplicates': dict((template, count) for template, count in templates.items() if count > 1)
+        }
+
+
+def start(profile=None):
+    """
+    Make profile, or a new one, the profile of the current thread and record its queries even when DEBUG is off
+    """
+    if profile is None:
+        profile = RequestProfile()
+    profile.force_debug_cursor = connection.force_debug_cursor
+    connection.force_debug_cursor = True
+    _local.profile = profile
+    return profile
+
+
+def finish():
+    """
+    Stop profiling the current thread
+    :return: The summary of the profile, None if there was none
+    """
+    profile = getattr(_local, 'profile', None)
+    if profile is None:
+        return None
+
+    _local.profile = None
+    connection.force_debug_cursor = profile.force_debug_cursor
+    return profile.summary()
+
+
+@contextmanager
+def serializing():
+    """
+    Count the time spent in the block as serialization time of the current request, minus the SQL it runs
+    """
+    profile = getattr(_local, 'profile', None)
+    if profile is None:
+        yield
+        return
+
+    started = time.time()
+    first_query = len(connection.queries_log)
+    try:
+        yield
+    finally:
+        profile.serialize_seconds += max(0, time.time() - started - _sql_seconds(_queries_since(first_query)))
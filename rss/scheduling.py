@@ -0,0 +1,146 @@
+import heapq
+import threading
+import time
+
+# Growth of the poll interval each time a check finds nothing new
+BACKOFF_FACTOR = 1.5
+
+# Number of latest articles used to learn how often an outlet publishes
+CADENCE_HISTORY = 20
+
+
+def learn_interval(pub_dates, min_interval, max_interval):
+    """
+    Median gap, in seconds, between the given publication dates clamped to [min_interval, max_interval].
+    The median keeps a burst of posts or a long holiday from skewing the cadence.
+    :param pub_dates: Latest publication dates of an outlet, newest first
+    :return: The interval or None when there is not enough history
+    """
+    gaps = sorted((newer - older).total_seconds() for newer, older in zip(pub_dates, pub_dates[1:]))
+    if not gaps:
+        return None
+
+    median = gaps[len(gaps) // 2]
+    return int(max(min_interval, min(max_interval, median)))
+
+
+def next_interval(previous, pub_dates, changed, min_interval, max_interval):
+    """
+    Seconds until the next check of an outlet. Checks that bring new articles re-learn the cadence from
+    the publication history, checks that do not back off from the previous interval.
+    """
+    if changed:
+        learned = learn_interval(pub_dates, min_interval, max_interval)
+        if learned is not None:
+            return learned
+        return min_interval
+
+    if previous is None:
+        return min_interval
+    return int(min(max_interval, max(min_interval, previous * BACKOFF_FACTOR)))
+
+
+class OutletScheduler(object):
+    """
+    Priority queue of outlet ids keyed by the time, in seconds since the epoch, of their next check.
+
+    Outlets handed out by pop_due are running until passed to done, they are not handed out again in the meantime
+    so checks of the same outlet never overlap. Rescheduling leaves stale heap entries behind that are skipped
+    when popped.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._scheduled = {}
+        self._running = set()
+        self._recheck = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+
+    def __len__(self):
+        return len(self._scheduled) + len(self._running)
+
+    def __contains__(self, outlet_id):
+        return outlet_id in self._scheduled or outlet_id in self._running
+
+    def scheduled_at(self, outlet_id):
+        return self._scheduled.get(outlet_id)
+
+    def outlet_ids(self):
+        with self._lock:
+            return set(self._scheduled).union(self._running)
+
+    def schedule(self, outlet_id, when):
+        """
+        Set the next check time of an outlet, a running outlet keeps the time given to done instead
+        """
+        with self._lock:
+            if outlet_id in self._running:
+                return
+            self._scheduled[outlet_id] = when
+            heapq.heappush(self._heap, (when, outlet_id))
+        self._wakeup.set()
+
+    def recheck(self, outlet_id):
+        """
+        Check the outlet as soon as possible, right after the current check if it is running
+        """
+        with self._lock:
+            if outlet_id in self._running:
+                self._recheck.add(outlet_id)
+                return
+        self.schedule(outlet_id, time.time())
+
+    def remove(self, outlet_id):
+        with self._lock:
+            self._scheduled.pop(outlet_id, None)
+            self._running.discard(outlet_id)
+            self._recheck.discard(outlet_id)
+
+    def pop_due(self, now=None, limit=None):
+        """
+        :return: The ids of the outlets due at now, most overdue first, with the time each was due at
+        """
+        if now is None:
+            now = time.time()
+
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now and (limit is None or len(due) < limit):
+                when, outlet_id = heapq.heappop(self._heap)
+                if self._scheduled.get(outlet_id) != when:
+                    continue
+                del self._scheduled[outlet_id]
+                self._running.add(outlet_id)
+                due.append((outlet_id, when))
+        return due
+
+    def done(self, outlet_id, when):
+        """
+        Mark the check of a running outlet as finished and schedule its next one
+        """
+        with self._lock:
+            self._running.discard(outlet_id)
+            if outlet_id in self._recheck:
+                self._recheck.discard(outlet_id)
+                when = time.time()
+        self.schedule(outlet_id, when)
+
+    def next_due(self):
+        """
+        :return: The time of the next scheduled check, None if nothing is scheduled
+        """
+        with self._lock:
+            while self._heap and self._scheduled.get(self._heap[0][1]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
+
+    def wait(self, timeout):
+        """
+        Sleep up to timeout seconds, returning early when the schedule changes or wake is called
+        """
+        self._wakeup.wait(timeout)
+        self._wakeup.clear()
+
+    def wake(self):
+        self._wakeup.set()
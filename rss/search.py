@@ -0,0 +1,190 @@
+"""
+Full text search over articles.
+
+Articles are indexed as they are stored: title, summary, content, tag terms and author names go into an
+SQLite FTS5 table (rss_article_fts, rowid = article id) or, on Postgres, into the rss_article.search_vector
+tsvector column covered by a GIN index. Both are created by migration 0005. Other databases fall back to
+LIKE queries.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.utils import dateparse
+
+from .models import Article
+from .pagination import decode_cursor, encode_cursor
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+# Keep IN (...) lists below SQLite's limit of 999 query parameters
+INDEX_BATCH_SIZE = 500
+
+
+def _placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+def _words(search):
+    return WORD_RE.findall(search.lower())
+
+
+class SQLiteSearchBackend(object):
+    index_sql = """
+        INSERT INTO rss_article_fts (rowid, title, summary, content, tags, authors)
+        SELECT a.id, a.title, a.summary, a.content,
+            (SELECT group_concat(t.term, ' ') FROM rss_article_tags at JOIN rss_tag t ON t.id = at.tag_id
+             WHERE at.article_id = a.id),
+            (SELECT group_concat(au.name, ' ') FROM rss_article_authors aa JOIN rss_author au ON au.id = aa.author_id
+             WHERE aa.article_id = a.id)
+        FROM rss_article a WHERE a.id IN (%s)
+    """
+
+    def index(self, article_ids):
+        cursor = connection.cursor()
+        self.remove(article_ids)
+        cursor.execute(self.index_sql % _placeholders(article_ids), article_ids)
+
+    def remove(self, article_ids):
+        cursor = connection.cursor()
+        cursor.execute('DELETE FROM rss_article_fts WHERE rowid IN (%s)' % _placeholders(article_ids), article_ids)
+
+    def search(self, search, limit, page_cursor=None):
+        # Every word must match, as a word prefix, in any of the indexed columns
+        query = ' '.join('"%s"*' % word for word in _words(search))
+        if not query:
+            return [], None
+
+        sql = 'SELECT rowid, rank FROM rss_article_fts WHERE rss_article_fts MATCH %s'
+        params = [query]
+        if page_cursor:
+            rank, article_id = decode_cursor(page_cursor, float, int)
+            sql += ' AND (rank > %s OR (rank = %s AND rowid < %s))'
+            params += [rank, rank, article_id]
+        sql += ' ORDER BY rank, rowid DESC LIMIT %s'
+        params.append(limit + 1)
+
+        cursor = connection.cursor()
+        cursor.execute(sql, params)
+        return _page(cursor.fetchall(), limit)
+
+
+class PostgresSearchBackend(object):
+    index_sql = """
+        UPDATE rss_article a SET search_vector =
+            setweight(to_tsvector('simple', coalesce(a.title, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce(
+                (SELECT string_agg(t.term, ' ') FROM rss_article_tags at JOIN rss_tag t ON t.id = at.tag_id
+                 WHERE at.article_id = a.id), '')), 'B') ||
+            setweight(to_tsvector('simple', coalesce(
+                (SELECT string_agg(au.name, ' ') FROM rss_article_authors aa JOIN rss_author au ON au.id = aa.author_id
+                 WHERE aa.article_id = a.id), '')), 'B') ||
+            setweight(to_tsvector('simple', coalesce(a.summary, '')), 'C') ||
+            setweight(to_tsvector('simple', coalesce(a.content, '')), 'D')
+        WHERE a.id IN (%s)
+    """
+
+    def index(self, article_ids):
+        cursor = connection.cursor()
+        cursor.execute(self.index_sql % _placeholders(article_ids), article_ids)
+
+    def remove(self, article_ids):
+        # The vector lives in the article row and goes away with it
+        pass
+
+    def search(self, search, limit, page_cursor=None):
+        query = ' & '.join('%s:*' % word for word in _words(search))
+        if not query:
+            return [], None
+
+        sql = """
+            SELECT id, rank FROM (
+                SELECT a.id, ts_rank(a.search_vector, q)::float8 AS rank
+                FROM rss_article a, to_tsquery('simple', %s) q WHERE a.search_vector @@ q
+            ) ranked
+        """
+        params = [query]
+        if page_cursor:
+            rank, article_id = decode_cursor(page_cursor, float, int)
+            sql += ' WHERE rank < %s OR (rank = %s AND id < %s)'
+            params += [rank, rank, article_id]
+        sql += ' ORDER BY rank DESC, id DESC LIMIT %s'
+        params.append(limit + 1)
+
+        cursor = connection.cursor()
+        cursor.execute(sql, params)
+        return _page(cursor.fetchall(), limit)
+
+
+class LikeSearchBackend(object):
+    """
+    Unindexed fallback for databases without a supported full text engine, results are not ranked
+    """
+
+    def index(self, article_ids):
+        pass
+
+    def remove(self, article_ids):
+        pass
+
+    def search(self, search, limit, page_cursor=None):
+        search_condition = Q(title__icontains=search) | Q(summary__icontains=search) \
+                           | Q(content__icontains=search) | Q(tags__term__icontains=search) \
+                           | Q(authors__name__icontains=search)
+        queryset = Article.objects.filter(search_condition).distinct().order_by('-pub_date', '-id')
+        if page_cursor:
+            pub_date, article_id = decode_cursor(page_cursor, dateparse.parse_datetime, int)
+            queryset = queryset.filter(Q(pub_date__lte=pub_date), Q(pub_date__lt=pub_date) | Q(id__lt=article_id))
+
+        rows = list(queryset.values_list('id', 'pub_date')[:limit + 1])
+        ids = [article_id for article_id, pub_date in rows[:limit]]
+        if len(rows) > limit:
+            article_id, pub_date = rows[limit - 1]
+            return ids, encode_cursor(pub_date.isoformat(), article_id)
+        return ids, None
+
+
+def _page(rows, limit):
+    ids = [article_id for article_id, rank in rows[:limit]]
+    if len(rows) > limit:
+        article_id, rank = rows[limit - 1]
+        return ids, encode_cursor(repr(rank), article_id)
+    return ids, None
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        if connection.vendor == 'sqlite' and 'rss_article_fts' in connection.introspection.table_names():
+            _backend = SQLiteSearchBackend()
+        elif connection.vendor == 'postgresql':
+            _backend = PostgresSearchBackend()
+        else:
+            _backend = LikeSearchBackend()
+    return _backend
+
+
+def index_articles(article_ids):
+    """
+    (Re)build the search index entries of the given articles
+    """
+    article_ids = list(article_ids)
+    for start in range(0, len(article_ids), INDEX_BATCH_SIZE):
+        get_backend().index(article_ids[start:start + INDEX_BATCH_SIZE])
+
+
+def remove_articles(article_ids):
+    article_ids = list(article_ids)
+    for start in range(0, len(article_ids), INDEX_BATCH_SIZE):
+        get_backend().remove(article_ids[start:start + INDEX_BATCH_SIZE])
+
+
+def search_articles(search, limit, page_cursor=None):
+    """
+    :return: The ids of the matching articles in the page, best match first, and the cursor of the next page
+    :raise ValueError: If the cursor is invalid
+    """
+    return get_backend().search(search, limit, page_cursor)
@@ -0,0 +1,133 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import caching, documents, search, trending
+from .models import Article, Author, Outlet, Tag
+
+
+def touch_articles(article_ids):
+    """
+    Move the validator of the outlets of the articles forward, their documents changed, see rss.conditional
+    """
+    if article_ids:
+        Outlet.objects.filter(id__in=Article.objects.filter(id__in=article_ids).values('outlet_id')) \
+            .update(articles_changed=timezone.now())
+
+
+# Articles saved through the ORM one at a time are indexed and their documents rendered here, the worker's bulk
+# inserts do both themselves. Changed relations and renamed authors or tags also move the validator of the outlets.
+
+@receiver(post_save, sender=Article)
+def index_article(sender, instance, **kwargs):
+    search.index_articles([instance.id])
+    documents.refresh_documents([instance.id])
+
+
+@receiver(post_delete, sender=Article)
+def remove_article(sender, instance, **kwargs):
+    search.remove_articles([instance.id])
+
+
+@receiver(m2m_changed, sender=Article.authors.through)
+@receiver(m2m_changed, sender=Article.tags.through)
+def index_article_relations(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        # Once cleared there is no way to tell which articles were linked
+        instance._cleared_article_ids = list(instance.article_set.values_list('id', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if not reverse:
+            article_ids = [instance.id]
+        elif action == 'post_clear':
+            article_ids = getattr(instance, '_cleared_article_ids', [])
+        else:
+            article_ids = pk_set
+        search.index_articles(article_ids)
+        documents.refresh_documents(article_ids)
+        touch_articles(article_ids)
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Tag)
+def index_renamed(sender, instance, created, **kwargs):
+    if not created:
+        article_ids = list(instance.article_set.values_list('id', flat=True))
+        search.index_articles(article_ids)
+        documents.refresh_documents(article_ids)
+        touch_articles(article_ids)
+
+
+# Tags of articles saved, deleted or linked through the ORM are counted again, the worker counts its own links
+
+@receiver(post_save, sender=Article)
+def count_article_tags(sender, instance, created, **kwargs):
+    # The publication date may have moved the article to another day
+    if not created:
+        trending.recount(instance.tags.values_list('id', flat=True))
+
+
+@receiver(pre_delete, sender=Article)
+def remember_article_tags(sender, instance, **kwargs):
+    # The links are deleted with the article
+    instance._counted_tag_ids = list(instance.tags.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Article)
+def count_deleted_article_tags(sender, instance, **kwargs):
+    trending.recount(getattr(instance, '_counted_tag_ids', []))
+
+
+@receiver(m2m_changed, sender=Article.tags.through)
+def count_article_relations(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse and action == 'pre_clear':
+        instance._cleared_tag_ids = list(instance.tags.values_list('id', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if reverse:
+            tag_ids = [instance.id]
+        elif action == 'post_clear':
+            tag_ids = getattr(instance, '_cleared_tag_ids', [])
+        else:
+            tag_ids = pk_set
+        trending.recount(tag_ids)
+
+
+# Any change made through the ORM expires the cached API responses that may include it
+
+@receiver(post_save, sender=Outlet)
+@receiver(post_delete, sender=Outlet)
+def invalidate_outlet(sender, instance, update_fields=None, **kwargs):
+    # The worker storing new HTTP validators does not change what the API serves
+    if update_fields and set(update_fields) <= {'etag', 'last_modified'}:
+        return
+    caching.invalidate(instance.id)
+
+
+@receiver(post_save, sender=Article)
+@receiver(post_delete, sender=Article)
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+def invalidate_outlet_data(sender, instance, **kwargs):
+    caching.invalidate(instance.outlet_id)
+
+
+@receiver(m2m_changed, sender=Article.authors.through)
+@receiver(m2m_changed, sender=Article.tags.through)
+def invalidate_article_relations(sender, instance, action, reverse, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        if reverse:
+            caching.invalidate_all()
+        else:
+            caching.invalidate(instance.outlet_id)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tag(sender, instance, **kwargs):
+    caching.invalidate_all()
+
+
+@receiver(post_save, sender=Article)
+@receiver(post_delete, sender=Article)
+def touch_outlet_articles(sender, instance, **kwargs):
+    # Changes the validator of the article list responses, see rss.conditional
+    Outlet.objects.filter(pk=instance.outlet_id).update(articles_changed=timezone.now())
@@ -0,0 +1,370 @@
+"""
+Incremental RSS 2.0 parser.
+
+StreamingRSSFeed downloads the feed body when it is opened, on the thread fetching it, and then parses it with
+iterparse as entries are asked for, yielding them one at a time and dropping each item element once it is converted,
+so the parsed tree does not grow with the size of the feed. It can stop parsing as soon as it reaches entries older
+than the outlet's newest article.
+
+The response itself is not streamed: the raw body is held in memory until the feed is closed, like RSSFeed does. The
+download then finishes on the fetching thread instead of holding the connection open while the entries are stored,
+and the fallback below parses the same body instead of downloading the feed a second time. What stays bounded is the
+parsed tree, which takes several times the size of the body, not the body.
+
+Entries have the same shape as the ones of RSSFeed. Dates are parsed and HTML is sanitized with feedparser's own
+helpers so both parsers store identical articles. Documents iterparse cannot handle (malformed XML, which feedparser
+tolerates, or other formats) are handed over to RSSFeed.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+import datetime
+import os
+import re
+import time
+import urllib2
+import zlib
+from StringIO import StringIO
+from urlparse import urlparse
+from xml.etree import cElementTree as ElementTree
+
+import feedparser
+from django.utils import timezone
+
+from .feed import RSSFeed
+
+CONTENT_NS = '{http://purl.org/rss/1.0/modules/content/}'
+DC_NS = '{http://purl.org/dc/elements/1.1/}'
+
+# "john@example.org (John Doe)", feedparser keeps the name only
+AUTHOR_EMAIL_RE = re.compile(r'^\s*\S+@\S+\s*\((.+)\)\s*$')
+
+CHUNK_SIZE = 64 * 1024
+
+# Entries older than since skipped in a row before the parser stops, tolerates feeds that are not perfectly sorted
+OLD_ENTRIES_BEFORE_STOP = 3
+
+
+class _Reader(object):
+    """
+    File-like wrapper of a response, gunzipping it as it is read and timing the reads
+    """
+
+    def __init__(self, stream, gzipped=False, seconds=0):
+        self.stream = stream
+        self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if gzipped else None
+        self.buffer = ''
+        self.seconds = seconds
+
+    def read(self, size=CHUNK_SIZE):
+        started = time.time()
+        try:
+            if self.decompressor is None:
+                return self.stream.read(size)
+
+            while len(self.buffer) < size:
+                chunk = self.stream.read(CHUNK_SIZE)
+                if not chunk:
+                    self.buffer += self.decompressor.flush()
+                    break
+                self.buffer += self.decompressor.decompress(chunk)
+            data, self.buffer = self.buffer[:size], self.buffer[size:]
+            return data
+        finally:
+            self.seconds += time.time() - started
+
+    def close(self):
+        self.stream.close()
+
+
+class _NotRSS(Exception):
+    pass
+
+
+def _date(value):
+    parsed = feedparser._parse_date(value) if value else None
+    if parsed is None:
+        return None
+    return datetime.datetime(*parsed[:6], tzinfo=timezone.utc)
+
+
+def _html(value):
+    if value is None:
+        return None
+    return feedparser._sanitizeHTML(value, 'utf-8', u'text/html')
+
+
+def _text(element, tag):
+    child = element.find(tag)
+    if child is None or child.text is None:
+        return None
+    return unicode(child.text.strip())
+
+
+def _texts(element, tags):
+    """
+    Text of the children with any of the given tags, in document order
+    """
+    return [unicode(child.text.strip()) for child in element
+            if child.tag in tags and child.text and child.text.strip()]
+
+
+def _author_name(value):
+    match = AUTHOR_EMAIL_RE.match(value)
+    return match.group(1).strip() if match else value.strip()
+
+
+class StreamingRSSFeed(RSSFeed):
+    """
+    Drop-in replacement of RSSFeed parsing entries incrementally, see iter_entries_info
+    """
+
+    def __init__(self, feed_url, etag=None, modified=None, document=None, keep_raw=False):
+        RSSFeed.__init__(self, feed_url, etag=etag, modified=modified, document=document, keep_raw=keep_raw)
+        self._reader = None
+        self._read_seconds = 0
+        self._events = None
+        self._channel = None
+        self._fallback = None
+        # Body as downloaded, parsed again by RSSFeed if iterparse cannot handle it
+        self._body = None
+
+    def _open(self):
+        """
+        Download the whole feed body, the entries are parsed from memory later on
+        :return: A file-like object reading the feed body, None when the server answered 304 Not Modified
+        """
+        feed_data = {'status': 200, 'etag': self.etag, 'modified': self.modified}
+        read_seconds = 0
+        if self.document is not None:
+            body = self.document
+        elif urlparse(self.feed_url).scheme in ('http', 'https', 'file'):
+            request = urllib2.Request(self.feed_url, headers={'User-Agent': feedparser.USER_AGENT,
+                                                              'Accept': feedparser.ACCEPT_HEADER,
+                                                              'Accept-Encoding': 'gzip'})
+            if self.etag:
+                request.add_header('If-None-Match', self.etag)
+            if self.modified:
+                request.add_header('If-Modified-Since', self.modified)
+
+            opened = time.time()
+            try:
+                response = urllib2.urlopen(request)
+            except urllib2.HTTPError, e:
+                if e.code == 304:
+                    self.feed_data = dict(feed_data, status=304)
+                    return None
+                raise ValueError('Failed to fetch feed, the server answered %s.' % e.code)
+
+            headers = response.info()
+            self.feed_data = dict(feed_data, status=getattr(response, 'code', 200),
+                                  etag=headers.get('etag', self.etag),
+                                  modified=headers.get('last-modified', self.modified))
+            reader = _Reader(response, headers.get('content-encoding') == 'gzip', seconds=time.time() - opened)
+            try:
+                body = ''.join(iter(reader.read, ''))
+            finally:
+                reader.close()
+            read_seconds = reader.seconds
+        elif os.path.exists(self.feed_url):
+            with open(self.feed_url, 'rb') as feed_file:
+                body = feed_file.read()
+        else:
+            body = self.feed_url
+
+        if isinstance(body, unicode):
+            body = body.encode('utf-8')
+        self._body = body
+        if self.keep_raw:
+            self.raw = body
+        self.feed_data = self.feed_data or feed_data
+        return _Reader(StringIO(body), seconds=read_seconds)
+
+    def _parse_feed_data(self):
+        """
+        Open the feed and read the channel up to its first item
+        """
+        if self.feed_data is not None or self._fallback is not None:
+            return
+
+        started = time.time()
+        try:
+            self._reader = self._open()
+            if self._reader is not None:
+                self._events = ElementTree.iterparse(self._reader, events=('start', 'end'))
+                self.channel_info = self._read_channel()
+        except (SyntaxError, _NotRSS), e:
+            self._use_fallback(e)
+        except ValueError:
+            raise
+        except Exception, e:
+            logger.error(e)
+            raise ValueError('Failed to parse data from url, is it a valid RSS feed url?')
+        finally:
+            self._add_timings(time.time() - started)
+
+    def _add_timings(self, elapsed):
+        # Time spent reading the response since the last call is fetch time, the rest is parse time
+        read_seconds = self._reader.seconds if self._reader is not None else 0
+        self.fetch_seconds += read_seconds - self._read_seconds
+        self.parse_seconds += elapsed - (read_seconds - self._read_seconds)
+        self._read_seconds = read_seconds
+
+    def _use_fallback(self, error):
+        logger.info('Streaming parser cannot handle "%.100s" (%s), using feedparser.' % (self.feed_url, error))
+        self._close()
+        # Parse the body already downloaded, with the validators the server sent along with it
+        validators = self.feed_data or {}
+        self._fallback = RSSFeed(self.feed_url, etag=validators.get('etag', self.etag),
+                                 modified=validators.get('modified', self.modified), document=self._body,
+                                 keep_raw=self.keep_raw)
+        self.feed_data = None
+        self._fallback.get_channel_info()
+        self.raw = self._fallback.raw
+        self.fetch_seconds += self._fallback.fetch_seconds
+        self.parse_seconds += self._fallback.parse_seconds
+
+    def _close(self):
+        if self._reader is not None:
+            self._reader.close()
+        self._events = None
+
+    def _read_channel(self):
+        path = []
+        fields = {}
+        for event, element in self._events:
+            if event == 'start':
+                path.append(element.tag)
+                if len(path) == 1 and element.tag != 'rss':
+                    raise _NotRSS('Root element is %s' % element.tag)
+                if len(path) == 2 and element.tag == 'channel':
+                    self._channel = element
+                if path[1:] == ['channel', 'item']:
+                    # The item is parsed by iter_entries_info, which picks up from its end event
+                    break
+            else:
+                if len(path) == 3 and path[1] == 'channel':
+                    fields[element.tag] = element.text.strip() if element.text else None
+                path.pop()
+
+        if self._channel is None:
+            raise _NotRSS('No channel element')
+
+        updated = fields.get('lastBuildDate') or fields.get('pubDate')
+        return {
+            'title': fields.get('title'),
+            'subtitle': _html(fields.get('description')),
+            'url': fields.get('link'),
+            'language': fields.get('language'),
+            'updated': _date(updated),
+            'rss_url': self.feed_url
+        }
+
+    def _entry_info(self, item):
+        pub_date = _date(_text(item, 'pubDate') or _text(item, DC_NS + 'date'))
+        if pub_date is None:
+            logger.warning('Skipping entry without publication date: %s' % _text(item, 'link'))
+            return None
+
+        url = _text(item, 'link')
+        guid = item.find('guid')
+        if not url and guid is not None and guid.text and guid.get('isPermaLink', 'true') != 'false':
+            url = unicode(guid.text.strip())
+
+        content = _html(_text(item, CONTENT_NS + 'encoded'))
+        summary = _html(_text(item, 'description'))
+
+        return {
+            'entry_info': {
+                # feedparser gives an empty title to items without one
+                'title': _text(item, 'title') or u'',
+                # feedparser falls back to the content too
+                'summary': summary if summary is not None else content,
+                'url': url,
+                'pub_date': pub_date,
+                'content': content,
+            },
+            'authors': [_author_name(author) for author in _texts(item, ('author', DC_NS + 'creator'))],
+            'tags': _texts(item, ('category', DC_NS + 'subject'))
+        }
+
+    def is_modified(self):
+        self._parse_feed_data()
+        if self._fallback is not None:
+            return self._fallback.is_modified()
+        return RSSFeed.is_modified(self)
+
+    def get_validators(self):
+        self._parse_feed_data()
+        if self._fallback is not None:
+            return self._fallback.get_validators()
+        return RSSFeed.get_validators(self)
+
+    def get_channel_info(self):
+        self._parse_feed_data()
+        if self._fallback is not None:
+            return self._fallback.get_channel_info()
+        if self.channel_info is None:
+            raise ValueError('Feed was not modified, there is no channel information.')
+        return self.channel_info
+
+    def get_entries_info(self):
+        if self.entries is None:
+            self.entries = list(self.iter_entries_info())
+        return self.entries
+
+    def iter_entries_info(self, since=None):
+        """
+        Generator of the feed entries. The document is read as the generator advances and can only be read once,
+        use get_entries_info to keep the entries around.
+        :param since: Skip entries published before this datetime, parsing stops after a few of them in a row
+        since feeds list their newest entries first
+        """
+        self._parse_feed_data()
+        if self.entries is not None:
+            for entry_info in RSSFeed.iter_entries_info(self, since):
+                yield entry_info
+            return
+        if self._fallback is not None:
+            for entry_info in self._fallback.iter_entries_info(since):
+                yield entry_info
+            return
+        if self._events is None:
+            return
+
+        seen = set()
+        old_in_row = 0
+        started = time.time()
+        try:
+            for event, element in self._events:
+                if event != 'end' or element.tag != 'item':
+                    continue
+
+                entry_info = self._entry_info(element)
+                # Drop the converted item so the tree never grows
+                self._channel.remove(element)
+                if entry_info is None:
+                    continue
+
+                if since is not None and entry_info['entry_info']['pub_date'] < since:
+                    old_in_row += 1
+                    if old_in_row >= OLD_ENTRIES_BEFORE_STOP:
+                        break
+                    continue
+                old_in_row = 0
+
+                seen.add(entry_info['entry_info']['url'])
+                self._add_timings(time.time() - started)
+                yield entry_info
+                started = time.time()
+        except SyntaxError, e:
+            # Malformed XML after the first entries, let feedparser handle the rest
+            self._use_fallback(e)
+            for entry_info in self._fallback.iter_entries_info(since):
+                if entry_info['entry_info']['url'] not in seen:
+                    yield entry_info
+        finally:
+            if self._fallback is None:
+                self._add_timings(time.time() - started)
+            self._close()
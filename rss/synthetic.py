@@ -0,0 +1,107 @@
+"""
+Synthetic feeds for benchmarks and tests.
+
+Entries are numbered: entry n always gets the same url, title, date, authors and tags, so two passes that share
+entry numbers overlap exactly like two fetches of a real feed do.
+"""
+import datetime
+import random
+from xml.sax.saxutils import escape
+
+from django.utils import timezone
+
+EPOCH = datetime.datetime(2002, 9, 5, tzinfo=timezone.utc)
+
+RSS_DATE_FORMAT = '%a, %d %b %Y %H:%M:%S GMT'
+ATOM_DATE_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+WORDS = ['lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur', 'adipiscing', 'elit', 'sed', 'do', 'eiusmod',
+         'tempor', 'incididunt', 'ut', 'labore', 'et', 'dolore', 'magna', 'aliqua', 'enim', 'minim', 'veniam']
+
+
+def pass_entry_ids(pass_number, entry_count, overlap):
+    """
+    Entry numbers of the given pass, sharing overlap entries with the previous pass
+    """
+    if not 0 <= overlap < entry_count:
+        raise ValueError('Overlap must be between 0 and the number of entries minus 1')
+    start = pass_number * (entry_count - overlap)
+    return range(start, start + entry_count)
+
+
+def entry_date(entry_id):
+    return EPOCH + datetime.timedelta(minutes=entry_id)
+
+
+def _text(random_generator, words):
+    return ' '.join(random_generator.choice(WORDS) for i in range(words))
+
+
+def _entry(entry_id, tag_count, author_count, tags_per_entry, authors_per_entry, summary_words):
+    # Seeded per entry so an entry reads the same in every pass
+    random_generator = random.Random(entry_id)
+    return {
+        'id': entry_id,
+        'title': 'Entry %s %s' % (entry_id, _text(random_generator, 4)),
+        'summary': _text(random_generator, summary_words),
+        'date': entry_date(entry_id),
+        'authors': ['Author %s' % ((entry_id + i) % author_count) for i in range(min(authors_per_entry, author_count))],
+        'tags': ['Tag %s' % ((entry_id * 7 + i) % tag_count) for i in range(min(tags_per_entry, tag_count))],
+    }
+
+
+def generate_feed(entry_ids, fmt='rss', tag_count=50, author_count=10, tags_per_entry=3, authors_per_entry=1,
+                  summary_words=60, domain='synthetic.example.org', updated=None):
+    """
+    Build a feed document with one entry per id, newest first
+    :param fmt: 'rss' for RSS 2.0 or 'atom' for Atom 1.0
+    :param tag_count: Number of distinct tags entries draw from
+    :param author_count: Number of distinct authors entries draw from
+    :param updated: Channel updated datetime, defaults to the date of the newest entry
+    :return: The document as a utf-8 encoded string
+    """
+    if fmt not in ('rss', 'atom'):
+        raise ValueError('Unknown feed format "%s"' % fmt)
+
+    entries = [_entry(entry_id, tag_count, author_count, tags_per_entry, authors_per_entry, summary_words)
+               for entry_id in sorted(entry_ids, reverse=True)]
+    if updated is None:
+        updated = entries[0]['date'] if entries else EPOCH
+
+    if fmt == 'rss':
+        document = _rss(entries, domain, updated)
+    else:
+        document = _atom(entries, domain, updated)
+    return document.encode('utf-8')
+
+
+def _rss(entries, domain, updated):
+    items = []
+    for entry in entries:
+        items.append(
+            '<item><title>%s</title><link>http://%s/entry/%s</link><description>%s</description>'
+            '<pubDate>%s</pubDate>%s%s</item>' % (
+                escape(entry['title']), domain, entry['id'], escape(entry['summary']),
+                entry['date'].strftime(RSS_DATE_FORMAT),
+                ''.join('<author>%s</author>' % escape(author) for author in entry['authors']),
+                ''.join('<category>%s</category>' % escape(tag) for tag in entry['tags'])))
+
+    return (u'<?xml version="1.0" encoding="utf-8"?>\n<rss version="2.0"><channel>'
+            u'<title>Synthetic Feed</title><link>http://%s/</link><description>Synthetic feed</description>'
+            u'<pubDate>%s</pubDate>%s</channel></rss>' % (domain, updated.strftime(RSS_DATE_FORMAT), ''.join(items)))
+
+
+def _atom(entries, domain, updated):
+    items = []
+    for entry in entries:
+        items.append(
+            '<entry><title>%s</title><link href="http://%s/entry/%s"/><id>http://%s/entry/%s</id>'
+            '<summary>%s</summary><published>%s</published><updated>%s</updated>%s%s</entry>' % (
+                escape(entry['title']), domain, entry['id'], domain, entry['id'], escape(entry['summary']),
+                entry['date'].strftime(ATOM_DATE_FORMAT), entry['date'].strftime(ATOM_DATE_FORMAT),
+                ''.join('<author><name>%s</name></author>' % escape(author) for author in entry['authors']),
+                ''.join('<category term="%s"/>' % escape(tag) for tag in entry['tags'])))
+
+    return (u'<?xml version="1.0" encoding="utf-8"?>\n<feed xmlns="http://www.w3.org/2005/Atom">'
+            u'<title>Synthetic Feed</title><link href="http://%s/"/><id>http://%s/</id>'
+            u'<updated>%s</updated>%s</feed>' % (domain, domain, updated.strftime(ATOM_DATE_FORMAT), ''.join(items)))
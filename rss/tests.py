@@ -1,14 +1,46 @@
 import datetime
+import gzip
 import json
+import shutil
+import tempfile
+import threading
+import time
+import urllib2
+from StringIO import StringIO
 
+from unittest import skipUnless
+
+from django.db import IntegrityError, connection, transaction
+from django.http import Http404
 from django.utils import timezone, dateparse
 from django.test import TestCase, RequestFactory
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import call_command
+from django.test.utils import CaptureQueriesContext, override_settings
+
+import feedparser
 
 from rss import views
 
-from rss.feed import RSSFeed
-from rss.models import Article, Author, Outlet, Tag
-from rss.worker import run as worker_run
+from rss import feed as rss_feed
+from rss import caching, documents, encoding, leasing, metrics, pipeline, profiling, trending
+from rss.admin import OutletAdmin
+from rss.middleware import QueryProfilingMiddleware
+from rss.opml import HostLimiter, import_opml, parse_opml
+from rss.archive import FeedArchive
+from rss.benchmark import benchmark_ingest
+from rss.feed import RSSFeed, RawBodyHandler, download, parse_document
+from rss.lru import LRUCache
+from rss.pagination import _after
+from rss.scheduling import OutletScheduler, learn_interval, next_interval
+from rss.streaming import StreamingRSSFeed, _Reader
+from rss.synthetic import entry_date, generate_feed, pass_entry_ids
+from rss.models import Article, Author, Outlet, Tag, TagDailyCount
+from rss import worker
+from rss.worker import (INGEST_QUERY_BUDGET, LeasedWorker, Worker, check_new_outlet, check_outlet, clear_caches,
+                        fetch_outlet, run as worker_run)
 
 
 # Create your tests here.
@@ -285,13 +317,162 @@ class RestAPITestCase(TestCase):
             # Articles search should search in articles authors
             ([self.article2.__data__(), self.article1.__data__()], 'author1'),
             ([self.article1.__data__()], 'author2'),
-            ([self.article2.__data__(), self.article1.__data__()], 'author')
+            # Results are ranked, article1 matches both of its authors
+            ([self.article1.__data__(), self.article2.__data__()], 'author'),
+
+            # Every word of the search must match
+            ([self.article1.__data__()], 'title summary1'),
         ]
 
         for expected, term in test_tuples:
             self.article_search_test(expected, term)
 
 
+    def test_articles_pagination(self):
+        for i in range(3, 8):
+            self.outlet1.article_set.add(Article(title='Title%s' % i, summary='Summary', url='http://example.com/%s' % i,
+                                                 pub_date=datetime.datetime(2002, 9, 7, 0, 1, 1, tzinfo=timezone.utc)))
+        expected = list(Article.objects.order_by('-pub_date', '-id').values_list('id', flat=True))
+
+        ids = []
+        url = '/rss/articles/?limit=3'
+        while url:
+            response = views.all_articles(self.factory.get(url))
+            self.assertEqual(response.status_code, 200)
+            page = parse(response.content, 'date')
+            self.assertLessEqual(len(page), 3)
+            ids.extend(article['id'] for article in page)
+
+            url = response.get('Link')
+            if url:
+                url = url[1:url.index('>')]
+
+        # Articles sharing a publication date are neither repeated nor skipped across pages
+        self.assertEqual(ids, expected)
+
+    def test_articles_constant_queries(self):
+        # Validator and page of stored documents, plus the index lookup for search
+        requests = [
+            (views.all_articles, '/rss/articles/', [], 2),
+            (views.articles, '/rss/outlets/1/articles/', [self.outlet1.id], 2),
+            (views.articles_by_tag, '/rss/tags/Tag1/articles/', ['Tag1'], 2),
+            (views.articles_search, '/rss/articles/search/title/', ['title'], 3),
+        ]
+
+        def assert_queries():
+            for view, url, args, queries in requests:
+                with self.assertNumQueries(queries):
+                    view(self.factory.get(url), *args)
+
+        assert_queries()
+
+        for i in range(3, 13):
+            article = Article(title='Title%s' % i, summary='Summary', url='http://example.com/%s' % i,
+                              pub_date=datetime.datetime(2002, 9, 7, 0, 1, 1, tzinfo=timezone.utc))
+            self.outlet1.article_set.add(article)
+            article.authors.add(self.author1, self.author2)
+            article.tags.add(self.tag1, self.tag2)
+
+        assert_queries()
+
+    def test_response_cache(self):
+        use_shared_cache(self)
+        clear_caches()
+        request = self.factory.get('/rss/outlets/1/articles/')
+        response = views.articles(request, self.outlet1.id)
+
+        with self.assertNumQueries(0):
+            cached = views.articles(request, self.outlet1.id)
+        self.assertEqual(cached.content, response.content)
+
+        # Ingesting another outlet keeps this outlet's responses, list views across outlets are expired
+        self.outlet2.rss_url = RSSFeedTestCase.valid_rss
+        self.outlet2.updated = None
+        check_outlet(self.outlet2)
+        with self.assertNumQueries(0):
+            views.articles(request, self.outlet1.id)
+        self.assertEqual(len(json.loads(views.all_articles(self.factory.get('/rss/articles/')).content)), 3)
+
+        self.outlet1.rss_url = RSSFeedTestCase.valid_rss.replace('example.org', 'example3.org')
+        check_outlet(self.outlet1)
+        self.assertEqual(len(json.loads(views.articles(request, self.outlet1.id).content)), 3)
+
+        # Shared data such as tag terms expires every response
+        self.tag1.term = 'Renamed'
+        self.tag1.save()
+        self.assertIn('Renamed', views.article(self.factory.get('/rss/outlets/1/articles/1/'), self.outlet1.id,
+                                               self.article1.id).content)
+
+    def test_shared_cache(self):
+        use_shared_cache(self)
+        request = self.factory.get('/rss/outlets/1/articles/')
+        views.articles(request, self.outlet1.id)
+        with self.assertNumQueries(0):
+            views.articles(request, self.outlet1.id)
+
+        # The worker process invalidates through its own cache instance, each thread gets one too
+        thread = threading.Thread(target=caching.invalidate, args=(self.outlet1.id,))
+        thread.start()
+        thread.join()
+        with self.assertNumQueries(1):
+            views.articles(request, self.outlet1.id)
+
+    def test_shared_cache_check(self):
+        self.assertEqual(caching.check_shared_cache(), [])
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.assertEqual([error.id for error in caching.check_shared_cache()], ['rss.E001'])
+
+    @override_settings(RSS_STREAM_BATCH_SIZE=2)
+    def test_articles_streaming(self):
+        for i in range(3, 8):
+            self.outlet1.article_set.add(Article(title='Title%s' % i, summary='Summary', url='http://example.com/%s' % i,
+                                                 pub_date=datetime.datetime(2002, 9, 7, 0, 1, 1, tzinfo=timezone.utc)))
+
+        expected = views.all_articles(self.factory.get('/rss/articles/')).content
+
+        response = views.all_articles(self.factory.get('/rss/articles/?stream=1'))
+        self.assertTrue(response.streaming)
+        # One query for each of the 4 batches, served from the stored documents, the short last batch ends the stream
+        with self.assertNumQueries(4):
+            self.assertEqual(''.join(response.streaming_content), expected)
+
+        response = views.all_articles(self.factory.get('/rss/articles/?stream=1&cursor=invalid'))
+        self.assertEqual(response.status_code, 400)
+
+    def test_articles_pagination_invalid(self):
+        for query in ['limit=0', 'limit=a', 'cursor=invalid']:
+            response = views.all_articles(self.factory.get('/rss/articles/?%s' % query))
+            self.assertEqual(response.status_code, 400)
+
+    def test_articles_search_pagination(self):
+        for i in range(3, 8):
+            self.outlet1.article_set.add(Article(title='Title%s' % i, summary='Summary', url='http://example.com/%s' % i,
+                                                 pub_date=datetime.datetime(2002, 9, 7, 0, 1, 1, tzinfo=timezone.utc)))
+
+        ids = []
+        url = '/rss/articles/search/title/?limit=2'
+        while url:
+            response = views.articles_search(self.factory.get(url), 'title')
+            self.assertEqual(response.status_code, 200)
+            ids.extend(article['id'] for article in parse(response.content, 'date'))
+            url = response.get('Link')
+            if url:
+                url = url[1:url.index('>')]
+
+        self.assertEqual(sorted(ids), sorted(Article.objects.values_list('id', flat=True)))
+
+    def test_articles_search_index_updates(self):
+        self.article1.title = 'Renamed'
+        self.article1.save()
+        self.tag2.term = 'Other'
+        self.tag2.save()
+
+        self.article_search_test([self.article1.__data__()], 'renamed')
+        self.article_search_test([self.article2.__data__()], 'other')
+
+        self.article1.delete()
+        self.assertRaises(Http404, views.articles_search, self.factory.get('/rss/articles/search/renamed/'), 'renamed')
+
     def article_search_test(self, expected, term):
         endpoint = '/rss/articles/search/%s/' % term
         response = views.articles_search(self.factory.get(endpoint), term)
@@ -303,8 +484,171 @@ class RestAPITestCase(TestCase):
         self.assertEqual(deserialized_data, expected)
 
 
+    def test_conditional_get(self):
+        response = self.client.get('/rss/outlets/%s/articles/' % self.outlet1.id)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+
+        # An unchanged list costs the validator query only
+        with self.assertNumQueries(1):
+            response = self.client.get('/rss/outlets/%s/articles/' % self.outlet1.id, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, '')
+
+        # Other pages and lists have their own ETag
+        self.assertNotEqual(self.client.get('/rss/articles/')['ETag'], etag)
+        self.assertEqual(self.client.get('/rss/outlets/%s/articles/?limit=1' % self.outlet1.id,
+                                         HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        all_etag = self.client.get('/rss/articles/')['ETag']
+        self.assertEqual(self.client.get('/rss/articles/', HTTP_IF_NONE_MATCH=all_etag).status_code, 304)
+
+        # A stored article changes the validators of its outlet and of the lists across outlets
+        article = Article(title='New', summary='Summary', url='http://example.com/new',
+                          pub_date=datetime.datetime(2002, 9, 8, tzinfo=timezone.utc))
+        self.outlet1.article_set.add(article)
+        self.assertEqual(self.client.get('/rss/outlets/%s/articles/' % self.outlet1.id,
+                                         HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.client.get('/rss/articles/', HTTP_IF_NONE_MATCH=all_etag).status_code, 200)
+
+    def test_conditional_get_relations(self):
+        url = '/rss/outlets/%s/articles/' % self.outlet1.id
+
+        # Renamed tags and authors and changed links all change the documents served
+        changes = [lambda: self.article1.tags.remove(self.tag1), lambda: self.tag2.article_set.add(self.article1),
+                   lambda: self.article1.authors.clear()]
+        self.tag2.term = 'Renamed'
+        self.author1.name = 'Renamed'
+        changes += [self.tag2.save, self.author1.save]
+
+        for change in changes:
+            etag = self.client.get(url)['ETag']
+            time.sleep(0.001)
+            change()
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+
+    def test_cached_body_matches_etag(self):
+        use_shared_cache(self)
+        url = '/rss/outlets/%s/articles/' % self.outlet1.id
+        etag = self.client.get(url)['ETag']
+
+        # Changed without expiring the response cache, like a worker whose invalidation never arrived
+        Article.objects.filter(pk=self.article1.pk).update(title='Changed', document=None)
+        Outlet.objects.filter(pk=self.outlet1.pk).update(articles_changed=timezone.now())
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn('Changed', response.content)
+
+    def test_sparse_fields(self):
+        request = self.factory.get('/rss/articles/', {'fields': 'id,title,date'})
+        with CaptureQueriesContext(connection) as queries:
+            response = views.all_articles(request)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(parse(response.content), [
+            {'id': self.article2.id, 'title': 'Title2', 'date': '2002-09-07T00:01:01Z'},
+            {'id': self.article1.id, 'title': 'Title1', 'date': '2002-09-07T00:00:01Z'}
+        ])
+        # Validator and page only, neither the text columns nor the relations are read
+        self.assertEqual(len(queries), 2)
+        self.assertNotIn('content', queries[1]['sql'])
+        self.assertNotIn('summary', queries[1]['sql'])
+
+        response = views.articles(self.factory.get('/rss/outlets/1/articles/', {'fields': 'url,tags', 'stream': 1}),
+                                  self.outlet1.id)
+        self.assertEqual(parse(''.join(response.streaming_content))[0],
+                         {'url': 'http://example.com/articles/2', 'tags': ['Tag2']})
+
+        response = views.articles_search(self.factory.get('/rss/articles/search/title/', {'fields': 'title'}), 'title')
+        self.assertEqual(sorted(parse(response.content)), [{'title': 'Title1'}, {'title': 'Title2'}])
+
+        response = views.all_articles(self.factory.get('/rss/articles/', {'fields': 'title,body'}))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(parse(response.content), {'error': 'Unknown field(s): body.'})
+
+    def test_gzip(self):
+        for i in range(3, 30):
+            Article.objects.create(outlet=self.outlet1, title='Title%s' % i, summary='Summary ' * 50,
+                                   url='http://example.com/articles/%s' % i,
+                                   pub_date=datetime.datetime(2002, 9, 8, 0, 0, i, tzinfo=timezone.utc))
+
+        plain = self.client.get('/rss/articles/')
+        compressed = self.client.get('/rss/articles/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertLess(len(compressed.content), len(plain.content) / 10)
+        self.assertEqual(gzip.GzipFile(fileobj=StringIO(compressed.content)).read(), plain.content)
+
+        # The ETag of the compressed response validates it too
+        response = self.client.get('/rss/articles/', HTTP_ACCEPT_ENCODING='gzip',
+                                   HTTP_IF_NONE_MATCH=compressed['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        # Only the article views are compressed
+        for i in range(30):
+            Outlet.objects.create(name='Outlet %s' % i, url='http://example.org/%s' % i, rss_url='Description ' * 20)
+        self.assertNotIn('Content-Encoding', self.client.get('/rss/outlets/', HTTP_ACCEPT_ENCODING='gzip'))
+
+    def test_negotiate_json(self):
+        request = self.factory.get('/rss/articles/', HTTP_ACCEPT='application/msgpack')
+        if encoding.msgpack is None:
+            # Without the msgpack package clients get JSON
+            self.assertEqual(encoding.negotiate(request), 'json')
+            self.assertEqual(views.all_articles(request)['Content-Type'], 'application/json')
+        self.assertEqual(encoding.negotiate(self.factory.get('/rss/articles/')), 'json')
+
+    @skipUnless(encoding.msgpack, 'msgpack is not installed')
+    def test_msgpack(self):
+        json_response = views.all_articles(self.factory.get('/rss/articles/', {'fields': 'id,date'}))
+        response = views.all_articles(self.factory.get('/rss/articles/', {'fields': 'id,date'},
+                                                       HTTP_ACCEPT='application/msgpack'))
+
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertIn('Accept', response['Vary'])
+        self.assertEqual(encoding.msgpack.unpackb(response.content, encoding='utf-8'),
+                         json.loads(json_response.content))
+        self.assertLess(len(response.content), len(json_response.content))
+
+    @override_settings(RSS_PROFILING=True)
+    def test_profiling_headers(self):
+        response = self.client.get('/rss/articles/')
+        self.assertEqual(response['X-Query-Count'], '2')
+        self.assertEqual(response['X-Query-Duplicates'], '0')
+        self.assertRegexpMatches(response['Server-Timing'],
+                                 r'^db;dur=[\d.]+;desc="2 queries", serialize;dur=[\d.]+, total;dur=[\d.]+$')
+        self.assertFalse(connection.force_debug_cursor)
+
+        # Only the API is profiled
+        self.assertNotIn('Server-Timing', self.client.get('/static/missing.css'))
+
+    @override_settings(RSS_PROFILING=True, RSS_PROFILING_SAMPLE_RATE=1)
+    def test_profiling_streaming(self):
+        response = self.client.get('/rss/articles/?stream=1')
+        self.assertIn('Server-Timing', response)
+        self.assertEqual(len(json.loads(''.join(response.streaming_content))), 2)
+        self.assertFalse(connection.force_debug_cursor)
+
+    def test_profiling_duplicates(self):
+        profiling.start()
+        for article in Article.objects.all():
+            article.__data__()
+        summary = profiling.finish()
+
+        self.assertEqual(summary['queries'], 5)
+        self.assertEqual(sorted(summary['duplicates'].values()), [2, 2])
+        self.assertIsNone(profiling.finish())
+
+    def test_profiling_disabled(self):
+        self.assertRaises(MiddlewareNotUsed, QueryProfilingMiddleware)
+
+
 class WorkerTestCase(TestCase):
     def setUp(self):
+        clear_caches()
         self.valid_outlet = Outlet.objects.create(name='Sample Feed', description='For documentation <em>only</em>',
                                                   url='http://example.org/', rss_url=RSSFeedTestCase.valid_rss)
         self.invalid_outlet = Outlet(name='Invalid Feed', description='Invalid', url='http://invalid.org',
@@ -334,6 +678,999 @@ class WorkerTestCase(TestCase):
         finally:
             self.invalid_outlet.delete()
 
+    def test_worker_run_concurrent(self):
+        for i in range(2, 6):
+            Outlet.objects.create(name='Sample Feed %s' % i, url='http://example%s.org/' % i,
+                                  rss_url=RSSFeedTestCase.valid_rss.replace('example.org', 'example%s.org' % i))
+
+        elapsed = worker_run(pool_size=4)
+
+        self.assertGreaterEqual(elapsed, 0)
+        self.assertEqual(Article.objects.count(), 5)
+        self.assertFalse(Outlet.objects.filter(updated=None).exists())
+
+    def test_worker_conditional_get(self):
+        requests = []
+        original_parse = feedparser.parse
+
+        def fake_parse(url, etag=None, modified=None, **kwargs):
+            requests.append((etag, modified))
+            if etag == '"v1"':
+                return feedparser.FeedParserDict(status=304, etag='"v1"', feed={}, entries=[])
+            feed_data = original_parse(url)
+            feed_data['status'] = 200
+            feed_data['etag'] = '"v1"'
+            feed_data['modified'] = 'Sat, 07 Sep 2002 00:00:01 GMT'
+            return feed_data
+
+        rss_feed.feedparser.parse = fake_parse
+        try:
+            check_outlet(self.valid_outlet)
+            outlet = Outlet.objects.get(pk=self.valid_outlet.id)
+            self.assertEqual(outlet.etag, '"v1"')
+            self.assertEqual(outlet.last_modified, 'Sat, 07 Sep 2002 00:00:01 GMT')
+
+            # A 304 answer must not parse nor touch the database
+            with self.assertNumQueries(0):
+                check_outlet(outlet)
+        finally:
+            rss_feed.feedparser.parse = original_parse
+
+        self.assertEqual(requests, [(None, None), ('"v1"', 'Sat, 07 Sep 2002 00:00:01 GMT')])
+        self.assertEqual(outlet.article_set.count(), 1)
+
+
+class BulkIngestTestCase(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.outlet = Outlet.objects.create(name='Bulk Feed', url='http://bulk.example.org/',
+                                            rss_url=build_rss(range(50), updated='Sat, 07 Sep 2002 00:00:01 GMT'))
+
+    def test_query_budget(self):
+        feed = fetch_outlet(self.outlet)
+
+        with CaptureQueriesContext(connection) as queries:
+            check_outlet(self.outlet, feed)
+
+        self.assertLessEqual(len(queries), INGEST_QUERY_BUDGET)
+        self.assertEqual(self.outlet.article_set.count(), 50)
+        self.assertEqual(Tag.objects.count(), 5)
+        self.assertEqual(self.outlet.author_set.count(), 3)
+
+        article = self.outlet.article_set.get(url='http://bulk.example.org/entry/7')
+        self.assertEqual(sorted(author.name for author in article.authors.all()), ['Author 1', 'Author 2'])
+        self.assertEqual(sorted(tag.term for tag in article.tags.all()), ['Tag 2', 'Tag 3'])
+
+    def test_overlapping_pass(self):
+        check_outlet(self.outlet)
+
+        self.outlet.rss_url = build_rss(range(25, 75), updated='Sun, 08 Sep 2002 00:00:01 GMT')
+        feed = fetch_outlet(self.outlet)
+        with CaptureQueriesContext(connection) as queries:
+            check_outlet(self.outlet, feed)
+
+        self.assertLessEqual(len(queries), INGEST_QUERY_BUDGET)
+        self.assertEqual(self.outlet.article_set.count(), 75)
+        self.assertEqual(Tag.objects.count(), 5)
+
+    def test_lookup_caches(self):
+        check_outlet(self.outlet)
+        self.assertEqual(worker.tag_cache.stats()['size'], 5)
+        self.assertEqual(worker.author_cache.stats()['size'], 3)
+
+        # Every tag and author of the second pass is served from the caches
+        self.outlet.rss_url = build_rss(range(50, 60), updated='Sun, 08 Sep 2002 00:00:01 GMT')
+        hits = worker.tag_cache.hits
+        with CaptureQueriesContext(connection) as queries:
+            check_outlet(self.outlet)
+
+        self.assertEqual(worker.tag_cache.hits, hits + 5)
+        # Only the documents of the new articles read their authors and tags, the tag counters are written
+        lookups = [query for query in queries if query['sql'].startswith('SELECT')
+                   and ('"rss_tag"' in query['sql'] or '"rss_author"' in query['sql'])]
+        self.assertFalse([query for query in lookups if '_prefetch_related_val_article_id' not in query['sql']])
+        self.assertEqual(Article.objects.filter(tags__term='Tag 0').count(), 24)
+
+    def test_entry_by_entry_fallback(self):
+        # The item without a description has no summary and fails the bulk insert, and later on its own
+        self.outlet.rss_url = build_rss(range(10), updated='Sat, 07 Sep 2002 00:00:01 GMT') \
+            .replace('<description>Summary 0</description>', '')
+        self.assertEqual(check_outlet(self.outlet), 9)
+
+        self.assertEqual(self.outlet.article_set.count(), 9)
+        self.assertFalse(Article.tags.through.objects.exclude(tag__in=Tag.objects.all()).exists())
+        self.assertFalse(Article.authors.through.objects.exclude(author__in=Author.objects.all()).exists())
+        article = self.outlet.article_set.get(url='http://bulk.example.org/entry/7')
+        self.assertEqual(sorted(author.name for author in article.authors.all()), ['Author 1', 'Author 2'])
+        self.assertEqual(sorted(tag.term for tag in article.tags.all()), ['Tag 2', 'Tag 3'])
+
+        # Only rows that were committed are cached
+        self.assertEqual(sorted(worker.tag_cache.get('Tag %s' % i) for i in range(5)),
+                         sorted(Tag.objects.values_list('id', flat=True)))
+
+    def test_unchanged_entries(self):
+        entries = fetch_outlet(self.outlet).get_entries_info()
+        self.assertEqual(worker.store_entries(self.outlet, entries), 50)
+
+        # Only the fingerprints are read back
+        with self.assertNumQueries(1):
+            self.assertEqual(worker.store_entries(self.outlet, entries), 0)
+
+    def test_changed_entries(self):
+        check_outlet(self.outlet)
+        article = self.outlet.article_set.get(url='http://bulk.example.org/entry/7')
+
+        self.outlet.rss_url = build_rss(range(50), updated='Sun, 08 Sep 2002 00:00:01 GMT') \
+            .replace('<title>Entry 7</title>', '<title>Entry 7 edited</title>')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(check_outlet(self.outlet), 1)
+        self.assertLessEqual(len(queries), INGEST_QUERY_BUDGET + 1)
+
+        edited = Article.objects.get(url='http://bulk.example.org/entry/7')
+        self.assertEqual((edited.id, edited.title), (article.id, 'Entry 7 edited'))
+        self.assertNotEqual(edited.fingerprint, article.fingerprint)
+        self.assertEqual(sorted(tag.term for tag in edited.tags.all()), ['Tag 2', 'Tag 3'])
+        self.assertEqual(parse(views.articles_search(RequestFactory().get('/'), 'edited').content)[0]['id'],
+                         article.id)
+
+        # Relations are replaced, not appended to
+        self.outlet.rss_url = build_rss(range(50), updated='Mon, 09 Sep 2002 00:00:01 GMT', tag_offset=1)
+        self.assertEqual(check_outlet(self.outlet), 50)
+        edited = Article.objects.get(url='http://bulk.example.org/entry/7')
+        self.assertEqual(sorted(tag.term for tag in edited.tags.all()), ['Tag 3', 'Tag 4'])
+        self.assertEqual(Article.tags.through.objects.count(), 100)
+        self.assertEqual(Article.objects.count(), 50)
+
+
+class SchemaTestCase(TestCase):
+    def assertUsesIndex(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        cursor = connection.cursor()
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        plan = [row[-1] for row in cursor.fetchall()]
+
+        for step in plan:
+            # Full table scans are only acceptable when they walk an index
+            if step.startswith('SCAN'):
+                self.assertIn('INDEX', step, plan)
+        return plan
+
+    @skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN is SQLite specific')
+    def test_article_lists(self):
+        pub_date = datetime.datetime(2002, 9, 7, 0, 1, 1, tzinfo=timezone.utc)
+        pages = [
+            Article.objects.order_by('-pub_date', '-id')[:51],
+            Article.objects.filter(outlet_id=1).order_by('-pub_date', '-id')[:51],
+            _after(Article.objects.order_by('-pub_date', '-id'), pub_date, 10)[:51],
+            _after(Article.objects.filter(outlet_id=1).order_by('-pub_date', '-id'), pub_date, 10)[:51],
+        ]
+        for page in pages:
+            plan = self.assertUsesIndex(page)
+            # Pages are read in index order instead of sorting every matching row
+            self.assertFalse([step for step in plan if 'TEMP B-TREE' in step], plan)
+
+        plan = self.assertUsesIndex(Article.objects.filter(tags__term='Tag1').order_by('-pub_date', '-id')[:51])
+        self.assertTrue([step for step in plan if 'rss_tag USING COVERING INDEX' in step], plan)
+
+    @skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN is SQLite specific')
+    def test_worker_lookups(self):
+        self.assertUsesIndex(Tag.objects.filter(term__in=['Tag1', 'Tag2']))
+        self.assertUsesIndex(Author.objects.filter(outlet_id=1, name__in=['Author1', 'Author2']))
+        self.assertUsesIndex(Article.objects.filter(url__in=['http://example.com/1']))
+
+    def test_uniqueness(self):
+        outlet = Outlet.objects.create(name='Outlet', url='http://example.org', rss_url='http://example.org/rss')
+        Tag.objects.create(term='Tag')
+        Author.objects.create(outlet=outlet, name='Author')
+
+        with transaction.atomic():
+            self.assertRaises(IntegrityError, Tag.objects.create, term='Tag')
+        with transaction.atomic():
+            self.assertRaises(IntegrityError, Author.objects.create, outlet=outlet, name='Author')
+
+
+class LRUCacheTestCase(TestCase):
+    def test_eviction(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+
+        # 'b' is the least recently used key
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+
+        self.assertEqual(cache.stats(), {'hits': 3, 'misses': 1, 'evictions': 1, 'size': 2, 'maxsize': 2})
+
+    def test_invalid_size(self):
+        self.assertRaises(ValueError, LRUCache, 0)
+
+
+class ArchiveTestCase(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.root = tempfile.mkdtemp()
+        self.archive = FeedArchive(self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_store_and_entries(self):
+        first = datetime.datetime(2002, 9, 5, tzinfo=timezone.utc)
+        second = datetime.datetime(2002, 9, 6, tzinfo=timezone.utc)
+        self.archive.store(1, 'second', second)
+        self.archive.store(1, u'first \xe9', first)
+        self.archive.store(2, 'other', second)
+
+        entries = self.archive.entries()
+        self.assertEqual([(fetched_at, outlet_id) for fetched_at, outlet_id, path in entries],
+                         [(first, 1), (second, 1), (second, 2)])
+        self.assertEqual(self.archive.read(entries[0][2]), 'first \xc3\xa9')
+        self.assertEqual(len(self.archive.entries(outlet_ids=[2])), 1)
+        self.assertEqual(len(self.archive.entries(since=second)), 2)
+        self.assertEqual(len(self.archive.entries(until=second)), 1)
+
+    def test_archive_and_replay(self):
+        outlet = Outlet.objects.create(name='Sample Feed', url='http://example.org/', rss_url=RSSFeedTestCase.valid_rss)
+        with override_settings(RSS_ARCHIVE_DIR=self.root):
+            check_outlet(outlet)
+
+        entries = self.archive.entries()
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(self.archive.read(entries[0][2]), RSSFeedTestCase.valid_rss)
+
+        # Replayed bodies go through the same updated check as fetched ones unless forced
+        outlet.article_set.all().delete()
+        self.assertEqual(worker.replay_archive(self.archive), (1, 0))
+        call_command('replay_feeds', archive=self.root, force=True, stdout=StringIO())
+        self.assertEqual(outlet.article_set.count(), 1)
+
+    def test_raw_body_handler(self):
+        compressed = StringIO()
+        with gzip.GzipFile(fileobj=compressed, mode='wb') as gzip_file:
+            gzip_file.write('<rss/>')
+
+        handler = RawBodyHandler()
+        self.assertIsNone(handler.get_body())
+        handler.body = compressed.getvalue()
+        handler.content_encoding = 'gzip'
+        self.assertEqual(handler.get_body(), '<rss/>')
+
+
+class SyntheticFeedTestCase(TestCase):
+    def test_rss_feed(self):
+        feed = RSSFeed('synthetic', document=generate_feed(range(20), tag_count=4, author_count=2, tags_per_entry=2))
+        entries = feed.get_entries_info()
+
+        self.assertEqual(len(entries), 20)
+        self.assertEqual(entries[0]['entry_info']['url'], 'http://synthetic.example.org/entry/19')
+        self.assertEqual(feed.get_channel_info()['updated'], entries[0]['entry_info']['pub_date'])
+        self.assertEqual(set(tag for entry in entries for tag in entry['tags']), set(['Tag 0', 'Tag 1', 'Tag 2', 'Tag 3']))
+        self.assertEqual(set(author for entry in entries for author in entry['authors']), set(['Author 0', 'Author 1']))
+
+    def test_atom_feed(self):
+        feed_data = feedparser.parse(generate_feed(range(5), fmt='atom'))
+        self.assertTrue(feed_data.version.startswith('atom'))
+        self.assertEqual(len(feed_data.entries), 5)
+
+    def test_passes_overlap(self):
+        self.assertEqual(pass_entry_ids(0, 5, 2), [0, 1, 2, 3, 4])
+        self.assertEqual(pass_entry_ids(1, 5, 2), [3, 4, 5, 6, 7])
+        self.assertRaises(ValueError, pass_entry_ids, 1, 5, 5)
+
+        # The same entry is generated identically in every pass
+        self.assertIn(generate_feed([3]).split('<item>')[1], generate_feed(pass_entry_ids(1, 5, 2)))
+
+    def test_benchmark_ingest(self):
+        results = benchmark_ingest(passes=2, entry_count=20, overlap=15)
+
+        self.assertEqual([result['stored'] for result in results['passes']], [20, 5])
+        self.assertEqual(Article.objects.count(), 25)
+        self.assertGreater(results['queries_per_entry'], 0)
+
+
+class MetricsTestCase(TestCase):
+    def setUp(self):
+        clear_caches()
+        metrics.REGISTRY.clear()
+
+    def test_render(self):
+        counter = metrics.Counter('test_total', 'Test counter.', ['outlet_id'])
+        counter.inc(outlet_id=1)
+        counter.inc(2, outlet_id=1)
+        counter.inc(outlet_id='"quoted"')
+        histogram = metrics.Histogram('test_seconds', 'Test histogram.', buckets=(1, 5))
+        histogram.observe(0.5)
+        histogram.observe(3)
+
+        registry = metrics.Registry()
+        registry.register(counter)
+        registry.register(histogram)
+        self.assertEqual(registry.render().splitlines(), [
+            '# HELP test_total Test counter.',
+            '# TYPE test_total counter',
+            'test_total{outlet_id="1"} 3',
+            'test_total{outlet_id="\\"quoted\\""} 1',
+            '# HELP test_seconds Test histogram.',
+            '# TYPE test_seconds histogram',
+            'test_seconds_bucket{le="1"} 1',
+            'test_seconds_bucket{le="5"} 2',
+            'test_seconds_bucket{le="+Inf"} 2',
+            'test_seconds_sum 3.5',
+            'test_seconds_count 2',
+        ])
+        self.assertRaises(ValueError, counter.inc, outlet=1)
+
+    def test_check_outlet(self):
+        outlet = Outlet.objects.create(name='Sample Feed', url='http://example.org/', rss_url=RSSFeedTestCase.valid_rss)
+        check_outlet(outlet)
+        check_outlet(outlet, force=True)
+
+        self.assertEqual(metrics.entries_total.get(outlet_id=outlet.id, result='inserted'), 1)
+        self.assertEqual(metrics.entries_total.get(outlet_id=outlet.id, result='unchanged'), 1)
+        self.assertEqual(metrics.fetch_seconds.get(outlet_id=outlet.id)[0][-1], 2)
+        self.assertEqual(metrics.store_seconds.get(outlet_id=outlet.id)[0][-1], 2)
+
+        invalid = Outlet.objects.create(name='Invalid Feed', url='http://invalid.org', rss_url=RSSFeedTestCase.invalid_rss)
+        worker.check_outlets(Outlet.objects.all(), pool_size=1, raise_errors=False)
+        self.assertEqual(metrics.failures_total.get(outlet_id=invalid.id), 1)
+        self.assertEqual(metrics.pass_seconds.get()[0][-1], 1)
+
+    def test_server(self):
+        metrics.entries_total.inc(outlet_id=1, result='inserted')
+        server = metrics.start_server(0, '127.0.0.1')
+        try:
+            response = urllib2.urlopen('http://127.0.0.1:%s/metrics' % server.server_port)
+            self.assertEqual(response.info()['Content-Type'], metrics.CONTENT_TYPE)
+            self.assertIn('rss_entries_total{outlet_id="1",result="inserted"} 1', response.read())
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+class StreamingFeedTestCase(TestCase):
+    def assertSameFeed(self, document):
+        expected, streamed = RSSFeed(document), StreamingRSSFeed(document)
+        self.assertEqual(streamed.get_channel_info(), expected.get_channel_info())
+        self.assertEqual(streamed.get_entries_info(), expected.get_entries_info())
+
+    def test_same_entries(self):
+        self.assertSameFeed(generate_feed(range(30)))
+        self.assertSameFeed(build_rss(range(20), updated='Sat, 07 Sep 2002 00:00:01 GMT'))
+        self.assertSameFeed("""<?xml version="1.0"?>
+        <rss version="2.0" xmlns:dc="http://purl.org/dc/elements/1.1/"
+        xmlns:content="http://purl.org/rss/1.0/modules/content/"><channel><title>Feed</title>
+        <item><title>Entry</title><guid>http://example.org/1</guid><pubDate>Thu, 05 Sep 2002 02:00:01 +0200</pubDate>
+        <dc:creator>Jane</dc:creator><author>jo@example.org (Jo Doe)</author><category>Tag</category>
+        <content:encoded><![CDATA[<p onclick="x()">Hi</p><script>x()</script>]]></content:encoded></item>
+        <item><title></title><link>http://example.org/2</link><pubDate>Thu, 05 Sep 2002 03:00:01 GMT</pubDate></item>
+        </channel></rss>""")
+
+    def test_fallback(self):
+        # Not well formed XML, only feedparser can read it
+        self.assertSameFeed(RSSFeedTestCase.valid_rss)
+        self.assertRaises(ValueError, StreamingRSSFeed(RSSFeedTestCase.invalid_rss).get_channel_info)
+
+    def test_early_stop(self):
+        document = generate_feed(range(2000))
+        feed = StreamingRSSFeed(document)
+        largest = 0
+        urls = []
+        for entry_info in feed.iter_entries_info(since=entry_date(1900)):
+            urls.append(entry_info['entry_info']['url'])
+            largest = max(largest, len(feed._channel))
+            position = feed._reader.stream.tell()
+
+        self.assertEqual(len(urls), 100)
+        self.assertEqual(urls[-1], 'http://synthetic.example.org/entry/1900')
+        # Items are dropped as they are read, only the ones of the chunk being parsed are held, and the rest of the
+        # document is never parsed
+        self.assertLess(largest, 100)
+        self.assertLess(position, len(document) / 2)
+
+    def test_gzip_reader(self):
+        compressed = StringIO()
+        with gzip.GzipFile(fileobj=compressed, mode='wb') as gzip_file:
+            gzip_file.write('<rss/>' * 1000)
+
+        reader = _Reader(StringIO(compressed.getvalue()), gzipped=True)
+        self.assertEqual(''.join(iter(lambda: reader.read(100), '')), '<rss/>' * 1000)
+
+    @override_settings(RSS_STREAMING_PARSER=True)
+    def test_check_outlet(self):
+        clear_caches()
+        outlet = Outlet.objects.create(name='Bulk Feed', url='http://bulk.example.org/',
+                                       rss_url=build_rss(range(50), updated='Sat, 07 Sep 2002 00:00:01 GMT'))
+        self.assertEqual(check_outlet(outlet), 50)
+
+        outlet.rss_url = build_rss(range(59, 9, -1), updated='Sun, 08 Sep 2002 00:00:01 GMT')
+        feed = fetch_outlet(outlet)
+        self.assertIsInstance(feed, StreamingRSSFeed)
+        self.assertEqual(check_outlet(outlet, feed), 10)
+        self.assertEqual(outlet.article_set.count(), 60)
+
+    @override_settings(RSS_STREAMING_PARSER=True, RSS_STORE_BATCH_SIZE=20)
+    def test_download_in_fetch(self):
+        clear_caches()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        outlets = []
+        malformed = build_rss(range(5), updated='Sat, 07 Sep 2002 00:00:01 GMT', domain='malformed.example.org')
+        for name, document in [('bulk.xml', build_rss(range(50), updated='Sat, 07 Sep 2002 00:00:01 GMT')),
+                               # Not well formed after the first entries, the fallback happens while storing
+                               ('malformed.xml', malformed.replace('Summary 3', 'Summary & 3'))]:
+            path = '%s/%s' % (directory, name)
+            with open(path, 'wb') as feed_file:
+                feed_file.write(document)
+            outlets.append(Outlet.objects.create(name=name, url='http://example.org/', rss_url='file://' + path))
+
+        feeds = [fetch_outlet(outlet) for outlet in outlets]
+        # Storing never reads from the network, the fallback parses the body already downloaded
+        shutil.rmtree(directory)
+        for feed in feeds:
+            self.assertIsInstance(feed._reader.stream, StringIO)
+
+        batches = []
+
+        def store_entries(outlet, entries):
+            batches.append(len(entries))
+            return original(outlet, entries)
+
+        original = worker.store_entries
+        worker.store_entries = store_entries
+        self.addCleanup(setattr, worker, 'store_entries', original)
+
+        self.assertEqual(check_outlet(outlets[0], feeds[0]), 50)
+        self.assertEqual(batches, [20, 20, 10])
+        self.assertEqual(check_outlet(outlets[1], feeds[1]), 5)
+
+
+class PipelineTestCase(TestCase):
+    def setUp(self):
+        clear_caches()
+        for i in range(1, 6):
+            Outlet.objects.create(name='Sample Feed %s' % i, url='http://example%s.org/' % i,
+                                  rss_url=RSSFeedTestCase.valid_rss.replace('example.org', 'example%s.org' % i))
+        self.invalid = Outlet.objects.create(name='Invalid Feed', url='http://invalid.org',
+                                             rss_url=RSSFeedTestCase.invalid_rss)
+
+    def tearDown(self):
+        pipeline.shutdown_parse_pool()
+
+    def test_download_and_parse(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = '%s/feed.xml' % directory
+            with open(path, 'wb') as feed_file:
+                feed_file.write(RSSFeedTestCase.valid_rss)
+            response = download('file://' + path)
+        finally:
+            shutil.rmtree(directory)
+
+        self.assertEqual(response['status'], 200)
+        self.assertEqual(response['body'], RSSFeedTestCase.valid_rss)
+
+        expected = RSSFeed(RSSFeedTestCase.valid_rss)
+        feed = RSSFeed.from_download(RSSFeedTestCase.valid_rss, response,
+                                     parse_document(RSSFeedTestCase.valid_rss, response['body']))
+        self.assertTrue(feed.is_modified())
+        self.assertEqual(feed.get_channel_info(), expected.get_channel_info())
+        self.assertEqual(feed.get_entries_info(), expected.get_entries_info())
+
+        not_modified = RSSFeed.from_download('feed', dict(response, status=304, body=None))
+        self.assertFalse(not_modified.is_modified())
+
+    def test_url_like_body(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = '%s/secret.xml' % directory
+            with open(path, 'wb') as feed_file:
+                feed_file.write(RSSFeedTestCase.valid_rss)
+
+            # A body naming a url or a local file is parsed as it is, never fetched or opened
+            for body in ('file://' + path, path, u'file://' + path):
+                self.assertRaises(ValueError, parse_document, 'http://example.org/feed', body)
+                self.assertRaises(ValueError, StreamingRSSFeed('http://example.org/feed', document=body)
+                                  .get_channel_info)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_fetch_and_parse(self):
+        results = dict((outlet.id, future) for outlet, future in
+                       pipeline.fetch_and_parse(Outlet.objects.all(), fetchers=2, queue_size=1))
+
+        self.assertEqual(sorted(results), sorted(Outlet.objects.values_list('id', flat=True)))
+        self.assertRaises(ValueError, results.pop(self.invalid.id).result)
+        for future in results.values():
+            self.assertEqual(len(future.result().get_entries_info()), 1)
+
+    @override_settings(RSS_PARSE_PROCESSES=2)
+    def test_parse_pool_started_first(self):
+        pipeline.shutdown_parse_pool()
+        self.addCleanup(pipeline.shutdown_parse_pool)
+
+        # The processes are forked by the call, from this thread, before the generator starts the pipeline threads
+        feeds = pipeline.fetch_and_parse(Outlet.objects.all(), fetchers=2)
+        self.assertEqual(len(pipeline.get_parse_pool()._processes), 2)
+        self.assertEqual(len(list(feeds)), 6)
+
+    @override_settings(RSS_PARSE_PROCESSES=2)
+    def test_check_outlets(self):
+        results = worker.check_outlets(Outlet.objects.all(), pool_size=2, raise_errors=False)
+
+        self.assertIsNone(results.pop(self.invalid.id))
+        self.assertEqual(results.values(), [1] * 5)
+        self.assertEqual(Article.objects.count(), 5)
+        self.assertEqual(Outlet.objects.filter(updated=None).count(), 1)
+
+
+class OutletAdminTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.url = 'file://%s/feed.xml' % self.directory
+        with open('%s/feed.xml' % self.directory, 'wb') as feed_file:
+            feed_file.write(RSSFeedTestCase.valid_rss)
+        self.request = RequestFactory().post('/admin/rss/outlet/add/')
+        self.model_admin = OutletAdmin(Outlet, admin.site)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_add_outlet(self):
+        clear_caches()
+        form = self.model_admin.get_form(self.request)(data={'rss_url': self.url})
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.instance.name, 'Sample Feed')
+
+        outlet = form.save(commit=False)
+        self.model_admin.save_model(self.request, outlet, form, False)
+        self.assertEqual(self.request.rss_first_check, (outlet, form.feed))
+
+        # Workers leave the new outlet to its first check, which stores the validated feed without downloading it
+        self.assertEqual(leasing.claim_due('worker', 10, 60), [])
+        scheduled_worker = Worker(min_interval=60, max_interval=3600, pool_size=1)
+        self.assertEqual(scheduled_worker.tick(), [])
+        self.assertEqual(check_new_outlet(outlet, form.feed, outlet.lease_owner), 1)
+
+        outlet = Outlet.objects.get(pk=outlet.id)
+        self.assertIsNone(outlet.lease_owner)
+        self.assertIsNotNone(outlet.next_check)
+        self.assertEqual(outlet.article_set.count(), 1)
+
+    @override_settings(RSS_VALIDATION_MAX_BYTES=100)
+    def test_download_limit(self):
+        form = self.model_admin.get_form(self.request)(data={'rss_url': self.url})
+        self.assertFalse(form.is_valid())
+        self.assertIn('larger than 100 bytes', unicode(form.errors))
+        self.assertEqual(download(self.url, timeout=1, max_bytes=len(RSSFeedTestCase.valid_rss))['body'],
+                         RSSFeedTestCase.valid_rss)
+
+    def test_download_deadline(self):
+        class SlowBody(StringIO):
+            def read(self, size=-1):
+                time.sleep(0.01)
+                return StringIO.read(self, 1)
+
+        handler = RawBodyHandler(max_seconds=0.1)
+        response = urllib2.addinfourl(SlowBody(RSSFeedTestCase.valid_rss), {}, self.url, 200)
+        self.assertRaisesRegexp(ValueError, 'longer than 0.1 seconds', handler.http_response, None, response)
+
+        handler = RawBodyHandler(max_seconds=10)
+        response = urllib2.addinfourl(StringIO(RSSFeedTestCase.valid_rss), {}, self.url, 200)
+        self.assertEqual(handler.http_response(None, response).read(), RSSFeedTestCase.valid_rss)
+
+
+class OPMLTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        for name, document in [('valid.xml', RSSFeedTestCase.valid_rss), ('invalid.xml', RSSFeedTestCase.invalid_rss),
+                               ('other.xml', RSSFeedTestCase.valid_rss.replace('Sample Feed', 'Other Feed'))]:
+            with open('%s/%s' % (self.directory, name), 'wb') as feed_file:
+                feed_file.write(document)
+
+        self.opml = """<?xml version="1.0"?>
+        <opml version="1.0"><head><title>Subscriptions</title></head><body>
+        <outline text="News">
+          <outline text="Valid" type="rss" xmlUrl="file://%(dir)s/valid.xml" htmlUrl="http://example.org/"/>
+          <outline text="Invalid" type="rss" xmlUrl="file://%(dir)s/invalid.xml"/>
+        </outline>
+        <outline text="Missing" type="rss" xmlUrl="file://%(dir)s/missing.xml"/>
+        <outline text="Valid again" type="rss" xmlUrl="file://%(dir)s/valid.xml"/>
+        <outline text="Other" type="rss" xmlUrl="file://%(dir)s/other.xml"/>
+        <outline text="Not a feed"/>
+        </body></opml>""" % {'dir': self.directory}
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_parse_opml(self):
+        feeds = parse_opml(self.opml)
+        self.assertEqual([feed['title'] for feed in feeds], ['Valid', 'Invalid', 'Missing', 'Valid again', 'Other'])
+        self.assertEqual(feeds[0]['url'], 'http://example.org/')
+        self.assertRaises(ValueError, parse_opml, '<opml><body>')
+
+    def test_import_opml(self):
+        Outlet.objects.create(name='Other Feed', url='http://example.org/',
+                              rss_url='file://%s/other.xml' % self.directory)
+
+        # One query for the existing outlets and a single insert
+        with self.assertNumQueries(2):
+            results = import_opml(self.opml, pool_size=4, per_host=1)
+
+        errors = [result['error'] for result in results]
+        self.assertIsNone(errors[0])
+        self.assertIn('valid rss', errors[1])
+        self.assertIn('Failed to fetch', errors[2])
+        self.assertEqual(errors[3:], ['Feed is listed more than once.', 'Outlet already exists.'])
+        self.assertEqual(list(Outlet.objects.order_by('id').values_list('name', flat=True)),
+                         ['Other Feed', 'Sample Feed'])
+
+    def test_import_expires_outlets(self):
+        use_shared_cache(self)
+        Outlet.objects.create(name='Other Feed', url='http://example.org/',
+                              rss_url='file://%s/other.xml' % self.directory)
+        self.assertEqual([outlet['name'] for outlet in parse(self.client.get('/rss/outlets/').content)],
+                         ['Other Feed'])
+
+        import_opml(self.opml, pool_size=4, per_host=1)
+        self.assertEqual([outlet['name'] for outlet in parse(self.client.get('/rss/outlets/').content)],
+                         ['Other Feed', 'Sample Feed'])
+
+    def test_host_limiter(self):
+        limiter = HostLimiter(2)
+        self.assertIs(limiter('http://example.org/a'), limiter('http://EXAMPLE.org/b'))
+        self.assertIsNot(limiter('http://example.org/a'), limiter('http://example.com/a'))
+
+    def test_import_command(self):
+        path = '%s/subscriptions.opml' % self.directory
+        with open(path, 'wb') as opml_file:
+            opml_file.write(self.opml)
+
+        stdout, stderr = StringIO(), StringIO()
+        call_command('import_opml', path, stdout=stdout, stderr=stderr)
+        self.assertIn('Imported 2 of 5 feeds', stdout.getvalue())
+        self.assertEqual(len(stderr.getvalue().strip().splitlines()), 3)
+
+    def test_import_admin(self):
+        User.objects.create_superuser('admin', 'admin@example.org', 'secret')
+        self.client.login(username='admin', password='secret')
+
+        upload = StringIO(self.opml)
+        upload.name = 'subscriptions.opml'
+        response = self.client.post('/admin/rss/outlet/import-opml/', {'opml': upload})
+        self.assertRedirects(response, '/admin/rss/outlet/', fetch_redirect_response=False)
+        self.assertEqual(Outlet.objects.count(), 2)
+
+
+class SchedulingTestCase(TestCase):
+    def test_scheduler_order(self):
+        scheduler = OutletScheduler()
+        scheduler.schedule(1, 30)
+        scheduler.schedule(2, 10)
+        scheduler.schedule(3, 20)
+        scheduler.schedule(1, 5)
+
+        self.assertEqual(scheduler.next_due(), 5)
+        self.assertEqual(scheduler.pop_due(25), [(1, 5), (2, 10), (3, 20)])
+        self.assertEqual(scheduler.pop_due(100), [])
+        self.assertIsNone(scheduler.next_due())
+
+    def test_scheduler_no_overlap(self):
+        scheduler = OutletScheduler()
+        scheduler.schedule(1, 10)
+        self.assertEqual(scheduler.pop_due(10), [(1, 10)])
+
+        # A running outlet is neither rescheduled nor handed out again until done
+        scheduler.schedule(1, 0)
+        self.assertEqual(scheduler.pop_due(100), [])
+        self.assertIn(1, scheduler)
+
+        scheduler.done(1, 50)
+        self.assertEqual(scheduler.pop_due(100), [(1, 50)])
+
+    def test_scheduler_recheck(self):
+        scheduler = OutletScheduler()
+        scheduler.schedule(1, 10)
+        scheduler.pop_due(10)
+
+        scheduler.recheck(1)
+        scheduler.done(1, 10 ** 12)
+        self.assertLess(scheduler.scheduled_at(1), 10 ** 12)
+
+        scheduler.schedule(2, 10 ** 12)
+        scheduler.recheck(2)
+        self.assertEqual([outlet_id for outlet_id, when in scheduler.pop_due()], [1, 2])
+
+    def test_learn_interval(self):
+        now = timezone.now()
+        pub_dates = [now - datetime.timedelta(minutes=minutes) for minutes in [0, 10, 20, 30, 200]]
+
+        # The median ignores the long gap
+        self.assertEqual(learn_interval(pub_dates, 60, 3600), 600)
+        self.assertEqual(learn_interval(pub_dates, 900, 3600), 900)
+        self.assertEqual(learn_interval(pub_dates, 60, 300), 300)
+        self.assertIsNone(learn_interval(pub_dates[:1], 60, 3600))
+
+    def test_next_interval(self):
+        self.assertEqual(next_interval(None, [], False, 60, 3600), 60)
+        self.assertEqual(next_interval(600, [], False, 60, 3600), 900)
+        self.assertEqual(next_interval(3000, [], False, 60, 3600), 3600)
+        self.assertEqual(next_interval(3000, [], True, 60, 3600), 60)
+
+    def test_worker_tick(self):
+        clear_caches()
+        outlet = Outlet.objects.create(name='Sample Feed', url='http://example.org/', rss_url=RSSFeedTestCase.valid_rss)
+        scheduled_worker = Worker(min_interval=60, max_interval=3600, pool_size=1)
+
+        now = time.time()
+        self.assertEqual(scheduled_worker.tick(now), [outlet.id])
+        outlet = Outlet.objects.get(pk=outlet.id)
+        self.assertEqual(outlet.article_set.count(), 1)
+        self.assertEqual(outlet.check_interval, 60)
+        self.assertIsNotNone(outlet.next_check)
+        self.assertEqual(scheduled_worker.tick(now), [])
+
+        # "Check now" from the admin is picked up on the next sync, the unchanged feed backs the outlet off
+        Outlet.objects.filter(pk=outlet.id).update(next_check=timezone.now() - datetime.timedelta(minutes=1))
+        self.assertEqual(scheduled_worker.tick(now + 1), [])
+        self.assertEqual(scheduled_worker.tick(now + scheduled_worker.sync_interval), [outlet.id])
+        self.assertEqual(Outlet.objects.get(pk=outlet.id).check_interval, 90)
+
+        outlet.delete()
+        scheduled_worker.sync()
+        self.assertEqual(len(scheduled_worker.scheduler), 0)
+
+    def test_worker_invalid_intervals(self):
+        self.assertRaises(ValueError, Worker, min_interval=600, max_interval=60)
+
+
+class LeasingTestCase(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        self.outlets = [Outlet.objects.create(name='Outlet %s' % i, url='http://example.org/%s' % i,
+                                              rss_url=RSSFeedTestCase.valid_rss,
+                                              next_check=self.now - datetime.timedelta(minutes=i))
+                        for i in range(5)]
+
+    def test_claim_disjoint(self):
+        first = leasing.claim_due('first', 3, 60, self.now)
+        second = leasing.claim_due('second', 3, 60, self.now)
+
+        # Due first is claimed first
+        self.assertEqual([outlet.id for outlet in first], [outlet.id for outlet in reversed(self.outlets)][:3])
+        self.assertEqual(len(second), 2)
+        self.assertFalse(set(outlet.id for outlet in first) & set(outlet.id for outlet in second))
+        self.assertEqual(leasing.claim_due('third', 3, 60, self.now), [])
+
+    def test_claim_not_due(self):
+        Outlet.objects.update(next_check=self.now + datetime.timedelta(minutes=5))
+        self.assertEqual(leasing.claim_due('first', 10, 60, self.now), [])
+        self.assertEqual(leasing.next_claimable(self.now), self.now + datetime.timedelta(minutes=5))
+
+        Outlet.objects.filter(pk=self.outlets[0].id).update(next_check=None)
+        self.assertEqual([outlet.id for outlet in leasing.claim_due('first', 10, 60, self.now)], [self.outlets[0].id])
+
+    def test_lease_expiry(self):
+        claimed = leasing.claim_due('crashed', 10, 60, self.now)
+        self.assertEqual(len(claimed), 5)
+        self.assertEqual(leasing.next_claimable(self.now), self.now + datetime.timedelta(seconds=60))
+
+        later = self.now + datetime.timedelta(seconds=61)
+        self.assertEqual(len(leasing.claim_due('other', 10, 60, later)), 5)
+
+        # The crashed worker lost its leases and cannot reschedule the outlets any more
+        self.assertFalse(leasing.release('crashed', claimed[0].id, later, 60))
+        self.assertTrue(leasing.release('other', claimed[0].id, later + datetime.timedelta(minutes=1), 60))
+        outlet = Outlet.objects.get(pk=claimed[0].id)
+        self.assertIsNone(outlet.lease_owner)
+        self.assertEqual(outlet.check_interval, 60)
+        self.assertEqual(leasing.release_all('other'), 4)
+
+    def test_check_keeps_newer_lease(self):
+        outlet = self.outlets[0]
+        feed = fetch_outlet(outlet)
+
+        # Another worker takes the lease and an admin reschedules the outlet while the feed is being fetched
+        next_check = self.now + datetime.timedelta(hours=1)
+        Outlet.objects.filter(pk=outlet.id).update(lease_owner='other', lease_expires=next_check, next_check=next_check)
+        self.assertEqual(check_outlet(outlet, feed), 1)
+
+        outlet = Outlet.objects.get(pk=outlet.id)
+        self.assertEqual((outlet.lease_owner, outlet.lease_expires, outlet.next_check), ('other', next_check, next_check))
+        self.assertIsNotNone(outlet.updated)
+
+    def test_leased_workers(self):
+        clear_caches()
+        workers = [LeasedWorker(min_interval=60, max_interval=3600, pool_size=1, batch_size=2, owner=owner)
+                   for owner in ('first', 'second')]
+
+        checked = []
+        while True:
+            ids = workers[0].tick() + workers[1].tick()
+            if not ids:
+                break
+            checked.extend(ids)
+
+        # Each outlet checked once, by one worker or the other
+        self.assertEqual(sorted(checked), sorted(outlet.id for outlet in self.outlets))
+        for outlet in Outlet.objects.all():
+            self.assertIsNone(outlet.lease_owner)
+            self.assertGreater(outlet.next_check, self.now)
+        self.assertEqual(Article.objects.count(), 1)
+
+
+class DocumentsTestCase(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.outlet = Outlet.objects.create(name='Bulk Feed', url='http://bulk.example.org/',
+                                            rss_url=build_rss(range(10), updated='Sat, 07 Sep 2002 00:00:01 GMT'))
+        check_outlet(self.outlet)
+
+    def assertDocumentsCurrent(self):
+        for article in Article.objects.prefetch_related('authors', 'tags'):
+            self.assertEqual(json.loads(article.document), json.loads(documents.render(article)))
+
+    def test_check_outlet(self):
+        self.assertFalse(Article.objects.filter(document__isnull=True).exists())
+        self.assertDocumentsCurrent()
+
+    def test_relations_changed(self):
+        tag = Tag.objects.get(term='Tag 2')
+        tag.term = 'Renamed'
+        tag.save()
+        article = Article.objects.get(url='http://bulk.example.org/entry/7')
+        article.authors.clear()
+
+        document = json.loads(Article.objects.get(pk=article.pk).document)
+        self.assertEqual(document['authors'], [])
+        self.assertIn('Renamed', document['tags'])
+        self.assertDocumentsCurrent()
+
+    def test_missing_documents(self):
+        Article.objects.filter(url='http://bulk.example.org/entry/3').update(document=None)
+
+        response = views.all_articles(RequestFactory().get('/rss/articles/'))
+        self.assertEqual(len(json.loads(response.content)), 10)
+
+        stdout = StringIO()
+        call_command('backfill_documents', batch_size=4, stdout=stdout)
+        self.assertIn('Rendered 1 article documents', stdout.getvalue())
+        self.assertFalse(Article.objects.filter(document__isnull=True).exists())
+        self.assertDocumentsCurrent()
+
+        call_command('backfill_documents', batch_size=4, all=True, stdout=stdout)
+        self.assertIn('Rendered 10 article documents', stdout.getvalue())
+
+
+class TrendingTestCase(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.factory = RequestFactory()
+        self.outlet = Outlet.objects.create(name='Bulk Feed', url='http://bulk.example.org/',
+                                            rss_url=build_rss(range(50), updated='Sat, 07 Sep 2002 00:00:01 GMT'))
+
+    def assertCountsCurrent(self):
+        totals = {}
+        days = {}
+        for tag_id, pub_date in Article.tags.through.objects.values_list('tag_id', 'article__pub_date'):
+            totals[tag_id] = totals.get(tag_id, 0) + 1
+            key = (tag_id, trending.link_day(pub_date))
+            days[key] = days.get(key, 0) + 1
+
+        self.assertEqual(dict((tag.id, tag.article_count) for tag in Tag.objects.filter(article_count__gt=0)), totals)
+        self.assertEqual(dict(((row.tag_id, row.day), row.count) for row in TagDailyCount.objects.filter(count__gt=0)),
+                         days)
+
+    def test_check_outlet(self):
+        check_outlet(self.outlet)
+        self.assertEqual(list(Tag.objects.values_list('article_count', flat=True)), [20] * 5)
+        self.assertCountsCurrent()
+
+        # Every article moves to the next tags
+        self.outlet.rss_url = build_rss(range(25, 75), updated='Sun, 08 Sep 2002 00:00:01 GMT', tag_offset=1)
+        check_outlet(self.outlet)
+        self.assertEqual(Article.objects.count(), 75)
+        self.assertCountsCurrent()
+
+    def test_orm_changes(self):
+        check_outlet(self.outlet)
+        article = Article.objects.get(url='http://bulk.example.org/entry/7')
+        tag = Tag.objects.create(term='New')
+
+        article.tags.add(tag)
+        self.assertEqual(Tag.objects.get(pk=tag.pk).article_count, 1)
+        article.pub_date = timezone.now()
+        article.save()
+        self.assertCountsCurrent()
+
+        article.tags.remove(tag)
+        tag.article_set.add(*Article.objects.filter(url__endswith='/1'))
+        self.assertCountsCurrent()
+
+        article.tags.clear()
+        Article.objects.get(url='http://bulk.example.org/entry/8').delete()
+        self.assertCountsCurrent()
+
+    def test_trending_tags_api(self):
+        check_outlet(self.outlet)
+        recent = Article.objects.create(outlet=self.outlet, title='Recent', summary='Recent',
+                                        url='http://bulk.example.org/recent', pub_date=timezone.now())
+        recent.tags.add(*Tag.objects.filter(term__in=['Tag 3', 'Tag 4']))
+
+        # Straight from the counters, whatever the number of articles
+        with self.assertNumQueries(1):
+            response = views.trending_tags(self.factory.get('/rss/tags/trending/', {'limit': 1}))
+        self.assertEqual(parse(response.content), [{'term': 'Tag 3', 'count': 1}])
+
+        response = views.trending_tags(self.factory.get('/rss/tags/trending/', {'days': 'all', 'limit': 2}))
+        self.assertEqual(parse(response.content), [{'term': 'Tag 3', 'count': 21}, {'term': 'Tag 4', 'count': 21}])
+
+        for days in ('0', 'week'):
+            response = views.trending_tags(self.factory.get('/rss/tags/trending/', {'days': days}))
+            self.assertEqual(response.status_code, 400)
+
+        recent.delete()
+        self.assertRaises(Http404, views.trending_tags, self.factory.get('/rss/tags/trending/', {'days': 2}))
+
+    def test_trending_tags_not_cached(self):
+        check_outlet(self.outlet)
+        shared = override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+        shared.enable()
+        self.addCleanup(shared.disable)
+
+        # The articles of a day leave the window as the date moves on, without any write to expire a cached response
+        request = self.factory.get('/rss/tags/trending/', {'days': 1})
+        TagDailyCount.objects.update(day=trending.link_day(timezone.now()))
+        self.assertEqual(len(parse(views.trending_tags(request).content)), 5)
+        TagDailyCount.objects.update(day=trending.link_day(timezone.now()) - datetime.timedelta(days=1))
+        self.assertRaises(Http404, views.trending_tags, request)
+
+
+def build_rss(entry_ids, updated, domain='bulk.example.org', tag_offset=0):
+    """
+    Build an RSS document with one item per id, items cycle through 3 authors and 5 tags starting at tag_offset
+    """
+    items = []
+    for i in entry_ids:
+        items.append("""
+        <item>
+        <title>Entry %(id)s</title>
+        <link>http://%(domain)s/entry/%(id)s</link>
+        <description>Summary %(id)s</description>
+        <pubDate>Thu, 05 Sep 2002 00:%(minute)02d:01 GMT</pubDate>
+        <author>Author %(author)s</author>
+        <author>Author %(other_author)s</author>
+        <category>Tag %(tag)s</category>
+        <category>Tag %(other_tag)s</category>
+        </item>
+        """ % {'id': i, 'domain': domain, 'minute': i % 60, 'author': i % 3, 'other_author': (i + 1) % 3,
+               'tag': (i + tag_offset) % 5, 'other_tag': (i + tag_offset + 1) % 5})
+
+    return """<?xml version="1.0" encoding="utf-8"?>
+    <rss version="2.0">
+    <channel>
+    <title>Bulk Feed</title>
+    <link>http://%s/</link>
+    <pubDate>%s</pubDate>
+    %s
+    </channel>
+    </rss>
+    """ % (domain, updated, ''.join(items))
+
+
+def use_shared_cache(test_case):
+    """
+    Cache the API responses in files for the rest of the test, shared across threads and processes like in production
+    """
+    directory = tempfile.mkdtemp()
+    test_case.addCleanup(shutil.rmtree, directory)
+    shared = override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory}})
+    shared.enable()
+    test_case.addCleanup(shared.disable)
+
 
 def parse(data, datetime_field=None):
     """
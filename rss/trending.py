@@ -0,0 +1,126 @@
+"""
+Article counters of the tags, overall in Tag.article_count and per day of publication in TagDailyCount.
+
+The worker applies the links it adds and removes as increments, in the transaction storing the articles, so the cost
+of keeping the counters follows the size of the feed and not the number of stored articles. Changes made through the
+ORM count the links of the tags involved again, see rss.signals. Both lock the rows of the tags they change first, in
+id order, so a recount and an increment of the same tag happen one after the other and neither is lost. The trending
+tags are read from the counters alone.
+"""
+import datetime
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.utils import timezone
+
+from .models import Article, Tag, TagDailyCount
+
+# Every tag or row takes 2 parameters in the CASE of the UPDATE, keeps batches below SQLite's limit of 999 parameters
+COUNT_BATCH_SIZE = 300
+
+
+def link_day(pub_date):
+    """
+    :return: The day, in UTC, an article published at pub_date is counted on
+    """
+    if timezone.is_aware(pub_date):
+        pub_date = pub_date.astimezone(timezone.utc)
+    return pub_date.date()
+
+
+def _batches(items):
+    items = list(items)
+    for start in range(0, len(items), COUNT_BATCH_SIZE):
+        yield items[start:start + COUNT_BATCH_SIZE]
+
+
+def _lock(tag_ids):
+    """
+    Lock the rows of the tags until the end of the transaction, always in the same order so two lockers cannot deadlock
+    """
+    for batch in _batches(sorted(tag_ids)):
+        list(Tag.objects.select_for_update().filter(id__in=batch).order_by('id').values_list('id', flat=True))
+
+
+def _increment(queryset, field, deltas):
+    """
+    Add deltas, a dict of row id to increment, to the field of the rows, one UPDATE per batch
+    """
+    for batch in _batches(deltas.items()):
+        queryset.filter(id__in=[row_id for row_id, delta in batch]).update(**{
+            field: F(field) + Case(*[When(id=row_id, then=Value(delta)) for row_id, delta in batch],
+                                   output_field=IntegerField())
+        })
+
+
+def update_counts(removed, added):
+    """
+    Apply removed and added article links to the counters, within the caller's transaction
+    :param removed: Iterable of (tag id, day) of the links removed, a link per article
+    :param added: Iterable of (tag id, day) of the links added
+    """
+    deltas = Counter(added)
+    deltas.subtract(Counter(removed))
+    deltas = dict((key, delta) for key, delta in deltas.items() if delta)
+    if not deltas:
+        return
+
+    totals = Counter()
+    for (tag_id, day), delta in deltas.items():
+        totals[tag_id] += delta
+    _lock(totals)
+    _increment(Tag.objects, 'article_count', dict((tag_id, delta) for tag_id, delta in totals.items() if delta))
+
+    existing = {}
+    for batch in _batches(set(tag_id for tag_id, day in deltas)):
+        rows = TagDailyCount.objects.filter(tag_id__in=batch, day__in=set(day for tag_id, day in deltas))
+        for row_id, tag_id, day in rows.values_list('id', 'tag_id', 'day'):
+            existing[(tag_id, day)] = row_id
+    _increment(TagDailyCount.objects, 'count',
+               dict((existing[key], delta) for key, delta in deltas.items() if key in existing))
+    TagDailyCount.objects.bulk_create(TagDailyCount(tag_id=tag_id, day=day, count=delta)
+                                      for (tag_id, day), delta in deltas.items()
+                                      if (tag_id, day) not in existing and delta > 0)
+
+
+def recount(tag_ids):
+    """
+    Count the article links of the tags again and store their counters, for changes the worker did not count
+    """
+    tag_ids = set(tag_ids)
+    if not tag_ids:
+        return
+
+    with transaction.atomic():
+        # Links are counted once the tags are locked, after the increments already applied to them are committed
+        _lock(tag_ids)
+        totals = Counter()
+        days = Counter()
+        links = Article.tags.through.objects.filter(tag_id__in=tag_ids).values_list('tag_id', 'article__pub_date')
+        for tag_id, pub_date in links.iterator():
+            totals[tag_id] += 1
+            days[(tag_id, link_day(pub_date))] += 1
+
+        for batch in _batches(tag_ids):
+            Tag.objects.filter(id__in=batch).update(article_count=Case(
+                *[When(id=tag_id, then=Value(totals[tag_id])) for tag_id in batch if totals[tag_id]],
+                default=Value(0), output_field=IntegerField()))
+        TagDailyCount.objects.filter(tag_id__in=tag_ids).delete()
+        TagDailyCount.objects.bulk_create(TagDailyCount(tag_id=tag_id, day=day, count=count)
+                                          for (tag_id, day), count in days.items())
+
+
+def trending_tags(days, limit):
+    """
+    :param days: Size of the window, in days up to today in UTC, None for all time
+    :return: List of (term, count) of the limit tags with the most articles in the window, most articles first
+    """
+    if days is None:
+        tags = Tag.objects.filter(article_count__gt=0).order_by('-article_count', 'term')
+        return list(tags.values_list('term', 'article_count')[:limit])
+
+    since = link_day(timezone.now()) - datetime.timedelta(days=days - 1)
+    counts = TagDailyCount.objects.filter(day__gte=since).values('tag__term').annotate(total=Sum('count')) \
+        .filter(total__gt=0).order_by('-total', 'tag__term')
+    return [(row['tag__term'], row['total']) for row in counts[:limit]]
@@ -23,6 +23,8 @@ urlpatterns = [
     url(r'^articles/search/(?P<search>.+)/$', views.articles_search, name='articles_search'),
     # # ex: /rss/tags/
     url(r'^tags/$', views.tags, name='tags'),
+    # # ex: /rss/tags/trending/?days=7&limit=10
+    url(r'^tags/trending/$', views.trending_tags, name='trending_tags'),
     # # ex: /rss/tags/
     url(r'^tags/(?P<term>[\w\s\.]+)/articles/$', views.articles_by_tag, name='articles_by_tag'),
 ]
\ No newline at end of file
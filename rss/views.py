@@ -1,8 +1,20 @@
-from django.db.models import Q
-from django.http import JsonResponse
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_list_or_404, get_object_or_404
+from django.views.decorators.gzip import gzip_page
 
+from . import trending
+from .caching import cached_response
+from .conditional import conditional_response
+from .documents import article_documents
+from .encoding import encoded_response, json_content_response, negotiate
 from .models import *
+from .pagination import batches, get_limit, next_page_url, paginate
+from .profiling import serializing
+from .search import search_articles
 
 
 def response(data):
@@ -13,72 +25,256 @@ def response(data):
 
 
 def single_object_response(object):
-    return JsonResponse(object.__data__())
+    with serializing():
+        return JsonResponse(object.__data__())
 
 
 def array_response(object_array):
-    data = list(object.__data__() for object in object_array)
-    return JsonResponse(data,
-                        safe=False)  # Django serializer won't serialize anything that is not a dict by default
+    with serializing():
+        data = list(object.__data__() for object in object_array)
+        return JsonResponse(data,
+                            safe=False)  # Django serializer won't serialize anything that is not a dict by default
+
+
+def article_array_response(request, articles, fields=None):
+    """
+    Respond with the given articles, only their fields keys, encoded as the request negotiates. Without fields the
+    stored article documents are sent as they are.
+    """
+    with serializing():
+        if fields is None:
+            documents = article_documents(articles)
+            if negotiate(request) == 'json':
+                return json_content_response('[%s]' % ', '.join(documents))
+            data = list(json.loads(document) for document in documents)
+        else:
+            data = list(article.__data__(fields) for article in articles)
+        return encoded_response(request, data, safe=False)
+
+
+def article_response(request, article):
+    with serializing():
+        document = article_documents([article])[0]
+        if negotiate(request) == 'json':
+            return json_content_response(document)
+        return encoded_response(request, json.loads(document))
+
+
+def get_fields(request):
+    """
+    Article keys requested through the fields parameter, e.g. fields=id,title,date
+    :return: The set of keys, None for all of them
+    :raise ValueError: If a key is unknown
+    """
+    fields = request.GET.get('fields')
+    if not fields:
+        return None
+
+    fields = set(field.strip() for field in fields.split(',') if field.strip())
+    unknown = fields - set(Article.DATA_FIELDS)
+    if unknown:
+        raise ValueError('Unknown field(s): %s.' % ', '.join(sorted(unknown)))
+    return fields
+
+
+def get_days(request):
+    """
+    Window of the trending tags requested through the days parameter, settings.RSS_TRENDING_DAYS by default
+    :return: Number of days, None for all time with days=all
+    :raise ValueError: If days is not a positive integer or all
+    """
+    days = request.GET.get('days')
+    if days is None:
+        return settings.RSS_TRENDING_DAYS
+    if days == 'all':
+        return None
+
+    try:
+        days = int(days)
+    except ValueError:
+        raise ValueError('Days must be an integer or all.')
+
+    if days < 1:
+        raise ValueError('Days must be greater than 0.')
+
+    return days
+
+
+def select_fields(queryset, fields):
+    """
+    Only read the columns and relations needed to serialize the fields, the stored document when all are requested
+    """
+    # id and pub_date are the sort and cursor keys of every list
+    if fields is None:
+        return queryset.only('id', 'pub_date', 'document')
+    columns = set(Article.DATA_FIELDS[field] for field in fields if Article.DATA_FIELDS[field])
+    relations = [relation for relation in ('authors', 'tags') if relation in fields]
+    return queryset.only('id', 'pub_date', *columns).prefetch_related(*relations)
+
+
+def streaming_array_response(request, queryset, fields=None):
+    """
+    Stream every article of the queryset as a JSON array, one batch of settings.RSS_STREAM_BATCH_SIZE articles at a
+    time, so only a batch is held in memory and the first bytes leave before the last rows are read.
+    """
+    article_batches = batches(request, select_fields(queryset, fields), settings.RSS_STREAM_BATCH_SIZE)
+
+    def content():
+        yield '['
+        separator = ''
+        for batch in article_batches:
+            with serializing():
+                if fields is None:
+                    chunks = article_documents(batch)
+                else:
+                    chunks = list(json.dumps(article.__data__(fields), cls=DjangoJSONEncoder) for article in batch)
+            for chunk in chunks:
+                yield separator + chunk
+                separator = ', '
+        yield ']'
 
+    return StreamingHttpResponse(content(), content_type='application/json')
 
+
+def error_response(message, status=400):
+    return JsonResponse({'error': message}, status=status)
+
+
+def paginated_response(request, queryset):
+    """
+    Respond with one page of articles, the next page url is sent in the Link header.
+    Articles are served from their stored documents, or with the authors and tags of the whole page fetched with one
+    query each when the fields parameter asks for them.
+    With the stream parameter every article from the cursor on is streamed instead, always as JSON.
+    The fields parameter narrows the articles to the given keys, and the columns read to the ones they need.
+    """
+    try:
+        fields = get_fields(request)
+    except ValueError, e:
+        return error_response(e.message)
+
+    if request.GET.get('stream') in ('1', 'true'):
+        try:
+            return streaming_array_response(request, queryset, fields)
+        except ValueError, e:
+            return error_response(e.message)
+
+    try:
+        data, cursor = paginate(request, select_fields(queryset, fields))
+    except ValueError, e:
+        return error_response(e.message)
+
+    if not data:
+        raise Http404('No %s matches the given query.' % queryset.model._meta.object_name)
+
+    response = article_array_response(request, data, fields)
+    if cursor:
+        response['Link'] = '<%s>; rel="next"' % next_page_url(request, cursor)
+    return response
+
+
+@cached_response()
 def outlets(request):
     data = get_list_or_404(Outlet.objects.order_by('name'))
     return response(data)
 
 
+@cached_response(per_outlet=True)
 def outlet(request, outlet_id):
     data = get_object_or_404(Outlet, pk=outlet_id)
     return response(data)
 
 
+@cached_response()
 def all_authors(request):
     data = get_list_or_404(Author.objects.order_by('name'))
     return response(data)
 
 
+@cached_response(per_outlet=True)
 def authors(request, outlet_id):
     data = get_list_or_404(Author.objects.order_by('name'), outlet_id=outlet_id)
     return response(data)
 
 
+@cached_response(per_outlet=True)
 def author(request, outlet_id, author_id):
     data = get_object_or_404(Author, outlet_id=outlet_id, pk=author_id)
     return response(data)
 
 
+@gzip_page
+@conditional_response()
+@cached_response()
 def all_articles(request):
-    data = get_list_or_404(Article.objects.order_by('-pub_date'))
-    return response(data)
+    return paginated_response(request, Article.objects.all())
 
 
+@gzip_page
+@conditional_response(per_outlet=True)
+@cached_response(per_outlet=True)
 def articles(request, outlet_id):
-    data = get_list_or_404(Article.objects.order_by('-pub_date'), outlet_id=outlet_id)
-    return response(data)
+    return paginated_response(request, Article.objects.filter(outlet_id=outlet_id))
 
 
+@gzip_page
+@conditional_response(per_outlet=True)
+@cached_response(per_outlet=True)
 def article(request, outlet_id, article_id):
-    data = get_object_or_404(Article, id=article_id, outlet_id=outlet_id)
-    return response(data)
+    data = get_object_or_404(select_fields(Article.objects, None), id=article_id, outlet_id=outlet_id)
+    return article_response(request, data)
 
 
+@cached_response()
 def tags(request):
     data = get_list_or_404(Tag.objects.order_by('term'))
     return response(data)
 
 
+def trending_tags(request):
+    """
+    Tags with the most articles published in the last days, read from the tag counters so the cost does not grow with
+    the number of articles. The limit parameter defaults to settings.RSS_TRENDING_LIMIT.
+    Not cached, the window moves with the current date and nothing would expire the days that leave it.
+    """
+    try:
+        days = get_days(request)
+        limit = get_limit(request) if 'limit' in request.GET else settings.RSS_TRENDING_LIMIT
+    except ValueError, e:
+        return error_response(e.message)
+
+    data = [{'term': term, 'count': count} for term, count in trending.trending_tags(days, limit)]
+    if not data:
+        raise Http404('No Tag matches the given query.')
+    return JsonResponse(data, safe=False)
+
+
+@gzip_page
+@conditional_response()
+@cached_response()
 def articles_by_tag(request, term):
-    data = get_list_or_404(Article.objects.order_by('-pub_date'), tags__term=term)
-    return response(data)
+    return paginated_response(request, Article.objects.filter(tags__term=term))
 
 
+@gzip_page
+@conditional_response()
+@cached_response()
 def articles_search(request, search):
-    search_condition = Q(title__icontains=search) | Q(summary__icontains=search) \
-                       | Q(content__icontains=search) | Q(tags__term__icontains=search) \
-                       | Q(authors__name__icontains=search)
-    data = get_list_or_404(Article.objects.order_by('-pub_date'), search_condition)
-    cleaned_data = []
-    for article in data:
-        if article not in cleaned_data:
-            cleaned_data.append(article)
-    return response(cleaned_data)
\ No newline at end of file
+    """
+    Articles matching every word of the search, best match first, paginated like the other article lists
+    """
+    try:
+        fields = get_fields(request)
+        ids, cursor = search_articles(search, get_limit(request), request.GET.get('cursor'))
+    except ValueError, e:
+        return error_response(e.message)
+
+    if not ids:
+        raise Http404('No Article matches the given query.')
+
+    articles = dict((article.id, article) for article in select_fields(Article.objects.filter(id__in=ids), fields))
+    response = article_array_response(request, [articles[article_id] for article_id in ids if article_id in articles],
+                                      fields)
+    if cursor:
+        response['Link'] = '<%s>; rel="next"' % next_page_url(request, cursor)
+    return response
\ No newline at end of file
@@ -2,93 +2,713 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+import calendar
+import datetime
+import hashlib
+import json
 import threading
+import time
+from collections import OrderedDict
+from itertools import chain, islice
 
-from apscheduler.schedulers.blocking import BlockingScheduler
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from django.conf import settings
 from django.utils import timezone
-from django.db import IntegrityError
+from django.db import DatabaseError, IntegrityError, transaction
+from django.db.models import Max
 
+from . import caching, documents, leasing, metrics, pipeline, search, trending
+from .archive import get_archive
 from .feed import RSSFeed
+from .streaming import StreamingRSSFeed
+from .lru import LRUCache
+from .scheduling import CADENCE_HISTORY, OutletScheduler, next_interval
 
 from .models import Article, Author, Outlet, Tag
 
+# Most queries store_entries may issue for a feed, as long as the feed fits in a single bulk insert batch
+# (SQLite splits inserts of more than ~140 articles), a single document batch and a single batch of tag counters, plus
+# one UPDATE per changed article. Enforced by the test suite.
+INGEST_QUERY_BUDGET = 26
+
+# Keep IN (...) lookups below SQLite's limit of 999 query parameters
+IN_LOOKUP_BATCH_SIZE = 500
+
+# Process wide caches of term -> Tag id and (outlet id, name) -> Author id. They are only filled once the
+# transaction that read or created the rows commits, and cleared whenever a bulk insert fails in case one of the
+# cached rows is gone.
+tag_cache = LRUCache(settings.RSS_TAG_CACHE_SIZE)
+author_cache = LRUCache(settings.RSS_AUTHOR_CACHE_SIZE)
+
+
+def clear_caches():
+    tag_cache.clear()
+    author_cache.clear()
+
+
+def _filter_in(queryset, field, values):
+    """
+    Evaluate queryset filtered by field__in=values, splitting large value lists into several queries.
+    """
+    values = list(values)
+    results = []
+    for start in range(0, len(values), IN_LOOKUP_BATCH_SIZE):
+        lookup = {'%s__in' % field: values[start:start + IN_LOOKUP_BATCH_SIZE]}
+        results.extend(queryset.filter(**lookup))
+    return results
+
+
+def find_or_create_tag(term, found):
+    """
+    :param found: Dict the term and Tag id are added to when they were not cached, for the caller to put in tag_cache
+    once its transaction commits
+    :return: The Tag id
+    """
+    tag_id = tag_cache.get(term)
+    if tag_id is not None:
+        return tag_id
 
-def find_or_create_tag(term):
     try:
-        return Tag.objects.get(term=term)
+        tag = Tag.objects.get(term=term)
     except Tag.DoesNotExist:
-        tag = Tag(term=term)
-        tag.save()
-        return tag
+        try:
+            with transaction.atomic():
+                tag = Tag.objects.create(term=term)
+        except IntegrityError:
+            # Created by another worker since we looked
+            tag = Tag.objects.get(term=term)
+    found[term] = tag.id
+    return tag.id
+
 
+def find_or_create_author(outlet, name, found):
+    """
+    :param found: Dict the (outlet id, name) and Author id are added to when they were not cached, like
+    find_or_create_tag
+    :return: The Author id
+    """
+    author_id = author_cache.get((outlet.id, name))
+    if author_id is not None:
+        return author_id
 
-def find_or_create_author(outlet, name):
     try:
-        return outlet.author_set.get(name=name)
+        author = outlet.author_set.get(name=name)
     except Author.DoesNotExist:
-        author = Author(name=name)
-        outlet.author_set.add(author)
-        return author
+        try:
+            with transaction.atomic():
+                author = Author.objects.create(outlet=outlet, name=name)
+        except IntegrityError:
+            author = outlet.author_set.get(name=name)
+    found[(outlet.id, name)] = author.id
+    return author.id
+
+
+def resolve_tags(terms):
+    """
+    Map each term to its Tag id, creating the missing ones. Terms not in tag_cache cost a constant number of
+    queries, the cache itself is left for the caller to fill once the transaction commits.
+    """
+    tags = {}
+    for term in set(terms):
+        tags[term] = tag_cache.get(term)
+    missing = set(term for term, tag_id in tags.items() if tag_id is None)
+    if not missing:
+        return tags
+
+    tag_ids = Tag.objects.values_list('term', 'id')
+    tags.update(_filter_in(tag_ids, 'term', missing))
+    missing = set(term for term, tag_id in tags.items() if tag_id is None)
+    if missing:
+        # bulk_create does not give us the primary keys back, so read the new rows again
+        Tag.objects.bulk_create(Tag(term=term) for term in missing)
+        tags.update(_filter_in(tag_ids, 'term', missing))
+    return tags
+
+
+def resolve_authors(outlet, names):
+    """
+    Map each author name to the outlet Author id, creating the missing ones. Works like resolve_tags.
+    """
+    authors = {}
+    for name in set(names):
+        authors[name] = author_cache.get((outlet.id, name))
+    missing = set(name for name, author_id in authors.items() if author_id is None)
+    if not missing:
+        return authors
+
+    author_ids = Author.objects.filter(outlet=outlet).values_list('name', 'id')
+    authors.update(_filter_in(author_ids, 'name', missing))
+    missing = set(name for name, author_id in authors.items() if author_id is None)
+    if missing:
+        Author.objects.bulk_create(Author(outlet=outlet, name=name) for name in missing)
+        authors.update(_filter_in(author_ids, 'name', missing))
+    return authors
+
+
+def entry_fingerprint(entry_info):
+    """
+    Hash of everything stored from a feed entry, two versions of an entry with the same fingerprint are identical
+    """
+    info = entry_info['entry_info']
+    pub_date = info.get('pub_date')
+    data = [info.get('title'), info.get('summary'), info.get('url'), pub_date.isoformat() if pub_date else None,
+            info.get('content'), sorted(set(entry_info['authors'])), sorted(set(entry_info['tags']))]
+    return hashlib.sha1(json.dumps(data)).hexdigest()
+
+
+def store_entry(outlet, entry_info):
+    """
+    Insert or update a single feed entry, one query at a time. Used when the bulk path fails so one bad entry does
+    not prevent the rest of the feed from being stored.
+    :return: True if the article was stored
+    """
+    found_tags = {}
+    found_authors = {}
+    try:
+        with transaction.atomic():
+            article = outlet.article_set.filter(url=entry_info['entry_info'].get('url')).first() \
+                      or Article(outlet=outlet)
+            for field, value in entry_info['entry_info'].items():
+                setattr(article, field, value)
+            article.fingerprint = entry_fingerprint(entry_info)
+
+            author_ids = list(find_or_create_author(outlet, author, found_authors) for author in entry_info['authors'])
+
+            tag_ids = list(find_or_create_tag(tag, found_tags) for tag in entry_info['tags'])
+
+            article.save()
+            article.authors = author_ids
+            article.tags = tag_ids
+        # Rows created in a transaction that rolled back must not be cached
+        tag_cache.update(found_tags.items())
+        author_cache.update(found_authors.items())
+        return True
+    except IntegrityError, e:
+        logger.warning('Failed to store article, integrity error "%s"' % e)
+    except Exception, e:
+        logger.error('Failed parsing entry: %s\n%s' % (e, entry_info))
+    return False
+
+
+def _replace_relations(through, field, changed_ids, pairs):
+    """
+    Make the through rows of the articles in pairs match pairs exactly. Rows of the articles in changed_ids that are
+    not in pairs are deleted, only the missing ones are inserted.
+    :param pairs: Set of (article id, related id) tuples
+    :return: Set of the pairs of the articles in changed_ids before the change
+    """
+    existing = {}
+    rows = through.objects.values_list('id', 'article_id', field)
+    for row_id, article_id, related_id in _filter_in(rows, 'article_id', changed_ids):
+        existing[(article_id, related_id)] = row_id
 
+    stale = [row_id for pair, row_id in existing.items() if pair not in pairs]
+    for start in range(0, len(stale), IN_LOOKUP_BATCH_SIZE):
+        through.objects.filter(id__in=stale[start:start + IN_LOOKUP_BATCH_SIZE]).delete()
 
-def check_outlet(outlet):
+    through.objects.bulk_create(through(**{'article_id': article_id, field: related_id})
+                                for article_id, related_id in pairs if (article_id, related_id) not in existing)
+    return set(existing)
+
+
+def store_entries(outlet, entries):
+    """
+    Store the feed entries that are new or changed since they were last stored. The fingerprints of the stored
+    articles are loaded in one query and compared in memory: unchanged entries cost nothing more, changed ones are
+    updated in place and new ones are bulk inserted, all in a single transaction. outlet.articles_changed is set when
+    articles are stored, for the caller to save.
+    :return: Number of articles inserted or updated
+    """
+    rejected = 0
+    feed_entries = OrderedDict()
+    for entry_info in entries:
+        url = entry_info['entry_info'].get('url')
+        if not url:
+            logger.warning('Skipping entry without url: %s' % entry_info)
+            rejected += 1
+        elif url not in feed_entries:
+            feed_entries[url] = entry_info
+
+    new_entries = OrderedDict()
+    changed_entries = OrderedDict()
+    fingerprints = {}
+    stored = dict((url, (article_id, outlet_id, fingerprint, pub_date))
+                  for url, article_id, outlet_id, fingerprint, pub_date in
+                  _filter_in(Article.objects.values_list('url', 'id', 'outlet_id', 'fingerprint', 'pub_date'), 'url',
+                             feed_entries.keys()))
+    for url, entry_info in feed_entries.items():
+        fingerprints[url] = entry_fingerprint(entry_info)
+        if url not in stored:
+            new_entries[url] = entry_info
+            continue
+
+        article_id, outlet_id, fingerprint, pub_date = stored[url]
+        if outlet_id != outlet.id:
+            logger.warning('Skipping entry stored by another outlet: %s' % url)
+            rejected += 1
+        elif fingerprint != fingerprints[url]:
+            changed_entries[url] = entry_info
+
+    unchanged = len(entries) - rejected - len(new_entries) - len(changed_entries)
+    if not new_entries and not changed_entries:
+        metrics.record_entries(outlet.id, unchanged=unchanged, rejected=rejected)
+        return 0
+
+    to_store = OrderedDict(chain(new_entries.items(), changed_entries.items()))
+    try:
+        with transaction.atomic():
+            authors = resolve_authors(outlet, chain.from_iterable(entry['authors'] for entry in to_store.values()))
+            tags = resolve_tags(chain.from_iterable(entry['tags'] for entry in to_store.values()))
+
+            article_ids = dict((url, stored[url][0]) for url in changed_entries)
+            for url, entry in changed_entries.items():
+                Article.objects.filter(id=article_ids[url]).update(fingerprint=fingerprints[url],
+                                                                   **entry['entry_info'])
+
+            if new_entries:
+                Article.objects.bulk_create(Article(outlet=outlet, fingerprint=fingerprints[url], **entry['entry_info'])
+                                            for url, entry in new_entries.items())
+                # bulk_create does not give us the primary keys back, so read the new rows again
+                article_ids.update(_filter_in(Article.objects.values_list('url', 'id'), 'url', new_entries.keys()))
+
+            changed_ids = [article_ids[url] for url in changed_entries]
+            _replace_relations(Article.authors.through, 'author_id', changed_ids,
+                               set((article_ids[url], authors[name])
+                                   for url, entry in to_store.items() for name in entry['authors']))
+            tag_pairs = set((article_ids[url], tags[term]) for url, entry in to_store.items() for term in entry['tags'])
+            old_tag_pairs = _replace_relations(Article.tags.through, 'tag_id', changed_ids, tag_pairs)
+
+            # Links of changed articles are counted again on their new day, their publication date may have moved
+            days = dict((article_ids[url], trending.link_day(entry['entry_info']['pub_date']))
+                        for url, entry in to_store.items())
+            old_days = dict((stored[url][0], trending.link_day(stored[url][3])) for url in changed_entries)
+            trending.update_counts(((tag_id, old_days[article_id]) for article_id, tag_id in old_tag_pairs),
+                                   ((tag_id, days[article_id]) for article_id, tag_id in tag_pairs))
+
+            search.index_articles(article_ids.values())
+            documents.refresh_documents(article_ids.values())
+    except DatabaseError, e:
+        # Most likely a concurrent insert of the same url, retry entry by entry
+        logger.warning('Bulk insert failed, storing entries one by one: "%s"' % e)
+        clear_caches()
+        stored_urls = [url for url, entry_info in to_store.items() if store_entry(outlet, entry_info)]
+        if stored_urls:
+            outlet.articles_changed = timezone.now()
+        inserted = sum(1 for url in stored_urls if url in new_entries)
+        metrics.record_entries(outlet.id, inserted=inserted, updated=len(stored_urls) - inserted, unchanged=unchanged,
+                               rejected=rejected + len(to_store) - len(stored_urls))
+        return len(stored_urls)
+
+    outlet.articles_changed = timezone.now()
+    tag_cache.update(tags)
+    author_cache.update(((outlet.id, name), author_id) for name, author_id in authors.items())
+    caching.invalidate(outlet.id)
+    metrics.record_entries(outlet.id, inserted=len(new_entries), updated=len(changed_entries), unchanged=unchanged,
+                           rejected=rejected)
+    logger.info('Inserted %s and updated %s articles.' % (len(new_entries), len(changed_entries)))
+    return len(to_store)
+
+
+def fetch_outlet(outlet):
+    """
+    Download and parse the outlet feed without touching the database, so it is safe to call from any thread.
+    The feed body is archived when settings.RSS_ARCHIVE_DIR is set.
+    :return: The parsed RSSFeed, ready to be handed to check_outlet
+    """
+    archive = get_archive()
+    feed_class = StreamingRSSFeed if settings.RSS_STREAMING_PARSER else RSSFeed
+    feed = feed_class(outlet.rss_url, etag=outlet.etag, modified=outlet.last_modified, keep_raw=archive is not None)
+    if feed.is_modified():
+        if archive is not None and feed.raw is not None:
+            try:
+                archive.store(outlet.id, feed.raw)
+            except (IOError, OSError), e:
+                logger.error('Failed to archive "%s": %s' % (outlet.name, e))
+        feed.get_channel_info()
+    return feed
+
+
+def check_outlet(outlet, feed=None, force=False):
+    """
+    Store the new and changed articles of the outlet feed, fetching it unless a feed from fetch_outlet is given
+    :param force: Store the entries even if the channel was not updated since the last check
+    :return: Number of articles inserted or updated
+    """
     logger.info('Parsing "%s" at url "%s"' % (outlet.name, outlet.rss_url))
 
-    feed = RSSFeed(outlet.rss_url)
+    if feed is None:
+        feed = fetch_outlet(outlet)
+
+    try:
+        return _store_feed(outlet, feed, force)
+    finally:
+        metrics.fetch_seconds.observe(feed.fetch_seconds, outlet_id=outlet.id)
+        if feed.is_modified():
+            metrics.parse_seconds.observe(feed.parse_seconds, outlet_id=outlet.id)
+
+
+def _store_feed(outlet, feed, force):
+    if not feed.is_modified():
+        logger.info('Feed was not modified since last check.')
+        metrics.not_modified_total.inc(outlet_id=outlet.id)
+        return 0
+
+    validators = feed.get_validators()
+    validators_changed = (validators['etag'], validators['modified']) != (outlet.etag, outlet.last_modified)
+    outlet.etag = validators['etag']
+    outlet.last_modified = validators['modified']
+
     updated = feed.get_channel_info()['updated']
 
     # Some feeds do not provide last updated time
     if updated is None:
         updated = timezone.now()
 
-    if outlet.updated is None or updated > outlet.updated:
+    channel_updated = outlet.updated is None or updated > outlet.updated
+    if channel_updated or force:
         logger.info('Feed was updated at %s, fetching new items' % updated.isoformat())
-        entries = feed.get_entries_info()
+        since = None
+        if settings.RSS_STREAMING_PARSER and not force:
+            # Entries older than the newest stored article are not read at all
+            since = outlet.article_set.aggregate(latest=Max('pub_date'))['latest']
+        # Stored a batch at a time, so only a batch of entries is held however long the feed
+        provided = stored = 0
+        store_seconds = 0
+        entries = feed.iter_entries_info(since)
+        while True:
+            batch = list(islice(entries, settings.RSS_STORE_BATCH_SIZE))
+            if not batch:
+                break
+            provided += len(batch)
+            started = time.time()
+            stored += store_entries(outlet, batch)
+            store_seconds += time.time() - started
 
-        logger.info('Feed provided %s items.' % len(entries))
+        logger.info('Feed provided %s items.' % provided)
+        logger.info('Stored %s new or changed items.' % stored)
 
-        for entry_info in entries:
-            try:
+        # A forced check of an older copy of the feed must not move the outlet back in time
+        if channel_updated:
+            outlet.updated = updated
+        started = time.time()
+        # Only what the check changed, the lease and schedule may have moved on while the feed was fetched
+        outlet.save(update_fields=['etag', 'last_modified', 'updated', 'articles_changed'])
+        metrics.store_seconds.observe(store_seconds + time.time() - started, outlet_id=outlet.id)
+        return stored
 
-                article = Article(**entry_info['entry_info'])
+    logger.info('Feed has not been updated since last check.')
+    if validators_changed:
+        outlet.save(update_fields=['etag', 'last_modified'])
+    return 0
 
-                authors = list(find_or_create_author(outlet, author) for author in entry_info['authors'])
 
-                tags = list(find_or_create_tag(tag) for tag in entry_info['tags'])
+def replay_archive(archive, outlet_ids=None, since=None, until=None, force=False):
+    """
+    Send archived feed bodies through RSSFeed and check_outlet, oldest first, without network access.
+    The outlets' HTTP validators are left untouched.
+    :param force: Store the entries of every body, even the ones older than the outlet's last update
+    :return: The number of bodies replayed and of articles stored
+    """
+    outlets = {}
+    replayed = stored = 0
+    for fetched_at, outlet_id, path in archive.entries(outlet_ids, since, until):
+        if outlet_id not in outlets:
+            outlets[outlet_id] = Outlet.objects.filter(pk=outlet_id).first()
+        outlet = outlets[outlet_id]
+        if outlet is None:
+            logger.warning('Skipping %s, outlet %s does not exist.' % (path, outlet_id))
+            continue
 
-                outlet.article_set.add(article)
-                article.authors.add(*authors)
-                article.tags.add(*tags)
-            except IntegrityError, e:
-                logger.warning('Failed to insert article, integrity error "%s"' % e)
-            except Exception, e:
-                logger.error('Failed parsing entry: %s\n%s' % (e, entry_info))
+        feed = RSSFeed(outlet.rss_url, etag=outlet.etag, modified=outlet.last_modified, document=archive.read(path))
+        stored += check_outlet(outlet, feed, force=force)
+        replayed += 1
 
-        outlet.updated = updated
-        outlet.save()
+    return replayed, stored
 
+
+def check_outlets(outlets, pool_size=None, raise_errors=True):
+    """
+    Check the given outlets. Feeds are downloaded and parsed by a pool of fetcher threads while the database writes
+    happen one outlet at a time on the calling thread, in the order the feeds finish downloading. With
+    settings.RSS_PARSE_PROCESSES the fetcher threads only download and the feeds are parsed by a pool of processes,
+    see rss.pipeline.
+    :param pool_size: Number of fetcher threads, defaults to settings.RSS_WORKER_POOL_SIZE
+    :param raise_errors: Raise the first failure instead of logging it and moving on to the next outlet
+    :return: Dict of outlet id to the number of articles stored, None for the outlets that failed
+    """
+    if pool_size is None:
+        pool_size = settings.RSS_WORKER_POOL_SIZE
+
+    results = {}
+    started = time.time()
+
+    def check(outlet, future=None):
+        try:
+            results[outlet.id] = check_outlet(outlet, future.result() if future else None)
+        except Exception, e:
+            metrics.failures_total.inc(outlet_id=outlet.id)
+            if raise_errors:
+                raise
+            logger.error('Failed to check "%s": %s' % (outlet.name, e))
+            results[outlet.id] = None
+
+    if settings.RSS_PARSE_PROCESSES and len(outlets) > 1:
+        for outlet, future in pipeline.fetch_and_parse(outlets, pool_size):
+            check(outlet, future)
+    elif pool_size > 1 and len(outlets) > 1:
+        with ThreadPoolExecutor(max_workers=pool_size) as executor:
+            pending = dict((executor.submit(fetch_outlet, outlet), outlet) for outlet in outlets)
+            for future in as_completed(pending):
+                check(pending[future], future)
     else:
-        logger.info('Feed has not been updated since last check.')
+        for outlet in outlets:
+            check(outlet)
 
+    metrics.pass_seconds.observe(time.time() - started)
+    return results
+
+
+def run(pool_size=None):
+    """
+    Check every outlet once
+    :param pool_size: Number of fetcher threads, defaults to settings.RSS_WORKER_POOL_SIZE
+    :return: The wall-clock duration of the pass in seconds
+    """
+    if pool_size is None:
+        pool_size = settings.RSS_WORKER_POOL_SIZE
 
-def run():
     logger.debug('Running at %s' % timezone.now().isoformat())
-    for outlet in Outlet.objects.all():
-        check_outlet(outlet)
+    started = time.time()
+
+    outlets = list(Outlet.objects.all())
+    check_outlets(outlets, pool_size)
+
+    elapsed = time.time() - started
+    logger.info('Checked %s outlets in %.2f seconds using %s fetchers.' % (len(outlets), elapsed, pool_size))
+    log_cache_stats()
     logger.debug('Finished running at %s' % timezone.now().isoformat())
+    return elapsed
+
+
+def log_cache_stats():
+    logger.info('Tag cache: %(hits)s hits, %(misses)s misses, %(evictions)s evictions, %(size)s/%(maxsize)s.'
+                % tag_cache.stats())
+    logger.info('Author cache: %(hits)s hits, %(misses)s misses, %(evictions)s evictions, %(size)s/%(maxsize)s.'
+                % author_cache.stats())
+
+
+def _timestamp(value):
+    return calendar.timegm(value.utctimetuple()) + value.microsecond / 1e6
+
+
+def next_check(outlet, stored, min_interval=None, max_interval=None):
+    """
+    :param stored: Number of articles stored by the check of the outlet, None if it failed
+    :param min_interval: Shortest interval, defaults to settings.RSS_MIN_POLL_INTERVAL
+    :param max_interval: Longest interval, defaults to settings.RSS_MAX_POLL_INTERVAL
+    :return: Tuple of the time of the outlet's next check and the interval it is based on, in seconds
+    """
+    pub_dates = []
+    if stored:
+        pub_dates = list(outlet.article_set.order_by('-pub_date')
+                         .values_list('pub_date', flat=True)[:CADENCE_HISTORY])
+    interval = next_interval(outlet.check_interval, pub_dates, bool(stored),
+                             min_interval or settings.RSS_MIN_POLL_INTERVAL,
+                             max_interval or settings.RSS_MAX_POLL_INTERVAL)
+    return timezone.now() + datetime.timedelta(seconds=interval), interval
+
+
+def check_new_outlet(outlet, feed, owner):
+    """
+    First check of an outlet added from the admin, storing the feed it was validated with instead of downloading it
+    again. The outlet is expected to be leased to owner, so workers leave it alone until the check is done.
+    :return: Number of articles stored, None if the check failed
+    """
+    try:
+        stored = check_outlet(outlet, feed)
+    except Exception, e:
+        metrics.failures_total.inc(outlet_id=outlet.id)
+        logger.error('Failed to check "%s": %s' % (outlet.name, e))
+        stored = None
+
+    when, interval = next_check(outlet, stored)
+    leasing.release(owner, outlet.id, when, interval)
+    return stored
 
 
 class Worker(threading.Thread):
-    def __init__(self, hours=0, minutes=0, seconds=0):
+    """
+    Checks each outlet on its own schedule. After every check the outlet's next check is set from how often it
+    publishes, within [min_interval, max_interval] seconds, and saved to Outlet.next_check. Setting next_check to an
+    earlier time in the database, as the admin "Check now" action does, is picked up on the next sync.
+    """
+
+    def __init__(self, min_interval=None, max_interval=None, pool_size=None, sync_interval=None):
         super(Worker, self).__init__()
-        if not (hours or minutes or seconds):
-            raise ValueError('Hours, minutes and seconds cannot be all equal to 0')
+        self.min_interval = min_interval or settings.RSS_MIN_POLL_INTERVAL
+        self.max_interval = max_interval or settings.RSS_MAX_POLL_INTERVAL
+        self.sync_interval = sync_interval or settings.RSS_SCHEDULER_SYNC_INTERVAL
+        self.pool_size = pool_size
+        if self.min_interval <= 0 or self.max_interval < self.min_interval:
+            raise ValueError('Poll intervals must be positive and min_interval cannot be greater than max_interval')
+
+        self.scheduler = OutletScheduler()
+        self.last_sync = None
+        self.stopped = threading.Event()
+
+    def sync(self, now=None):
+        """
+        Schedule new outlets, forget deleted ones and move up the outlets whose next_check was moved up in the database
+        """
+        if now is None:
+            now = time.time()
+
+        known = self.scheduler.outlet_ids()
+        for outlet_id, next_check in Outlet.objects.values_list('id', 'next_check'):
+            when = _timestamp(next_check) if next_check else now
+            scheduled_at = self.scheduler.scheduled_at(outlet_id)
+            if outlet_id not in known or (scheduled_at is not None and when < scheduled_at):
+                self.scheduler.schedule(outlet_id, when)
+            known.discard(outlet_id)
+
+        for outlet_id in known:
+            self.scheduler.remove(outlet_id)
+
+        self.last_sync = now
+
+    def tick(self, now=None):
+        """
+        Check every outlet that is due, waiting for all of them to finish
+        :return: The ids of the outlets checked
+        """
+        if now is None:
+            now = time.time()
 
-        self.scheduler = BlockingScheduler()
-        self.job = self.scheduler.add_job(run, 'interval', hours=hours, minutes=minutes, seconds=seconds)
+        if self.last_sync is None or now - self.last_sync >= self.sync_interval:
+            self.sync(now)
+
+        due = self.scheduler.pop_due(now)
+        metrics.scheduled_outlets.set(len(self.scheduler))
+        if not due:
+            return []
+
+        for outlet_id, when in due:
+            metrics.scheduler_lag_seconds.observe(max(0, now - when))
+
+        outlets = Outlet.objects.in_bulk([outlet_id for outlet_id, when in due])
+        results = check_outlets(outlets.values(), self.pool_size, raise_errors=False)
+
+        for outlet_id, when in due:
+            outlet = outlets.get(outlet_id)
+            if outlet is None:
+                self.scheduler.remove(outlet_id)
+                continue
+
+            next_check, interval = self.next_check(outlet, results.get(outlet_id))
+            # update() rather than save() so rescheduling does not expire cached API responses
+            Outlet.objects.filter(pk=outlet_id).update(next_check=next_check, check_interval=interval)
+            self.scheduler.done(outlet_id, _timestamp(next_check))
+            logger.info('Next check of "%s" in %s seconds.' % (outlet.name, interval))
+
+        return [outlet_id for outlet_id, when in due]
+
+    def next_check(self, outlet, stored):
+        return next_check(outlet, stored, self.min_interval, self.max_interval)
+
+    def recheck(self, outlet_id):
+        """
+        Check the outlet right away, or right after its current check
+        """
+        self.scheduler.recheck(outlet_id)
 
     def run(self):
-        self.scheduler.start()
+        while not self.stopped.is_set():
+            self.tick()
+
+            timeout = self.sync_interval - (time.time() - self.last_sync)
+            next_due = self.scheduler.next_due()
+            if next_due is not None:
+                timeout = min(timeout, next_due - time.time())
+            if timeout > 0:
+                self.scheduler.wait(timeout)
+
+    def stop(self, *args):
+        self.stopped.set()
+        self.scheduler.wake()
+
+
+class LeasedWorker(Worker):
+    """
+    Worker of a fleet sharing the outlets through the database: any number of them, on any number of hosts, can run
+    at once. Each tick claims a batch of due outlets with a lease (see rss.leasing), checks them and releases them with
+    their next check. Outlets whose lease expires, because their worker crashed, are claimed by another worker.
+
+    lease_seconds must be longer than checking a batch takes, or the outlets of a slow batch may be checked twice.
+    """
+
+    def __init__(self, min_interval=None, max_interval=None, pool_size=None, poll_interval=None, lease_seconds=None,
+                 batch_size=None, owner=None):
+        super(LeasedWorker, self).__init__(min_interval, max_interval, pool_size)
+        self.poll_interval = poll_interval or settings.RSS_LEASE_POLL_INTERVAL
+        self.lease_seconds = lease_seconds or settings.RSS_LEASE_SECONDS
+        self.batch_size = batch_size or settings.RSS_LEASE_BATCH_SIZE
+        self.owner = owner or leasing.worker_id()
+        self.wakeup = threading.Event()
+
+    def tick(self, now=None):
+        """
+        Claim and check a batch of due outlets, waiting for all of them to finish
+        :return: The ids of the outlets checked
+        """
+        if now is None:
+            now = timezone.now()
+
+        outlets = leasing.claim_due(self.owner, self.batch_size, self.lease_seconds, now)
+        if not outlets:
+            return []
+
+        for outlet in outlets:
+            if outlet.next_check is not None:
+                metrics.scheduler_lag_seconds.observe(max(0, (now - outlet.next_check).total_seconds()))
+
+        results = check_outlets(outlets, self.pool_size, raise_errors=False)
+
+        for outlet in outlets:
+            next_check, interval = self.next_check(outlet, results.get(outlet.id))
+            if leasing.release(self.owner, outlet.id, next_check, interval):
+                logger.info('Next check of "%s" in %s seconds.' % (outlet.name, interval))
+            else:
+                logger.warning('Lease on "%s" expired while it was checked, '
+                               'RSS_LEASE_SECONDS may be too short.' % outlet.name)
+
+        return [outlet.id for outlet in outlets]
+
+    def recheck(self, outlet_id):
+        """
+        Make the outlet due, it is claimed by the first worker to poll
+        """
+        Outlet.objects.filter(pk=outlet_id).update(next_check=timezone.now())
+        self.wakeup.set()
+
+    def run(self):
+        logger.info('Worker %s started.' % self.owner)
+        try:
+            while not self.stopped.is_set():
+                if self.tick():
+                    # More outlets may have come due while the batch was checked
+                    continue
+
+                now = timezone.now()
+                next_claimable = leasing.next_claimable(now)
+                timeout = self.poll_interval
+                if next_claimable is not None:
+                    timeout = min(timeout, (next_claimable - now).total_seconds())
+                if timeout > 0:
+                    self.wakeup.wait(timeout)
+                    self.wakeup.clear()
+        finally:
+            leasing.release_all(self.owner)
 
     def stop(self, *args):
-        self.scheduler.shutdown()
\ No newline at end of file
+        self.stopped.set()
+        self.wakeup.set()
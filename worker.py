@@ -6,8 +6,20 @@ import django
 
 django.setup()
 
-from rss.worker import Worker
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 
-worker = Worker(minutes=10)
+from rss import metrics
+from rss.caching import check_shared_cache
+from rss.worker import LeasedWorker, Worker
+
+errors = check_shared_cache()
+if errors:
+    raise ImproperlyConfigured('%s %s' % (errors[0].msg, errors[0].hint))
+
+if settings.RSS_METRICS_PORT:
+    metrics.start_server(settings.RSS_METRICS_PORT, settings.RSS_METRICS_ADDRESS)
+
+worker = LeasedWorker() if settings.RSS_WORKER_LEASES else Worker()
 worker.start()
 worker.join()